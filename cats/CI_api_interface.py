@@ -3,19 +3,38 @@ from collections import namedtuple
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
-from .forecast import CarbonIntensityPointEstimate
+import numpy as np
+
+from .forecast import CarbonIntensitySeries
 
 
 class InvalidLocationError(Exception):
     pass
 
 
+# APIs may optionally provide the forecasts of all regions in a single
+# request: get_bulk_request_url(timestamp) returns its URL, and
+# parse_bulk_response_data(response) a dict mapping region to forecast.
+# get_response_region(response) returns the region of a location from
+# the response to the request for this location.  Providers not using
+# HTTP give load_forecast(timestamp, location) returning the forecast
+# instead, see cats.local_forecast.
 APIInterface = namedtuple(
-    "APIInterface", ["get_request_url", "parse_response_data", "max_duration"]
+    "APIInterface",
+    [
+        "get_request_url",
+        "parse_response_data",
+        "max_duration",
+        "get_bulk_request_url",
+        "parse_bulk_response_data",
+        "get_response_region",
+        "load_forecast",
+    ],
+    defaults=[None, None, None, None],
 )
 
 
-def ciuk_request_url(timestamp: datetime, postcode: str):
+def ciuk_period(timestamp: datetime) -> str:
     # This transformation is specific to the CI-UK API.
     # get the time (as a datetime object) and update this to be the 'top' of
     # the current hour or half hour in UTZ plus one minute. So a call at
@@ -27,7 +46,10 @@ def ciuk_request_url(timestamp: datetime, postcode: str):
         dt = timestamp.replace(minute=31, second=0, microsecond=0)
     else:
         dt = timestamp.replace(minute=1, second=0, microsecond=0)
+    return dt.strftime("%Y-%m-%dT%H:%MZ")
 
+
+def ciuk_request_url(timestamp: datetime, postcode: str):
     if len(postcode) > 4:
         sys.stderr.write(f"Warning: truncating postcode {postcode} to ")
         postcode = postcode[:-3].strip()
@@ -35,12 +57,58 @@ def ciuk_request_url(timestamp: datetime, postcode: str):
 
     return (
         "https://api.carbonintensity.org.uk/regional/intensity/"
-        + dt.strftime("%Y-%m-%dT%H:%MZ")
+        + ciuk_period(timestamp)
         + "/fw48h/postcode/"
         + postcode
     )
 
 
+def ciuk_bulk_request_url(timestamp: datetime):
+    return (
+        "https://api.carbonintensity.org.uk/regional/intensity/"
+        + ciuk_period(timestamp)
+        + "/fw48h"
+    )
+
+
+# Positions of separators in timestamps formatted as %Y-%m-%dT%H:%MZ,
+# all other characters are digits
+_TIMESTAMP_SEPARATORS = {4: "-", 7: "-", 10: "T", 13: ":", 16: "Z"}
+_TIMESTAMP_DIGITS = [i for i in range(17) if i not in _TIMESTAMP_SEPARATORS]
+
+
+def parse_utc_timestamps(timestamps: list[str]) -> np.ndarray:
+    """
+    Return the seconds since the epoch of UTC timestamps formatted as
+    %Y-%m-%dT%H:%MZ.
+
+    Timestamps are fixed width, so that their layout is checked for all
+    timestamps at once, before they are converted as an array of numpy
+    datetimes.  Timestamps not following this layout exactly are parsed
+    one by one with strptime, which reports invalid timestamps.
+    """
+    stamps = np.array(timestamps)
+    if len(stamps) and stamps.dtype == np.dtype("<U17"):
+        codes = stamps.view(np.uint32).reshape(len(stamps), 17)
+        digits = codes[:, _TIMESTAMP_DIGITS] - ord("0")
+        if (
+            all((codes[:, i] == ord(c)).all() for i, c in _TIMESTAMP_SEPARATORS.items())
+            and (digits < 10).all()  # unsigned, so also non-negative
+            and digits[:, :4].any(axis=1).all()  # year 0 is invalid
+        ):
+            # Range errors, such as month 13, are reported by numpy
+            minutes = stamps.astype("<U16").astype("datetime64[m]")
+            return minutes.astype(np.int64) * 60
+
+    utc = ZoneInfo("UTC")
+    return np.array(
+        [
+            datetime.strptime(t, "%Y-%m-%dT%H:%MZ").replace(tzinfo=utc).timestamp()
+            for t in timestamps
+        ]
+    )
+
+
 def ciuk_parse_response_data(response: dict):
     """
     This wraps the API from carbonintensity.org.uk
@@ -67,18 +135,41 @@ def ciuk_parse_response_data(response: dict):
     if (not response) or invalid_code(response):
         raise InvalidLocationError
 
-    datefmt = "%Y-%m-%dT%H:%MZ"
-    # The "Z" at the end of the format string indicates UTC,
-    # however, strptime does not know how to parse this, so we
-    # need to add tzinfo data.
+    # Timestamps are in UTC, as indicated by the "Z" at the end of
+    # the %Y-%m-%dT%H:%MZ format.
+    data = response["data"]["data"]
+    return CarbonIntensitySeries(
+        times=parse_utc_timestamps([d["from"] for d in data]),
+        values=[d["intensity"]["forecast"] for d in data],
+        tzinfo=ZoneInfo("UTC"),
+    )
+
+
+def ciuk_parse_bulk_response_data(response: dict) -> dict[int, CarbonIntensitySeries]:
+    """
+    Return the forecast of each region from the response of the
+    carbonintensity.org.uk API for all regions, keyed by region id.
+    Regions missing from any forecast period are left out.
+    """
+    data = response["data"]
+    times = parse_utc_timestamps([d["from"] for d in data])
+    values: dict[int, np.ndarray] = {}
+    for n, d in enumerate(data):
+        for region in d["regions"]:
+            regionid = region["regionid"]
+            if regionid not in values:
+                values[regionid] = np.full(len(data), np.nan)
+            values[regionid][n] = region["intensity"]["forecast"]
     utc = ZoneInfo("UTC")
-    return [
-        CarbonIntensityPointEstimate(
-            datetime=datetime.strptime(d["from"], datefmt).replace(tzinfo=utc),
-            value=d["intensity"]["forecast"],
-        )
-        for d in response["data"]["data"]
-    ]
+    return {
+        regionid: CarbonIntensitySeries(times, v, tzinfo=utc)
+        for regionid, v in values.items()
+        if not np.isnan(v).any()
+    }
+
+
+def ciuk_response_region(response: dict) -> int:
+    return response["data"]["regionid"]
 
 
 API_interfaces = {
@@ -91,5 +182,8 @@ API_interfaces = {
         # (47.5h). Keeping max duration to 47.5 hours is not suitable, as the
         # code will try to interpolate past the last time frame available.
         max_duration=2820,
+        get_bulk_request_url=ciuk_bulk_request_url,
+        parse_bulk_response_data=ciuk_parse_bulk_response_data,
+        get_response_region=ciuk_response_region,
     ),
 }
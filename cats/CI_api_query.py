@@ -1,35 +1,330 @@
+import logging
+import subprocess
+import sys
+import threading
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional
 
-import requests_cache
+import numpy as np
 
-from .forecast import CarbonIntensityPointEstimate
+from .CI_api_interface import API_interfaces
+from .forecast import CarbonIntensitySeries, epoch_seconds
+from .forecast_cache import ForecastCache
+from .region_index import RegionIndex
+from .resilience import CircuitBreaker, get_with_retries
 from .version import user_agent
 
+if TYPE_CHECKING:
+    import requests_cache
+
+# Default timeout for API requests, in seconds: (connect, read)
+REQUEST_TIMEOUT = (5, 30)
+# Minimum number of seconds between refreshes of the same stale
+# forecast, started by any process of the user
+REFRESH_INTERVAL = 60
+# Number of connections kept alive to the API host, and maximum
+# number of concurrent requests made by get_CI_forecasts()
+MAX_CONNECTIONS = 8
+
+_session: Optional["requests_cache.CachedSession"] = None
+_session_lock = threading.Lock()
+
+# Parsed forecasts shared between processes, keyed by request URL
+forecast_cache = ForecastCache()
+# Region of locations, for APIs providing forecasts for all regions at once
+region_index = RegionIndex()
+# Only one thread fetches the forecasts for all regions at a time
+_bulk_lock = threading.Lock()
+# Requests to an API failing repeatedly are stopped for all processes
+# of the user
+breaker = CircuitBreaker()
+
+
+def get_session() -> "requests_cache.CachedSession":
+    """
+    Return the HTTP session used for API calls, creating it on first use.
+
+    The session uses a global HTTP cache with the URL as the key (failed
+    attempts are not cached), and keeps connections alive so that it can
+    be shared between successive and concurrent API calls.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            # Imported here, as forecasts are often cached on disk
+            import requests_cache
+            from requests.adapters import HTTPAdapter
+
+            session = requests_cache.CachedSession("cats_cache", use_temp=True)
+            adapter = HTTPAdapter(
+                pool_connections=MAX_CONNECTIONS, pool_maxsize=MAX_CONNECTIONS
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
 def get_CI_forecast(
-    location: str, CI_API_interface
-) -> list[CarbonIntensityPointEstimate]:
+    location: str, CI_API_interface, timeout=REQUEST_TIMEOUT
+) -> CarbonIntensitySeries:
     """
     Get carbon intensity from an API
 
-    Given the location and an API interface, return a list of predictions of the
-    future carbon intensity.
+    Given the location and an API interface, return a timeseries of predictions
+    of the future carbon intensity.
 
     param location: [str] Depends on country. UK postcode (just the first section), e.g. M15.
-    returns: a list of CarbonIntensityPointEstimate
+    param timeout: [float or tuple] Request timeout in seconds, see requests.
+        Retries of failed requests are made within the same time, see
+        _deadline().
+    returns: a CarbonIntensitySeries
     """
 
-    # Setup a session for the API call. This uses a global HTTP cache
-    # with the URL as the key. Failed attempts are not cached.
-    session = requests_cache.CachedSession("cats_cache", use_temp=True)
+    now = datetime.now(timezone.utc)
+    if CI_API_interface.load_forecast is not None:
+        return CI_API_interface.load_forecast(now, location)
+    region = _get_region(location, CI_API_interface)
+    forecast = None
+    if region is not None:
+        forecast = _get_region_forecast(region, CI_API_interface, now, timeout)
+    if forecast is None:
+        forecast = _get_location_forecast(location, CI_API_interface, now, timeout)
+    return forecast
+
+
+def _deadline(timeout) -> Optional[float]:
+    # Time allowed for a request including its retries: the longest
+    # time an attempt can take, so that retries never make a request
+    # exceed its timeout
+    if isinstance(timeout, tuple):
+        return None if None in timeout else sum(timeout)
+    return timeout
+
+
+def _api_key(CI_API_interface) -> str:
+    # Identifies an API in cache keys, whatever the location and period
+    return CI_API_interface.get_request_url.__qualname__
+
+
+def _latest_key(location: str, CI_API_interface) -> str:
+    # Key of the most recent forecast for a location, whatever its period
+    region = _get_region(location, CI_API_interface)
+    if region is not None:
+        return _latest_region_key(region, CI_API_interface)
+    return f"latest:{_api_key(CI_API_interface)}:{location}"
+
+
+def _latest_region_key(region: int, CI_API_interface) -> str:
+    return f"latest:{_api_key(CI_API_interface)}#{region}"
+
+
+def _get_region(location: str, CI_API_interface) -> Optional[int]:
+    # Region of a location, if the API provides forecasts for all regions
+    if CI_API_interface.get_bulk_request_url is None:
+        return None
+    return region_index.get(_api_key(CI_API_interface), location)
+
+
+def _current_key(location: str, CI_API_interface, now: datetime) -> str:
+    # Key of the forecast for a location and the current period: the
+    # request URL identifies the forecast, and parsed forecasts are
+    # cached on disk under this key, after the HTTP cache.
+    region = _get_region(location, CI_API_interface)
+    if region is not None:
+        return f"{CI_API_interface.get_bulk_request_url(now)}#{region}"
+    return CI_API_interface.get_request_url(now, location)
+
+
+def _get_location_forecast(
+    location: str, CI_API_interface, now: datetime, timeout
+) -> CarbonIntensitySeries:
+    url = CI_API_interface.get_request_url(now, location)
+    forecast = forecast_cache.load(url)
+    if forecast is not None:
+        return forecast
 
     # get the carbon intensity api data
-    r = session.get(
-        CI_API_interface.get_request_url(datetime.now(timezone.utc), location),
-        headers = user_agent
+    r = get_with_retries(
+        get_session(),
+        url,
+        headers=user_agent,
+        timeout=timeout,
+        breaker=breaker,
+        deadline=_deadline(timeout),
     )
     data = r.json()
 
-    return CI_API_interface.parse_response_data(data)
+    forecast = CI_API_interface.parse_response_data(data)
+    forecast_cache.save(url, forecast)
+    forecast_cache.save(_latest_key(location, CI_API_interface), forecast)
+    if CI_API_interface.get_response_region is not None:
+        try:
+            region = CI_API_interface.get_response_region(data)
+        except (KeyError, TypeError):
+            pass
+        else:
+            region_index.set(_api_key(CI_API_interface), location, region)
+    return forecast
+
+
+def _get_region_forecast(
+    region: int, CI_API_interface, now: datetime, timeout
+) -> Optional[CarbonIntensitySeries]:
+    url = CI_API_interface.get_bulk_request_url(now)
+    with _bulk_lock:
+        forecast = forecast_cache.load(f"{url}#{region}")
+        if forecast is not None:
+            return forecast
+
+        r = get_with_retries(
+            get_session(),
+            url,
+            headers=user_agent,
+            timeout=timeout,
+            breaker=breaker,
+            deadline=_deadline(timeout),
+        )
+        forecasts = CI_API_interface.parse_bulk_response_data(r.json())
+        for regionid, series in forecasts.items():
+            forecast_cache.save(f"{url}#{regionid}", series)
+            forecast_cache.save(_latest_region_key(regionid, CI_API_interface), series)
+    return forecasts.get(region)
+
+
+def _refresh_CI_forecast(location: str, CI_API_interface, timeout):
+    try:
+        get_CI_forecast(location, CI_API_interface, timeout)
+    except Exception as e:
+        logging.info(f"Could not refresh carbon intensity forecast: {e}")
+
+
+def _refresh_command(location: str, CI_API_interface, timeout) -> Optional[list[str]]:
+    # cats prefetch command fetching the forecast of a location, if the
+    # API can be given by name
+    api = next((k for k, v in API_interfaces.items() if v is CI_API_interface), None)
+    if api is None:
+        return None
+    command = [
+        sys.executable,
+        "-c",
+        "import sys; from cats.prefetch import main; sys.exit(main())",
+        *["--once", "--api", api, "--sites", location],
+    ]
+    if isinstance(timeout, (int, float)):
+        command += ["--timeout", str(timeout)]
+    return command
+
+
+def _start_refresh(location: str, CI_API_interface, timeout):
+    # The refresh outlives the calling process, so that cats exits as
+    # soon as it has used the stale forecast, whatever the time taken
+    # by the API.  APIs not known by name are refreshed in a daemon
+    # thread instead, left unfinished if the process exits first, in
+    # which case forecasts are best kept warm with cats prefetch.
+    command = _refresh_command(location, CI_API_interface, timeout)
+    if command is not None:
+        try:
+            subprocess.Popen(
+                command,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+            return
+        except OSError as e:
+            logging.info(f"Could not start refreshing the forecast: {e}")
+    threading.Thread(
+        target=_refresh_CI_forecast,
+        args=(location, CI_API_interface, timeout),
+        name="cats-forecast-refresh",
+        daemon=True,
+    ).start()
+
+
+def get_CI_forecast_or_stale(
+    location: str, CI_API_interface, max_stale: float, timeout=REQUEST_TIMEOUT
+) -> tuple[CarbonIntensitySeries, bool]:
+    """
+    Get carbon intensity from an API, or a stale forecast from the cache
+
+    If the forecast for the current period is not cached, the most recent
+    cached forecast for the location is returned immediately, provided it
+    was fetched at most max_stale seconds ago, or the API failed repeatedly
+    (see cats.resilience), and still covers the future.
+    It is trimmed to start at the data point preceding the current time, and
+    the current forecast is fetched in the background for next calls, by a
+    cats prefetch process outliving this one (see _start_refresh), unless
+    another process started refreshing it less than REFRESH_INTERVAL
+    seconds ago.
+    Otherwise, the current forecast is fetched as with get_CI_forecast.
+
+    param max_stale: [float] Maximum age of a stale forecast, in seconds.
+    param timeout: [float or tuple] Request timeout in seconds, see requests.
+    returns: a CarbonIntensitySeries, and whether it is stale
+    """
+    if CI_API_interface.load_forecast is not None:
+        # Local forecasts are always available
+        return get_CI_forecast(location, CI_API_interface, timeout), False
+    now = datetime.now(timezone.utc)
+    current = _current_key(location, CI_API_interface, now)
+    forecast = forecast_cache.load(current)
+    if forecast is not None:
+        return forecast, False
+
+    # After repeated failures of the API, the stale forecast is used
+    # whatever its age rather than waiting for the API
+    unavailable = breaker.is_open(current)
+    key = _latest_key(location, CI_API_interface)
+    stale, age = forecast_cache.load(key), forecast_cache.age(key)
+    if stale is not None and age is not None and (age <= max_stale or unavailable):
+        first = max(
+            int(np.searchsorted(stale.times, epoch_seconds(now), "right")) - 1, 0
+        )
+        if len(stale) - first >= 2:
+            # Only one process refreshes the forecast at a time
+            expiry = max(REFRESH_INTERVAL, _deadline(timeout) or 0)
+            if not unavailable and forecast_cache.claim(current, expiry):
+                _start_refresh(location, CI_API_interface, timeout)
+            return stale[first:], True
+
+    return get_CI_forecast(location, CI_API_interface, timeout), False
+
+
+def get_CI_forecasts(
+    locations: Iterable[str],
+    CI_API_interface,
+    timeout=REQUEST_TIMEOUT,
+    max_workers: int = MAX_CONNECTIONS,
+) -> dict[str, CarbonIntensitySeries]:
+    """
+    Get carbon intensity forecasts for several locations concurrently
+
+    Requests are made from a pool of threads sharing the same HTTP
+    session, see get_session().
+
+    param locations: [iterable of str] Locations, as for get_CI_forecast.
+    param timeout: [float or tuple] Timeout of each request in seconds, see requests.
+    param max_workers: [int] Maximum number of concurrent requests.
+    returns: a dict mapping each location to its CarbonIntensitySeries,
+        in the order of locations.
+    raises: the error raised by the request for the first failing
+        location, for instance InvalidLocationError or requests.Timeout.
+    """
+    locations = list(dict.fromkeys(locations))
+    if not locations:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(locations))) as pool:
+        futures = [
+            pool.submit(get_CI_forecast, location, CI_API_interface, timeout)
+            for location in locations
+        ]
+        return {
+            location: future.result() for location, future in zip(locations, futures)
+        }
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -1,3 +1,13 @@
-
 from .version import version as __version__
 
+__all__ = ["Planner", "__version__"]
+
+
+def __getattr__(name):
+    # The planner imports numpy, so that it is only imported when used
+    # rather than by every run of the cats command, see cats.cli
+    if name == "Planner":
+        from .planner import Planner
+
+        return Planner
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
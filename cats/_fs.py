@@ -0,0 +1,78 @@
+"""Files shared between ``cats`` processes: the forecast cache, the
+region index, the circuit breaker state, the window cache and the last
+location, see :py:func:`state_dir`.
+"""
+
+import functools
+import getpass
+import logging
+import os
+import stat
+import tempfile
+
+
+@functools.lru_cache(maxsize=None)
+def state_dir() -> str:
+    """Return the directory of the files shared between ``cats``
+    processes, created if needed.
+
+    The directory is private to the user, ``cats-<uid>`` in the
+    temporary directory with mode 0700, so that processes of the same
+    user share forecasts and the circuit breaker state, while other
+    users can neither read nor replace them.  If this directory is not
+    owned by the user, for instance created by another user first, a
+    new private directory is used by this process instead.
+    """
+    user = os.getuid() if hasattr(os, "getuid") else getpass.getuser()
+    path = os.path.join(tempfile.gettempdir(), f"cats-{user}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    except OSError as e:
+        logging.warning(f"Could not create directory {path}: {e}")
+        return path
+    if hasattr(os, "getuid"):
+        info = os.lstat(path)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+            logging.warning(f"Not using {path}, which is not a directory of yours")
+            return tempfile.mkdtemp(prefix="cats-")
+    return path
+
+
+def state_path(name: str) -> str:
+    """Return the path of the shared file or directory ``name``, in
+    :py:func:`state_dir`.
+    """
+    return os.path.join(state_dir(), name)
+
+
+def atomic_write_bytes(path: str, data: bytes):
+    """Write ``data`` to ``path`` atomically.
+
+    The data are written to a temporary file in the same directory,
+    which then replaces ``path``, so that concurrent processes never
+    read a partially written file.
+
+    :raises OSError: If the file cannot be written.
+    """
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_text(path: str, text: str):
+    """Write ``text`` to ``path`` atomically, see
+    :py:func:`atomic_write_bytes`.
+    """
+    atomic_write_bytes(path, text.encode())
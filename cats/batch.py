@@ -0,0 +1,236 @@
+"""This module implements the ``cats batch`` command, that plans many
+jobs at once, for instance for a workflow manager, rather than running
+``cats`` once per job.
+
+Jobs are read from standard input, one JSON object per line, such as::
+
+    {"id": "align-1", "duration": 90, "location": "OX1", "window": 720,
+     "start": "2024-01-15T09:00", "end": "2024-01-15T17:00",
+     "profile": "gpu"}
+
+where only ``duration``, in minutes, is required.  ``window``,
+``start`` and ``end`` are as the ``--window``, ``--start-window`` and
+``--end-window`` options of ``cats``, and ``profile`` selects the
+power curve of a profile of the configuration file.  Jobs without a
+location are planned at the location used by ``cats``.
+
+One JSON object is written per job to standard output, as soon as the
+job is planned, in the order of the input: the ``id`` of the job, or
+its line number if it has none, with the ``cats --format json`` output
+for the job, or an ``error`` message.
+
+The forecast of each location is fetched once per forecast period,
+on the first job at this location in the period, and each job is
+planned from the time it is read, so that jobs at the same location
+share the forecast and its cumulative integral, and jobs with the same
+parameters read in the same minute share their result.  Jobs are read and written one at a time, and forecasts and
+results are kept in bounded caches, so that memory use does not grow
+with the number of jobs.
+"""
+
+import json
+import logging
+import sys
+from argparse import ArgumentParser
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional, Union
+
+from .CI_api_interface import InvalidLocationError, ciuk_period
+from .cli import parse_time_constraint
+from .forecast import CarbonIntensitySeries
+from .planner import Planner
+from .schedulers import SCHEDULER_DATE_FORMAT
+
+__all__ = ["main", "plan_jobs"]
+
+# Number of forecasts and job results kept in memory
+MAX_FORECASTS = 256
+MAX_RESULTS = 1024
+
+_JOB_FIELDS = {"id", "duration", "location", "window", "start", "end", "profile"}
+
+
+class _LRU(OrderedDict):
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def get_or_compute(self, key, compute: Callable[[], Any]):
+        try:
+            self.move_to_end(key)
+            return self[key]
+        except KeyError:
+            pass
+        value = self[key] = compute()
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+        return value
+
+
+def _parse_job(line: str) -> dict:
+    try:
+        job = json.loads(line)
+    except ValueError as e:
+        raise ValueError(f"invalid JSON: {e}")
+    if not isinstance(job, dict):
+        raise ValueError("job should be a JSON object")
+    if unknown := set(job) - _JOB_FIELDS:
+        raise ValueError(f"unknown job fields {', '.join(sorted(unknown))}")
+    duration = job.get("duration")
+    if not isinstance(duration, int) or duration <= 0:
+        raise ValueError("job duration should be a positive number of minutes")
+    window = job.get("window", 2820)
+    if not isinstance(window, int):
+        raise ValueError("job window should be a number of minutes")
+    for key in ["location", "start", "end", "profile"]:
+        if job.get(key) is not None and not isinstance(job[key], str):
+            raise ValueError(f"job {key} should be a string")
+    return job
+
+
+def plan_jobs(
+    lines: Iterable[str],
+    planner: Planner,
+    dateformat: str = "",
+    now: Optional[datetime] = None,
+) -> Iterator[dict]:
+    """Plan the jobs given as JSON lines, and yield the result for each
+    job as soon as it is planned.
+
+    Each result has the ``id`` of the job, or its line number, and
+    either the output of ``cats --format json``, or an ``error``.
+
+    :param planner: Planner of the jobs, see :py:class:`Planner
+        <cats.planner.Planner>`.
+    :param now: Time the jobs are planned from, defaulting to the
+        time each job is read.
+    """
+    forecasts = _LRU(MAX_FORECASTS)
+    results = _LRU(MAX_RESULTS)
+
+    def forecast(location: str) -> Union[CarbonIntensitySeries, Exception]:
+        # Errors are kept, so that a forecast is only requested once
+        try:
+            return planner.forecast(location)
+        except (InvalidLocationError, OSError) as e:
+            return e
+
+    def plan(
+        job: dict, location: str, data: CarbonIntensitySeries, job_now: datetime
+    ) -> str:
+        output = planner.plan(
+            job["duration"],
+            location,
+            window=job.get("window", 2820),
+            start=job.get("start"),
+            end=job.get("end"),
+            profile=job.get("profile"),
+            now=job_now,
+            forecast=data,
+        )
+        return output.to_json(dateformat, sort_keys=True)
+
+    for n, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        job_id: Any = n
+        try:
+            job = _parse_job(line)
+            job_id = job.get("id", n)
+            location = job.get("location") or planner.location
+            job_now = now or datetime.now().astimezone()
+            # Forecasts are fetched again in each forecast period
+            period = ciuk_period(job_now.astimezone(timezone.utc))
+            data = forecasts.get_or_compute(
+                (location, period), lambda: forecast(location)
+            )
+            if isinstance(data, InvalidLocationError):
+                raise ValueError(f"unknown location {location}")
+            if isinstance(data, Exception):
+                raise ValueError(f"could not get the forecast for {location}: {data}")
+            minute = int(job_now.timestamp() // 60)
+            key = json.dumps(
+                [minute, location, *(job.get(k) for k in sorted(_JOB_FIELDS - {"id"}))]
+            )
+            output = results.get_or_compute(
+                key, lambda: plan(job, location, data, job_now)
+            )
+        except Exception as e:
+            # A failed job is reported on its line, and does not stop the batch
+            yield {"id": job_id, "error": str(e) or type(e).__name__}
+        else:
+            yield {"id": job_id, **json.loads(output)}
+
+
+def parse_arguments() -> ArgumentParser:
+    parser = ArgumentParser(
+        prog="cats batch",
+        description="Plan jobs read from standard input, one JSON object per line "
+        "with the job duration in minutes and optionally its id, location, window, "
+        "start and end constraints and profile, and write the plan of each job to "
+        "standard output as one JSON object per line.",
+    )
+    parser.add_argument(
+        "-a",
+        "--api",
+        type=str,
+        help="API to use to obtain carbon intensity forecasts. Overrides `config.yml`.",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        help="Path to a configuration file. Default: as for cats.",
+    )
+    parser.add_argument(
+        "-l",
+        "--location",
+        type=str,
+        help="Location of jobs without one. Overrides `config.yml`. "
+        "Default: as for cats.",
+    )
+    parser.add_argument(
+        "--dateformat",
+        help="Output date format in strftime(3) format or one of the supported "
+        "schedulers ('at').",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="Timeout of requests to the carbon intensity forecast API, in seconds.",
+    )
+    parser.add_argument(
+        "--replay-from",
+        type=parse_time_constraint,
+        help="Replay local forecasts (`--api file:PATH`) as if requested at this time, "
+        "as for cats.",
+    )
+    return parser
+
+
+def main(arguments=None) -> int:
+    args = parse_arguments().parse_args(arguments)
+    try:
+        planner = Planner(
+            api=args.api,
+            config=args.config,
+            location=args.location,
+            timeout=args.timeout,
+            replay_from=args.replay_from,
+        )
+    except ValueError as e:
+        logging.error(f"Error: {e}")
+        return 1
+    if isinstance(args.dateformat, str) and "%" not in args.dateformat:
+        dateformat = SCHEDULER_DATE_FORMAT.get(args.dateformat, "")
+    else:
+        dateformat = args.dateformat or ""
+
+    status = 0
+    for result in plan_jobs(sys.stdin, planner, dateformat):
+        if "error" in result:
+            logging.error(f"Could not plan job {result['id']}: {result['error']}")
+            status = 1
+        print(json.dumps(result), flush=True)
+    return status
@@ -0,0 +1,144 @@
+"""This module exports a function :py:func:`plan_batch
+<cats.capacity.plan_batch>` that plans the start times of a batch of
+jobs sharing a cluster, so that jobs are spread over low carbon
+intensity periods of a forecast rather than all started at the single
+optimal time.
+
+Candidate start times are those of :py:class:`WindowedForecast
+<cats.forecast.WindowedForecast>`: the job start time shifted by the
+time elapsed between forecast data points.  The time between
+successive candidate start times is a slot, and the number of nodes
+used by jobs running during any slot may not exceed the cluster
+capacity.
+
+Jobs are assigned greedily, largest jobs (nodes times duration) first,
+each to the feasible start time with the lowest average carbon
+intensity.  As capacity left to later jobs only decreases, no single
+job can then be moved to a start time with lower intensity.
+"""
+
+import csv
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Union
+
+import numpy as np
+
+from .forecast import (
+    CarbonIntensityAverageEstimate,
+    CarbonIntensityPointEstimate,
+    CarbonIntensitySeries,
+    WindowedForecast,
+    as_series,
+    epoch_seconds,
+)
+
+__all__ = ["BatchJob", "plan_batch", "read_batch_jobs"]
+
+
+@dataclass
+class BatchJob:
+    """A job of a batch, using ``nodes`` nodes for ``duration``
+    minutes.
+    """
+
+    duration: int  # in minutes
+    nodes: int = 1
+
+
+def read_batch_jobs(path: str) -> list[BatchJob]:
+    """Read jobs from a CSV file, with one ``duration,nodes`` row per
+    job, duration in minutes.  The node count defaults to 1 if
+    omitted.
+
+    :raises ValueError: If a row is not a valid job.
+    """
+    jobs = []
+    with open(path, "r", newline="") as f:
+        for row in csv.reader(f):
+            if not row:
+                continue
+            try:
+                job = BatchJob(*(int(x) for x in row))
+            except (TypeError, ValueError):
+                raise ValueError(
+                    f"Invalid job {','.join(row)}, expected duration,nodes"
+                )
+            if job.duration <= 0 or job.nodes <= 0:
+                raise ValueError(
+                    f"Invalid job {','.join(row)}, expected positive values"
+                )
+            jobs.append(job)
+    return jobs
+
+
+def plan_batch(
+    data: Union[CarbonIntensitySeries, list[CarbonIntensityPointEstimate]],
+    jobs: list[BatchJob],
+    start: datetime,
+    capacity: int,
+    max_window_minutes: Optional[int] = None,
+    end_constraint: Optional[datetime] = None,
+) -> list[Optional[CarbonIntensityAverageEstimate]]:
+    """Return the planned window of each job, in the order of
+    ``jobs``, aiming to minimise the total emissions of the batch,
+    that is the sum of the average intensity of each window weighted
+    by job nodes and duration.  Jobs that cannot fit in the capacity
+    left by larger jobs are not planned, and their window is None.
+
+    :param capacity: Number of nodes available during each slot.
+    :raises ValueError: If the forecast does not cover a job duration,
+        or a parameter is invalid.
+    """
+    if capacity <= 0 or any(job.nodes <= 0 for job in jobs):
+        raise ValueError("Capacity and job node counts must be positive")
+    data = as_series(data)
+
+    # Slot boundaries, in seconds since the job start time
+    first = max(int(np.searchsorted(data.times, epoch_seconds(start), "right")) - 1, 0)
+    slots = data.times[first:] - data.times[first]
+
+    # Candidate windows, average intensity and slots occupied by each
+    # window, for each job duration
+    windows = {}
+    for duration in sorted({job.duration for job in jobs}):
+        wf = WindowedForecast(
+            data,
+            duration,
+            start,
+            max_window_minutes=max_window_minutes,
+            end_constraint=end_constraint,
+        )
+        nwindows = len(wf)
+        if nwindows == 0:
+            raise ValueError(
+                f"No start time satisfies the constraints for {duration} minute jobs"
+            )
+        shifts = slots[:nwindows]
+        ends = np.searchsorted(slots, shifts + duration * 60, "left")
+        index = np.arange(len(slots))
+        occupied = (index >= np.arange(nwindows)[:, None]) & (index < ends[:, None])
+        windows[duration] = wf, wf._averages[:nwindows], occupied
+
+    free = np.full(len(slots), capacity, dtype=np.int64)
+    plan: list[Optional[int]] = [None] * len(jobs)
+
+    def best_start(job: BatchJob) -> Optional[int]:
+        _, averages, occupied = windows[job.duration]
+        feasible = np.where(occupied, free, capacity).min(axis=1) >= job.nodes
+        if not feasible.any():
+            return None
+        return int(np.argmin(np.where(feasible, averages, np.inf)))
+
+    # Largest jobs first, so that they get the lowest intensity
+    # windows, then in order of submission
+    order = sorted(range(len(jobs)), key=lambda j: -jobs[j].nodes * jobs[j].duration)
+    for j in order:
+        i = best_start(jobs[j])
+        if i is not None:
+            free[windows[jobs[j].duration][2][i]] -= jobs[j].nodes
+        plan[j] = i
+
+    return [
+        None if i is None else windows[job.duration][0][i] for job, i in zip(jobs, plan)
+    ]
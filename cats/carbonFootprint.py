@@ -1,8 +1,45 @@
 import datetime
 from collections import namedtuple
+from typing import Optional
 
 Estimates = namedtuple("Estimates", ["now", "best", "savings"])
 
+# Piecewise constant job power over time, as a list of (minutes since
+# job start, fraction of nominal power) pairs.  Each fraction holds
+# until the time of the next pair, the last one until the job end.
+PowerCurve = list[tuple[float, float]]
+
+
+def power_curve_steps(
+    power_curve: PowerCurve,
+    duration: float,  # in minutes
+) -> tuple[list[float], list[float]]:
+    """Return the step edges, in minutes since job start, and power
+    fraction of each step of a power curve, over the job duration.
+
+    :raises ValueError: If the power curve is zero over the job duration.
+    """
+    edges = [min(minutes, duration) for minutes, _ in power_curve] + [duration]
+    fractions = [fraction for _, fraction in power_curve]
+    if not any(f * (b - a) for f, a, b in zip(fractions, edges[:-1], edges[1:])):
+        raise ValueError("Power curve is zero over the job duration")
+    return edges, fractions
+
+
+def mean_power_fraction(
+    power_curve: Optional[PowerCurve],
+    duration: float,  # in minutes
+) -> float:
+    """Return the average fraction of nominal power used over the job
+    duration, 1 if there is no power curve.
+    """
+    if not power_curve:
+        return 1.0
+    edges, fractions = power_curve_steps(power_curve, duration)
+    return (
+        sum(f * (b - a) for f, a, b in zip(fractions, edges[:-1], edges[1:])) / duration
+    )
+
 
 def get_footprint_reduction_estimate(
     PUE: float,
@@ -10,12 +47,14 @@ def get_footprint_reduction_estimate(
     runtime: datetime.timedelta,
     average_best_ci: float,  # in gCO2/kWh
     average_now_ci: float,
+    power_fraction: float = 1.0,  # average fraction of nominal power used
 ) -> Estimates:
     # energy in kWh
     energy = (
         PUE
         * (runtime.total_seconds() / 3600)
         * sum([(nunits * power) for nunits, power in jobinfo])
+        * power_fraction
         / 1000
     )
     best = energy * average_best_ci
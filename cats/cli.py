@@ -1,22 +1,140 @@
 import datetime
 import logging
+import os
+import sys
+import threading
+import time
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
-from datetime import timedelta
+from importlib import import_module
 from pathlib import Path
 
 from typing import Optional
 
-from .configure import *
 from .constants import CATS_ASCII_BANNER_COLOUR, CATS_ASCII_BANNER_NO_COLOUR
-from .carbonFootprint import get_footprint_reduction_estimate
-from .CI_api_interface import InvalidLocationError
-from .CI_api_query import get_CI_forecast  # noqa: F401
-from .plotting import plotplan
-from .forecast import WindowedForecast
-from .output import CATSOutput
-from .schedulers import schedule_at, schedule_sbatch, SCHEDULER_DATE_FORMAT
 from .version import version
 
+# The cats command runs in every job submission, so that its startup time
+# matters: importing this module only imports the standard library, and
+# dependencies (numpy, requests, yaml, matplotlib) are imported by main()
+# once arguments are parsed, on the code path that needs them.
+
+
+def _lazy(module: str, name: str):
+    # Function imported from module when called
+    def function(*args, **kwargs):
+        return getattr(import_module(module, __package__), name)(*args, **kwargs)
+
+    function.__name__ = function.__qualname__ = name
+    return function
+
+
+get_runtime_config = _lazy(".configure", "get_runtime_config")
+get_sites = _lazy(".configure", "get_sites")
+get_last_location = _lazy(".configure", "get_last_location")
+save_last_location = _lazy(".configure", "save_last_location")
+get_CI_forecast = _lazy(".CI_api_query", "get_CI_forecast")
+get_CI_forecast_or_stale = _lazy(".CI_api_query", "get_CI_forecast_or_stale")
+get_CI_forecasts = _lazy(".CI_api_query", "get_CI_forecasts")
+
+
+def fetch_forecast(args, location: str, CI_API_interface, timeout):
+    """Return the forecast of each site, or the forecast for location
+    and whether it is stale, as requested by command line arguments.
+    """
+    if args.sites:
+        return get_CI_forecasts(args.sites, CI_API_interface, timeout), None
+    if args.max_stale is not None:
+        return get_CI_forecast_or_stale(
+            location, CI_API_interface, args.max_stale * 60, timeout
+        )
+    return get_CI_forecast(location, CI_API_interface, timeout), None
+
+
+class ForecastSpeculation:
+    """Forecast fetched in a background thread while cats reads its
+    configuration, and possibly looks up its location from the IP
+    address, for the API and location guessed from the command line
+    arguments or the previous run.  The forecast is used if the guess
+    is right, and discarded otherwise.
+    """
+
+    def __init__(self, args, CI_API_interface, location: str, timeout):
+        self.CI_API_interface = CI_API_interface
+        self.location = location
+        self.elapsed = 0.0  # fetch time in seconds, once fetched
+        self._result = self._error = None
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(args, timeout),
+            name="cats-forecast-speculation",
+            daemon=True,  # not waited for if discarded
+        )
+        self._thread.start()
+
+    @classmethod
+    def start(cls, args, timeout) -> Optional["ForecastSpeculation"]:
+        """Start fetching the forecast if the API and location can be
+        guessed, and return the speculation, or None.
+        """
+        from .CI_api_interface import API_interfaces
+
+        # Local forecasts need no network request
+        CI_API_interface = API_interfaces.get(args.api or "carbonintensity.org.uk")
+        if args.sites:
+            location = args.sites[0]
+        else:
+            location = args.location or get_last_location()
+        if CI_API_interface is None or location is None:
+            return None
+        return cls(args, CI_API_interface, location, timeout)
+
+    def _run(self, args, timeout):
+        start = time.perf_counter()
+        try:
+            self._result = fetch_forecast(
+                args, self.location, self.CI_API_interface, timeout
+            )
+        except Exception as e:
+            self._error = e
+        finally:
+            self.elapsed = time.perf_counter() - start
+
+    def matches(self, CI_API_interface, location: str) -> bool:
+        return CI_API_interface is self.CI_API_interface and location == self.location
+
+    def result(self):
+        """Wait for the forecast, and return it as fetch_forecast()."""
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+def report_timings(
+    configuration: float,
+    forecast: float,
+    critical_path: float,
+    discarded: Optional[ForecastSpeculation] = None,
+):
+    """Print the time spent reading the configuration and fetching the
+    forecast, and the time saved by running them concurrently, as the
+    sum of both minus the critical path, all in seconds.
+    """
+    saved = max(configuration + forecast - critical_path, 0)
+    print(
+        f"cats: configuration {configuration * 1000:.0f} ms, forecast "
+        f"{forecast * 1000:.0f} ms, critical path {critical_path * 1000:.0f} ms, "
+        f"saved {saved * 1000:.0f} ms",
+        file=sys.stderr,
+    )
+    if discarded is not None:
+        print(
+            f"cats: discarded the forecast fetched for {discarded.location} "
+            "while reading the configuration",
+            file=sys.stderr,
+        )
+
+
 def indent_lines(lines, spaces):
     return "\n".join(" " * spaces + line for line in lines.split("\n"))
 
@@ -91,6 +209,28 @@ def validate_window_constraints(
     return start_window, end_window, window_minutes
 
 
+def earliest_start(
+    now: datetime.datetime, start_constraint: Optional[datetime.datetime]
+) -> datetime.datetime:
+    """Return the earliest job start time, from now and the start
+    window constraint if any.
+    """
+    if start_constraint is None:
+        return now
+    return max(now, start_constraint.astimezone(now.tzinfo))
+
+
+class _ArgumentParser(ArgumentParser):
+    # The epilog is given as a function, only called when formatting help
+    @property
+    def epilog(self):
+        return self._epilog() if callable(self._epilog) else self._epilog
+
+    @epilog.setter
+    def epilog(self, value):
+        self._epilog = value
+
+
 def parse_arguments():
     """
     Parse command line arguments
@@ -121,12 +261,24 @@ def parse_arguments():
 
     Example:
        cats -d 1 --loc RG1 --scheduler=at --command='ls'
+
+    Forecasts can be fetched ahead of time, just after each half hour, by
+    running `cats prefetch` (see `cats prefetch --help`). Queries can be
+    answered by a long running `cats serve` process (see `cats serve --help`),
+    and many jobs planned at once with `cats batch` (see `cats batch --help`).
+
+    Best start times are cached for the current forecast, so that queries
+    repeated within the same minute are not computed again: they report the
+    start times of the first query shifted to the current time, with the
+    carbon intensities of the first query, for jobs starting up to a minute
+    earlier.
     """
 
-    config_text = indent_lines(
-        Path(__file__).with_name("config.yml").read_text(), spaces=8
-    )
-    example_text = f"""
+    def example_text():
+        config_text = indent_lines(
+            Path(__file__).with_name("config.yml").read_text(), spaces=8
+        )
+        return f"""
     Examples
 
     CATS can be used to report information on the best time to run a calculation
@@ -152,7 +304,7 @@ def parse_arguments():
 {config_text}
     """
 
-    parser = ArgumentParser(
+    parser = _ArgumentParser(
         prog="cats",
         description=description_text,
         epilog=example_text,
@@ -164,6 +316,16 @@ def parse_arguments():
         assert n >= 0
         return n
 
+    def duration_list(string):
+        durations = [int(d) for d in string.split(",")]
+        assert all(d > 0 for d in durations)
+        return durations
+
+    def location_list(string):
+        locations = [loc.strip() for loc in string.split(",")]
+        assert all(locations)
+        return locations
+
     ### Required
 
     parser.add_argument(
@@ -188,8 +350,9 @@ def parse_arguments():
         "--api",
         type=str,
         help="API to use to obtain carbon intensity forecasts. Overrides `config.yml`. "
-        "For now, only choice is `carbonintensity.org.uk` (hence UK only forecasts). "
-        "Default: `carbonintensity.org.uk`.",
+        "For now, only choice is `carbonintensity.org.uk` (hence UK only forecasts), "
+        "or `file:PATH` to read forecasts from a local CSV, JSON or NDJSON file, or "
+        "a directory of forecast snapshots. Default: `carbonintensity.org.uk`.",
     )
     parser.add_argument(
         "-c", "--command", help="Command to schedule, requires --scheduler to be set"
@@ -206,6 +369,28 @@ def parse_arguments():
         "for other APIs, see documentation for exact format. Overrides `config.yml`. "
         "Default: if absent, location based in IP address is used.",
     )
+    parser.add_argument(
+        "--sites",
+        type=location_list,
+        help="Comma-separated list of candidate locations (e.g. `OX1,M15,EH8`) of "
+        "computing facilities. The job is placed at the location and start time "
+        "with the lowest emissions, using the PUE and profile of each location from "
+        "the `sites` entry of the configuration file. Overrides `--location`.",
+    )
+    parser.add_argument(
+        "--max-stale",
+        type=positive_integer,
+        help="If the current forecast is not cached, use the most recent cached "
+        "forecast fetched up to this number of minutes ago, and fetch the current "
+        "forecast in the background. The JSON output then reports whether the "
+        "forecast was stale in `forecastStale`.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="Timeout of requests to the carbon intensity forecast API, in seconds, "
+        "including retries. Default: 5 seconds to connect and 30 seconds to read the response.",
+    )
     parser.add_argument(
         "--config",
         type=str,
@@ -284,13 +469,114 @@ def parse_arguments():
         "If only time is provided (e.g., '17:00'), today's date is assumed. "
         "Timezone info is optional and defaults to system timezone.",
     )
+    parser.add_argument(
+        "--exact-start",
+        nargs="?",
+        const="minute",
+        choices=["minute", "second"],
+        help="Search for the optimal job start time at any time, to the minute "
+        "(default) or second, rather than only at forecast time steps from now.",
+    )
+    parser.add_argument(
+        "--top",
+        type=positive_integer,
+        help="Report the given number of best job start times, ranked by carbon "
+        "intensity, in addition to the optimal start time.",
+    )
+    parser.add_argument(
+        "--min-gap",
+        type=positive_integer,
+        help="Minimum time between job start times reported with `--top`, in minutes. "
+        "Default: 0, start times may be as close as the forecast time step.",
+    )
+    parser.add_argument(
+        "--durations",
+        type=duration_list,
+        help="Comma-separated list of other job durations, in minutes (e.g. `60,90,120`). "
+        "Also report the best job start time for each of these durations, "
+        "computed from the same forecast.",
+    )
+    parser.add_argument(
+        "--max-segments",
+        type=positive_integer,
+        help="Plan an interruptible job, for instance one that checkpoints, as up to "
+        "this number of segments run at the lowest carbon intensity times. "
+        "With `--scheduler sbatch`, each segment is submitted as a job depending "
+        "on the previous segment.",
+    )
+    parser.add_argument(
+        "--min-segment",
+        type=positive_integer,
+        help="Minimum duration of each segment of an interruptible job, in minutes. "
+        "Default: 30 minutes.",
+        default=30,
+    )
+    parser.add_argument(
+        "--deadline",
+        type=parse_time_constraint,
+        help="Time by which all segments of an interruptible job must have finished, "
+        "in ISO format (e.g., '2024-01-15T17:00'). Default: end of the forecast.",
+    )
+    parser.add_argument(
+        "--jobs",
+        help="Plan a batch of jobs sharing the cluster, read from a CSV file with one "
+        "`duration,nodes` row per job (duration in minutes). Jobs are spread over low "
+        "carbon intensity times so that at most `--capacity` nodes are in use at once.",
+    )
+    parser.add_argument(
+        "--capacity",
+        type=positive_integer,
+        help="Number of nodes available to a batch of jobs planned with `--jobs`.",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Report the time spent reading the configuration and fetching the "
+        "forecast, which are run concurrently when possible, and the time saved, "
+        "on standard error.",
+    )
+    parser.add_argument(
+        "--replay-from",
+        type=parse_time_constraint,
+        help="Replay local forecasts (`--api file:PATH`) as if requested at this time, "
+        "in ISO format (e.g., '2024-01-15T09:00'), shifted so that this time is now. "
+        "Overrides `config.yml`.",
+    )
 
     return parser
 
 
 def main(arguments=None) -> int:
+    arguments = sys.argv[1:] if arguments is None else arguments
+    if arguments[:1] == ["prefetch"]:
+        from .prefetch import main as prefetch_main
+
+        return prefetch_main(arguments[1:])
+    if arguments[:1] == ["batch"]:
+        from .batch import main as batch_main
+
+        return batch_main(arguments[1:])
+    if arguments[:1] == ["serve"]:
+        from .serve import main as serve_main
+
+        return serve_main(arguments[1:])
+
     parser = parse_arguments()
     args = parser.parse_args(arguments)
+
+    # Send the query to a cats server if any, see cats.serve.  Commands
+    # are always scheduled from here, in the environment of the caller.
+    if os.environ.get("CATS_SOCKET") and not (args.command or args.plot):
+        from .serve import query
+
+        try:
+            status, stdout, stderr = query(arguments)
+        except OSError:
+            pass  # no server running, answer the query here
+        else:
+            sys.stdout.write(stdout)
+            sys.stderr.write(stderr)
+            return status
     colour_output = args.no_colour or args.no_color
 
     if args.command and not args.scheduler:
@@ -299,8 +585,45 @@ def main(arguments=None) -> int:
             "      specify the scheduler with the -s or --scheduler option"
         )
         return 1
+    if args.max_segments and args.command and args.scheduler != "sbatch":
+        print(
+            "cats: Interruptible jobs (--max-segments) can only be scheduled with sbatch"
+        )
+        return 1
+    if args.jobs and not args.capacity:
+        print("cats: Planning a batch of jobs (--jobs) requires --capacity to be set")
+        return 1
 
-    CI_API_interface, location, duration, jobinfo, PUE = get_runtime_config(args)
+    from .capacity import plan_batch, read_batch_jobs
+    from .CI_api_interface import InvalidLocationError
+    from .CI_api_query import REQUEST_TIMEOUT
+    from .interruptible import plan_segments
+    from .placement import rank_placements
+    from .planner import plan_job
+    from .schedulers import (
+        SCHEDULER_DATE_FORMAT,
+        schedule_at,
+        schedule_sbatch,
+        schedule_sbatch_segments,
+    )
+    from .window_cache import WindowCache, default_cache_path
+
+    # The forecast is fetched while the configuration is read, and the
+    # location looked up from the IP address, if the API and location
+    # can be guessed beforehand, see ForecastSpeculation
+    timeout = args.timeout or REQUEST_TIMEOUT
+    started = time.perf_counter()
+    speculation = ForecastSpeculation.start(args, timeout)
+    try:
+        CI_API_interface, location, duration, jobinfo, PUE, power_curve = (
+            get_runtime_config(args)
+        )
+    except (ValueError, OSError) as e:
+        logging.error(f"Error: {e}")
+        return 1
+    configured = time.perf_counter()
+    if not (args.location or args.sites):
+        save_last_location(location)
 
     # Validate and parse window constraints
     try:
@@ -328,15 +651,40 @@ This is usually due to forecast limitations."""
     ## Obtain CI forecast ##
     ########################
 
+    discarded = speculation
+    elapsed: float
     try:
-        CI_forecast = get_CI_forecast(location, CI_API_interface)
+        if speculation is not None and speculation.matches(CI_API_interface, location):
+            discarded = None
+            fetched, stale = speculation.result()
+            elapsed = speculation.elapsed
+        else:
+            fetched, stale = fetch_forecast(args, location, CI_API_interface, timeout)
+            elapsed = time.perf_counter() - configured
     except InvalidLocationError:
+        if args.sites:
+            location = "among " + ", ".join(args.sites)
         logging.error(f"Error: unknown location {location}\n")
         logging.error(
             "Location should be be specified as the outward code,\n"
             "for example 'SW7' for postcode 'SW7 EAZ'.\n"
         )
         return 1
+    except OSError as e:
+        # Connection errors and timeouts, see cats.resilience
+        logging.error(f"Error: could not get the carbon intensity forecast: {e}\n")
+        return 1
+    if args.sites:
+        forecasts = fetched
+    else:
+        CI_forecast = fetched
+    if args.timings:
+        report_timings(
+            configured - started,
+            elapsed,
+            time.perf_counter() - started,
+            discarded,
+        )
 
     #############################
     ## Find optimal start time ##
@@ -344,39 +692,88 @@ This is usually due to forecast limitations."""
 
     # Find best possible average carbon intensity, along
     # with corresponding job start time.
-    search_start = datetime.datetime.now().astimezone()
-
-    # Apply start window constraint if provided
-    if start_constraint:
-        # Ensure start constraint is in the same timezone as search_start
-        if start_constraint.tzinfo != search_start.tzinfo:
-            start_constraint = start_constraint.astimezone(search_start.tzinfo)
-        search_start = max(search_start, start_constraint)
-
-    wf = WindowedForecast(
-        CI_forecast,
-        duration,
-        start=search_start,
-        max_window_minutes=max_window,
-        end_constraint=end_constraint,
-    )
-    now_avg, best_avg = wf[0], min(wf)
-    output = CATSOutput(now_avg, best_avg, location, "GBR", colour=not colour_output)
-
-    ################################
-    ## Calculate carbon footprint ##
-    ################################
-
-    if args.footprint:
-        assert PUE is not None, "PUE not set by get_runtime_config!"
-        assert jobinfo is not None, "jobinfo not set by get_runtime_config!"
-        output.emmissionEstimate = get_footprint_reduction_estimate(
+    now = datetime.datetime.now().astimezone()
+    search_start = earliest_start(now, start_constraint)
+
+    # Choose the best location among candidates first, then plan the
+    # job at this location
+    placements = None
+    if args.sites:
+        try:
+            sites = get_sites(args, args.sites)
+            placements = rank_placements(
+                sites,
+                forecasts,
+                duration,
+                start=search_start,
+                max_window_minutes=max_window,
+                end_constraint=end_constraint,
+            )
+        except ValueError as e:
+            print(f"Error in placing job: {e}")
+            return 1
+        location = placements[0].location
+        site = next(site for site in sites if site.location == location)
+        CI_forecast = forecasts[location]
+        power_curve = site.power_curve
+        if PUE is not None:
+            # The footprint is estimated with the PUE and job power at
+            # the chosen site, as its placement emissions
+            PUE = site.PUE
+            if site.power is not None:
+                jobinfo = [(1, site.power)]
+
+    try:
+        output = plan_job(
+            CI_forecast,
+            duration,
+            location,
+            search_start,
+            max_window=max_window,
+            end_constraint=end_constraint,
+            power_curve=power_curve,
+            top=args.top,
+            min_gap=args.min_gap,
+            durations=args.durations,
+            exact_start=args.exact_start,
             PUE=PUE,
             jobinfo=jobinfo,
-            runtime=timedelta(minutes=args.duration),
-            average_best_ci=best_avg.value,
-            average_now_ci=now_avg.value,
+            window_cache=WindowCache(path=default_cache_path()),
         )
+    except ValueError as e:
+        # For instance a local forecast ending before the job, see --replay-from
+        print(f"Error in planning job: {e}")
+        return 1
+    output.colour = not colour_output
+    output.carbonIntensityPlacements = placements
+    output.forecastStale = stale
+    if args.max_segments:
+        try:
+            output.carbonIntensitySegments = plan_segments(
+                CI_forecast,
+                duration,
+                start=search_start,
+                min_segment=args.min_segment,
+                max_segments=args.max_segments,
+                deadline=args.deadline,
+            )
+        except ValueError as e:
+            print(f"Error in planning interruptible job: {e}")
+            return 1
+
+    if args.jobs:
+        try:
+            output.carbonIntensityBatch = plan_batch(
+                CI_forecast,
+                read_batch_jobs(args.jobs),
+                start=search_start,
+                capacity=args.capacity,
+                max_window_minutes=max_window,
+                end_constraint=end_constraint,
+            )
+        except (OSError, ValueError) as e:
+            print(f"Error in planning batch of jobs: {e}")
+            return 1
 
     if args.format == "json":
         if isinstance(args.dateformat, str) and "%" not in args.dateformat:
@@ -389,10 +786,16 @@ This is usually due to forecast limitations."""
         print_banner(colour_output)
         print(output)
     if args.plot:
+        from .plotting import plotplan
+
         plotplan(CI_forecast, output)
     if args.command:
         if args.scheduler == "at":
             err = schedule_at(output, args.command.split())
+        elif args.scheduler == "sbatch" and output.carbonIntensitySegments:
+            err = schedule_sbatch_segments(
+                output.carbonIntensitySegments, args.command.split()
+            )
         elif args.scheduler == "sbatch":
             err = schedule_sbatch(output, args.command.split())
         else:  # pragma: no cover - we already check for valid scheduler in parse_arguments
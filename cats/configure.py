@@ -10,39 +10,58 @@ runtime configuration consits of:
 
 """
 
+import copy
+import csv
 import logging
-import sys
 import os
 from collections.abc import Mapping
+from datetime import datetime, timezone
 from typing import Any, Optional
 
-import requests
-import requests_cache
-import yaml
-
+from ._fs import atomic_write_text, state_path
+from .carbonFootprint import PowerCurve
 from .CI_api_interface import API_interfaces, APIInterface
+from .CI_api_query import REQUEST_TIMEOUT
 from .constants import MEMORY_POWER_PER_GB
+from .local_forecast import local_api_interface
+from .placement import Site
+from .resilience import CircuitBreaker, get_with_retries
 from .version import user_agent
 
-__all__ = ["get_runtime_config"]
-# Patch requests to cache location API calls (and allow CI to still work)
-requests_cache.install_cache('cats_cache', use_temp=True)
+__all__ = ["get_runtime_config", "get_sites"]
+# Geolocation requests failing repeatedly are stopped for all processes
+# of the user
+breaker = CircuitBreaker()
+# Location of the previous run without a location on the command line,
+# see get_last_location()
+last_location_path = state_path("cats_location.txt")
 
 def get_runtime_config(
     args,
-) -> tuple[APIInterface, str, int, Optional[list[tuple[int, float]]], Optional[float]]:
+) -> tuple[
+    APIInterface,
+    str,
+    int,
+    Optional[list[tuple[int, float]]],
+    Optional[float],
+    Optional[PowerCurve],
+]:
     """Return the runtime cats configuration from list of command line
     arguments and content of configuration file.
 
     Returns a tuple containing an instance of :py:class:`APIInterface
     <cats.CI_api_interface.APIInterface>`, the location as a string,
-    the duration in minutes as an integer, as well as information on
-    the number of cpus/gpus used by the job and their power consumption.
+    the duration in minutes as an integer, information on
+    the number of cpus/gpus used by the job and their power consumption,
+    the PUE, and the power curve of the job profile if any.
 
     :param args: Command line arguments
     :return: Runtime cats configuration
-    :rtype: tuple[APIInterface, str, int, list[tuple[int, float]]]
-    :raises ValueError: If job duration cannot be interpreted as a positive integer.
+    :rtype: tuple[APIInterface, str, int, list[tuple[int, float]], float, PowerCurve]
+    :raises ValueError: If job duration cannot be interpreted as a
+        positive integer, or the configuration is invalid.
+    :raises OSError: If the location is looked up from the IP address
+        and the lookup fails.
 
     """
     configmapping = config_from_file(configpath=args.config)
@@ -53,39 +72,72 @@ def get_runtime_config(
     try:
         duration = int(args.duration)
     except ValueError:
-        logging.error(msg)
-        raise ValueError
+        raise ValueError(msg)
     if duration <= 0:
-        logging.error(msg)
-        raise ValueError
+        raise ValueError(msg)
+
+    jobinfo, PUE, power_curve = get_job_config(args, configmapping)
+    return CI_API_interface, location, duration, jobinfo, PUE, power_curve
+
+
+def get_job_config(
+    args, configmapping: Mapping[str, Any]
+) -> tuple[Optional[list[tuple[int, float]]], Optional[float], Optional[PowerCurve]]:
+    """Return the information on the devices used by the job and their
+    power consumption, the PUE, and the power curve of the job profile
+    selected by the ``profile``, ``footprint``, ``cpu``, ``gpu`` and
+    ``memory`` arguments, as in :py:func:`get_runtime_config`.
 
+    :raises ValueError: If the configuration or the profile is invalid.
+    """
     if args.footprint:
         for entry in ["profiles", "PUE"]:
             if entry not in configmapping.keys():
-                logging.error(f"Missing entry {entry} in configuration file")
-                sys.exit(1)
+                raise ValueError(f"Missing entry {entry} in configuration file")
         jobinfo = get_job_info(args, configmapping["profiles"])
         PUE = configmapping["PUE"]
     else:
         jobinfo = None
         PUE = None
 
-    return CI_API_interface, location, duration, jobinfo, PUE
+    # The power curve of the job profile is used to rank start times
+    # by total emissions, even without footprint estimates.
+    power_curve = None
+    if args.profile or args.footprint:
+        _, profile = select_profile(args, configmapping.get("profiles") or {})
+        if "power_curve" in profile:
+            power_curve = read_power_curve(profile["power_curve"])
+
+    return jobinfo, PUE, power_curve
+
+
+# Parsed configuration files, keyed by path and modification time, so
+# that long running processes (cats serve) parse each file once
+_parsed_yaml: dict[tuple[str, int], Any] = {}
+
+
+def _read_yaml(path: str):
+    with open(path, "r") as f:
+        key = (os.path.abspath(path), os.fstat(f.fileno()).st_mtime_ns)
+        if key not in _parsed_yaml:
+            # yaml is only imported when a configuration file is found
+            import yaml
+
+            _parsed_yaml[key] = yaml.safe_load(f)
+    return copy.deepcopy(_parsed_yaml[key])
 
 
 def config_from_file(configpath="") -> Mapping[str, Any]:
     if configpath:
         # if path to config file provided, it is used
-        with open(configpath, "r") as f:
-            conf_dict = yaml.safe_load(f)
+        conf_dict = _read_yaml(configpath)
         logging.info(f"Using provided config file: {configpath}\n")
     else:
         # if no path provided, try to use config environment variable
         cfile = os.getenv("CATS_CONFIG_FILE")
         if cfile is not None:
             try:
-                with open(cfile, "r") as f:
-                    conf_dict = yaml.safe_load(f)
+                conf_dict = _read_yaml(cfile)
                 logging.info(f"Using {cfile} found in CATS_CONFIG_FILE\n")
             except FileNotFoundError:
                 logging.warning("CATS_CONFIG_FILE config file not found")
@@ -95,8 +147,7 @@ def config_from_file(configpath="") -> Mapping[str, Any]:
             config_file_names = ["cats_config.yml", "cats_config.yaml", "config.yaml"]
             cfile = next((x for x in config_file_names if os.path.isfile(x)), "config.yml")
             try:
-                with open(cfile, "r") as f:
-                    conf_dict = yaml.safe_load(f)
+                conf_dict = _read_yaml(cfile)
                 logging.info(f"Using {cfile} found in current directory\n")
                 if cfile in ["config.yaml", "config.yml"]:
                     logging.warning(f"Use of {cfile} is deprecated. We suggest renaming to 'cats_config.yml'\n")
@@ -113,18 +164,33 @@ def CI_API_from_config_or_args(args, config) -> APIInterface:
     except KeyError:
         api = "carbonintensity.org.uk"  # default value
         logging.warning(f"Unspecified carbon intensity forecast service, using {api}")
+    if api.startswith("file:"):
+        # Forecasts read from a local file or directory of snapshots
+        return local_api_interface(api[len("file:") :], get_replay_from(args, config))
     try:
-        interface = API_interfaces[api]
+        return API_interfaces[api]
     except KeyError:
-        logging.error(
-            f"Error: {api} is not a valid API choice. It must be one of " "\n".join(
-                API_interfaces.keys()
-            )
+        raise ValueError(
+            f"{api} is not a valid API choice. It must be one of "
+            + ", ".join(API_interfaces.keys())
         )
-    return interface
+
+
+def get_replay_from(args, config) -> Optional[datetime]:
+    replay_from = getattr(args, "replay_from", None) or config.get("replay_from")
+    if isinstance(replay_from, str):
+        replay_from = datetime.fromisoformat(replay_from.replace("Z", "+00:00"))
+    if replay_from is not None and replay_from.tzinfo is None:
+        # As forecast timestamps, naive times are UTC
+        replay_from = replay_from.replace(tzinfo=timezone.utc)
+    return replay_from
 
 
 def get_location_from_config_or_args(args, config) -> str:
+    if getattr(args, "sites", None):
+        # Candidate locations are given, the job location is chosen
+        # among them later on
+        return args.sites[0]
     if args.location:
         location = args.location
         logging.info(f"Using location provided from command line: {location}")
@@ -134,14 +200,29 @@ def get_location_from_config_or_args(args, config) -> str:
         logging.info(f"Using location from config file: {location}")
         return location
 
-    r = requests.get("https://ipapi.co/json/", headers = user_agent)
+    # requests is only imported to find the location from the IP address,
+    # and patched to cache the response (and allow CI to still work)
+    import requests
+    import requests_cache
+
+    requests_cache.install_cache("cats_cache", use_temp=True)
+    try:
+        r = get_with_retries(
+            requests,
+            "https://ipapi.co/json/",
+            headers=user_agent,
+            timeout=REQUEST_TIMEOUT,
+            breaker=breaker,
+        )
+    except OSError as e:
+        # Connection errors and timeouts, see cats.resilience
+        raise OSError(f"Could not get location from ipapi.co: {e}") from e
     if r.status_code != 200:
-        logging.error(
+        raise OSError(
             "Could not get location from ipapi.co.\n"
             f"Got Error {r.status_code} - {r.json()['reason']}\n"
             f"{r.json()['message']}"
         )
-        sys.exit(1)
     location = r.json()["postal"]
     assert location
     logging.warning(
@@ -150,36 +231,152 @@ def get_location_from_config_or_args(args, config) -> str:
     return location
 
 
+def get_last_location() -> Optional[str]:
+    """Return the location of the previous run of cats without a
+    location on the command line, if any, as a guess of the location
+    of this run before the configuration is read or the location looked
+    up from the IP address.
+    """
+    try:
+        with open(last_location_path, "r") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def save_last_location(location: str):
+    if get_last_location() == location:
+        return
+    try:
+        atomic_write_text(last_location_path, location)
+    except OSError as e:
+        logging.warning(f"Could not save location {last_location_path}: {e}")
+
+
 def read_device_config(args, key, config):
-    if not (nunits := getattr(args, key.lower()) or config.get("nunits")):
-        logging.error(f"No number of units specified for device {key}")
+    if not (nunits := getattr(args, key.lower(), None) or config.get("nunits")):
+        raise ValueError(f"No number of units specified for device {key}")
     try:
         power = config["power"]
     except KeyError:
-        logging.error(f"Can't find power specification for device {key}")
-        power = None
+        raise ValueError(f"Can't find power specification for device {key}")
     return nunits, power
 
 
-def get_job_info(args, profiles: dict) -> list[tuple[int, float]]:
+def select_profile(args, profiles: dict) -> tuple[str, dict]:
+    if not profiles:
+        raise ValueError("No profiles in configuration")
     if args.profile:
         try:
-            profile = profiles[args.profile]
+            return args.profile, profiles[args.profile]
         except KeyError:
-            logging.error(
-                f"job info key 'profile' should be one of {profiles.keys()}. Typo?\n"
+            raise ValueError(
+                f"Profile {args.profile} should be one of {list(profiles)}. Typo?"
             )
-            sys.exit(1)
-    else:
-        profile_key, profile = next(iter(profiles.items()))
-        logging.warning(f"Using default profile {profile_key}")
+    profile_key, profile = next(iter(profiles.items()))
+    logging.warning(f"Using default profile {profile_key}")
+    return profile_key, profile
 
-    jobinfo = [read_device_config(args, k, v) for k, v in profile.items()]
-    if not args.memory:
-        logging.error("Missing memory footprint, use --memory")
-        sys.exit(1)
-    jobinfo += [(args.memory, MEMORY_POWER_PER_GB)]
-    if any([not (nunits and power) for nunits, power in jobinfo]):
-        logging.error(f"Errors when processing profile {profile_key}")
-        sys.exit(1)
+
+def read_power_curve(config) -> PowerCurve:
+    """Return a power curve from a profile's ``power_curve`` entry.
+
+    The entry is either a list of ``[minutes, fraction]`` pairs, or the
+    path to a CSV file with one such pair per line.  Each pair gives
+    the fraction of the profile's nominal power used from the given
+    number of minutes since job start, until the next pair.
+
+    :raises ValueError: If the entry is not a valid power curve.
+    """
+    if isinstance(config, str):
+        with open(config, "r", newline="") as f:
+            config = [row for row in csv.reader(f) if row]
+    try:
+        power_curve = [
+            (float(minutes), float(fraction)) for minutes, fraction in config
+        ]
+    except (TypeError, ValueError):
+        raise ValueError("power_curve should be a list of [minutes, fraction] pairs")
+    times = [minutes for minutes, _ in power_curve]
+    if (
+        not power_curve
+        or times[0] != 0
+        or any(a >= b for a, b in zip(times[:-1], times[1:]))
+        or any(fraction < 0 for _, fraction in power_curve)
+    ):
+        raise ValueError(
+            "power_curve should start at 0 minutes, with increasing times "
+            "and non-negative power fractions"
+        )
+    return power_curve
+
+
+def read_profile_devices(
+    args, profile_key: str, profile: dict
+) -> list[tuple[int, float]]:
+    """Return the number of units and power of each device of a
+    profile, the number of CPUs and GPUs given on the command line
+    taking precedence over the profile, followed by the memory if
+    given.
+
+    :raises ValueError: If the number of units or power of a device is
+        missing.
+    """
+    try:
+        jobinfo = [
+            read_device_config(args, k, v)
+            for k, v in profile.items()
+            if k != "power_curve"
+        ]
+    except ValueError as e:
+        raise ValueError(f"{e} in profile {profile_key}")
+    if args.memory:
+        jobinfo += [(args.memory, MEMORY_POWER_PER_GB)]
     return jobinfo
+
+
+def get_job_info(args, profiles: dict) -> list[tuple[int, float]]:
+    if not args.memory:
+        raise ValueError("Missing memory footprint, use --memory")
+    return read_profile_devices(args, *select_profile(args, profiles))
+
+
+def get_sites(args, locations: list[str]) -> list[Site]:
+    """Return the candidate sites to run a job at the given locations.
+
+    The PUE and profile of each site are read from the ``sites`` entry
+    of the configuration file, keyed by location, and default to the
+    top-level PUE and the profile selected on the command line.  The
+    job power at each site is only computed when profiles are used.
+
+    :raises ValueError: If the profile of a site is invalid.
+    """
+    configmapping = config_from_file(configpath=args.config)
+    sites_config = configmapping.get("sites") or {}
+    profiles = configmapping.get("profiles") or {}
+    use_profiles = profiles and (
+        args.profile
+        or args.footprint
+        or any("profile" in (c or {}) for c in sites_config.values())
+    )
+
+    sites = []
+    for location in locations:
+        config = sites_config.get(location) or {}
+        site = Site(location, PUE=config.get("PUE", configmapping.get("PUE", 1.0)))
+        if use_profiles:
+            if profile_key := config.get("profile"):
+                if profile_key not in profiles:
+                    raise ValueError(
+                        f"Profile {profile_key} of site {location} should be one of "
+                        f"{list(profiles)}. Typo?"
+                    )
+                profile = profiles[profile_key]
+            else:
+                profile_key, profile = select_profile(args, profiles)
+            jobinfo = read_profile_devices(args, profile_key, profile)
+            site.power = sum(nunits * power for nunits, power in jobinfo)
+            if "power_curve" in profile:
+                site.power_curve = read_power_curve(profile["power_curve"])
+        sites.append(site)
+    return sites
@@ -1,9 +1,17 @@
+import bisect
+import hashlib
+import heapq
+from collections.abc import Iterable, Iterator, Sequence
 from dataclasses import dataclass
-from typing import Optional
-from datetime import datetime, timedelta
+from typing import Optional, Union
+from datetime import datetime, timedelta, tzinfo
 
+import numpy as np
 
-@dataclass(order=True)
+from .carbonFootprint import PowerCurve, mean_power_fraction, power_curve_steps
+
+
+@dataclass(order=True, slots=True)
 class CarbonIntensityPointEstimate:
     """Represents a single data point within an intensity
     timeseries. Use order=True in order to enable comparison of class
@@ -33,69 +41,236 @@ class CarbonIntensityAverageEstimate:
     end_value: float  # CI point estimate at end time
 
 
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+
+
+def epoch_seconds(when: datetime) -> float:
+    """Return the number of seconds elapsed since the Unix epoch.
+
+    Naive datetimes are read as UTC rather than local time, so that
+    differences between naive datetimes are the same as with datetime
+    arithmetic.
+    """
+    if when.tzinfo is None:
+        return (when - _NAIVE_EPOCH).total_seconds()
+    return when.timestamp()
+
+
+def from_epoch_seconds(seconds: float, tz: Optional[tzinfo]) -> datetime:
+    """Inverse of :py:func:`epoch_seconds`, returning a datetime in
+    timezone ``tz``, or a naive datetime if ``tz`` is None.
+    """
+    if tz is None:
+        return _NAIVE_EPOCH + timedelta(seconds=seconds)
+    return datetime.fromtimestamp(seconds, tz=tz)
+
+
+class CarbonIntensitySeries(Sequence):
+    """Carbon intensity timeseries stored as two columns: data point
+    times as seconds since the epoch (int64) and intensity values
+    (float64).
+
+    Indexing the series with an integer returns a
+    :py:class:`CarbonIntensityPointEstimate`, created on access, so
+    that a series can be used in place of a list of point estimates.
+    Slicing returns a series sharing the same underlying arrays.
+    """
+
+    __slots__ = ("times", "values", "tzinfo", "_cumint", "_digest")
+
+    def __init__(self, times, values, tzinfo: Optional[tzinfo] = None):
+        self.times = np.asarray(times, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.tzinfo = tzinfo  # timezone of datetimes of point estimates
+        self._cumint: Optional[np.ndarray] = None
+        self._digest: Optional[str] = None
+        if self.times.shape != self.values.shape:
+            raise ValueError(
+                "Carbon intensity series times and values differ in length"
+            )
+
+    @classmethod
+    def from_points(
+        cls, points: Iterable[CarbonIntensityPointEstimate]
+    ) -> "CarbonIntensitySeries":
+        points = list(points)
+        return cls(
+            times=[epoch_seconds(p.datetime) for p in points],
+            values=[p.value for p in points],
+            tzinfo=points[0].datetime.tzinfo if points else None,
+        )
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return CarbonIntensitySeries(
+                self.times[index], self.values[index], self.tzinfo
+            )
+        return CarbonIntensityPointEstimate(
+            value=float(self.values[index]),
+            datetime=from_epoch_seconds(int(self.times[index]), self.tzinfo),
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, CarbonIntensitySeries):
+            return NotImplemented
+        return (
+            np.array_equal(self.times, other.times)
+            and np.array_equal(self.values, other.values)
+            and self.tzinfo == other.tzinfo
+        )
+
+    def __repr__(self):
+        return "\n".join(repr(p) for p in self)
+
+    def cumulative_integral(self) -> np.ndarray:
+        """Return the integral of the timeseries between the first
+        and each data point, in intensity units times seconds.  Data
+        points are integrated using the trapezoidal rule.  The result
+        is computed once and shared by all users of the series.
+        """
+        if self._cumint is None:
+            t, v = self.times - self.times[:1], self.values
+            cumint = np.zeros(len(v))
+            np.cumsum(0.5 * (v[:-1] + v[1:]) * np.diff(t), out=cumint[1:])
+            self._cumint = cumint
+        return self._cumint
+
+    def digest(self) -> str:
+        """Return a hash of the series content, identifying a forecast
+        independently of when and how it was obtained.  The result is
+        computed once and shared by all users of the series.
+        """
+        if self._digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(self.times.tobytes())
+            h.update(self.values.tobytes())
+            h.update(str(self.tzinfo).encode())
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def integral_until(self, when) -> np.ndarray:
+        """Return the integral of the timeseries between the first
+        data point and each of the times ``when``, given in seconds
+        since the epoch, assuming data points are joined by straight
+        lines.  Times past the last data point are extrapolated from
+        the last data interval.
+        """
+        when = np.asarray(when, dtype=float)
+        t, v = self.times, self.values
+        k = np.clip(np.searchsorted(t, when, "right") - 1, 0, len(t) - 2)
+        offset = when - t[k]
+        slope = (v[k + 1] - v[k]) / (t[k + 1] - t[k])
+        return self.cumulative_integral()[k] + offset * (v[k] + 0.5 * slope * offset)
+
+    def value_at(self, when) -> np.ndarray:
+        """Return the intensity at each of the times ``when``, given in
+        seconds since the epoch, assuming data points are joined by
+        straight lines.  Times before the first or past the last data
+        point are extrapolated from the first or last data interval,
+        as in :py:meth:`integral_until`.
+        """
+        when = np.asarray(when, dtype=float)
+        t, v = self.times, self.values
+        k = np.clip(np.searchsorted(t, when, "right") - 1, 0, len(t) - 2)
+        return v[k] + (v[k + 1] - v[k]) / (t[k + 1] - t[k]) * (when - t[k])
+
+    def datetimes(self) -> list[datetime]:
+        """Return the times of data points as datetimes"""
+        return [from_epoch_seconds(int(t), self.tzinfo) for t in self.times]
+
+
+def as_series(
+    data: Union[CarbonIntensitySeries, Iterable[CarbonIntensityPointEstimate]],
+) -> CarbonIntensitySeries:
+    """Return data as a :py:class:`CarbonIntensitySeries`, converting
+    from a list of point estimates if needed.
+    """
+    if isinstance(data, CarbonIntensitySeries):
+        return data
+    return CarbonIntensitySeries.from_points(data)
+
+
 class WindowedForecast:
     def __init__(
         self,
-        data: list[CarbonIntensityPointEstimate],
+        data: Union[CarbonIntensitySeries, list[CarbonIntensityPointEstimate]],
         duration: int,  # in minutes
         start: datetime,
         max_window_minutes: Optional[int] = None,
         end_constraint: Optional[datetime] = None,
+        power_curve: Optional[PowerCurve] = None,
     ):
         self.duration = duration
         self.max_window_minutes = max_window_minutes
         self.end_constraint = end_constraint
+        self.power_curve = power_curve
+
+        # Data point times are a sorted index, in seconds since the
+        # epoch. All searches over the data below are binary searches
+        # on this index.
+        data = as_series(data)
+        times = data.times
 
         # Filter data based on constraints if any are specified
         if max_window_minutes is not None or end_constraint is not None:
-            filtered_data = self._filter_data_by_constraints(
-                data, start, duration, max_window_minutes or 2820, end_constraint
+            nfiltered = self._filter_data_by_constraints(
+                times, start, duration, max_window_minutes or 2820, end_constraint
             )
         else:
-            filtered_data = data
+            nfiltered = len(data)
 
-        self.data_stepsize = filtered_data[1].datetime - filtered_data[0].datetime
         self.start = start
         self.end = start + timedelta(minutes=duration)
 
         # Restrict data points so that start time falls within the
         # first data interval.  In other we don't need any data prior
         # the closest data preceding (on the left of) the job start
-        # time.
-        def bisect_right(data, t):
-            for i, d in enumerate(data):
-                if d.datetime > t:
-                    return i - 1
-
-        # bisect_right(data, start) returns the index of the first
-        # data point with datetime value immediately preceding the job
-        # start time
-        self.data = filtered_data[bisect_right(filtered_data, start) :]
-
-        # Find number of data points in a window, by finding the index
-        # of the closest data point past the job end time. Could be
-        # done with the bisect module in the stdlib for python 3.10+
-        # ('key' parameter was introduced in 3.10).
-        #
-        # bisect_left(data, self.end, key=lambda x: x.datetime)
-        #
-        def bisect_left(data, t):
-            for i, d in enumerate(data):
-                if d.datetime + self.data_stepsize >= t:
-                    return i + 1
+        # time, that is the data point with datetime value immediately
+        # preceding the job start time.
+        first = max(
+            int(np.searchsorted(times[:nfiltered], epoch_seconds(start), "right")) - 1,
+            0,
+        )
+        self.data = data[first:nfiltered]
+        self._times = self.data.times
+        self._values = self.data.values
+        self._cumint = data.cumulative_integral()[first:nfiltered]
+
+        # There is no data point past the job end time if it falls
+        # beyond the last data interval.
+        if len(self.data) < 2 or epoch_seconds(self.end) > (
+            2 * self._times[-1] - self._times[-2]
+        ):
             raise ValueError("No index found for closest data point past job end time")
 
-        self.ndata = bisect_left(self.data, self.end)  # window size
+        # Time step between the first two data points.  Data points
+        # need not be evenly spaced: candidate windows start at the
+        # job start time shifted by the time elapsed between the
+        # first and each data point.
+        self.data_stepsize = timedelta(seconds=int(self._times[1] - self._times[0]))
+        self._shifts = self._times - self._times[0]
+
+        # The time-integrated intensity for every candidate window is
+        # computed at once from the data point times and values, see
+        # _integrate().
+        self._averages, self._start_values, self._end_values = self._integrate()
+        self._length = self._count_windows()
 
     def _filter_data_by_constraints(
         self,
-        data: list[CarbonIntensityPointEstimate],
+        times: np.ndarray,
         start: datetime,
         duration: int,
         max_window_minutes: int,
         end_constraint: Optional[datetime],
-    ) -> list[CarbonIntensityPointEstimate]:
-        """Filter forecast data based on time constraints."""
+    ) -> int:
+        """Return the number of forecast data points needed to satisfy
+        the time constraints, given the (sorted) data point times in
+        seconds since the epoch.
+        """
 
         # Calculate the maximum time we need data for
         search_window_end = start + timedelta(minutes=max_window_minutes)
@@ -112,78 +287,258 @@ class WindowedForecast:
         max_data_time = search_window_end + timedelta(minutes=duration)
 
         # Filter data to respect the constraints
-        filtered_data = []
-        for d in data:
-            if d.datetime <= max_data_time:
-                filtered_data.append(d)
-            else:
-                break
+        nfiltered = int(np.searchsorted(times, epoch_seconds(max_data_time), "right"))
 
-        if len(filtered_data) < 2:
+        if nfiltered < 2:
             raise ValueError(
                 "Insufficient forecast data for the specified time window constraints. "
                 "Try increasing --window or adjusting --end-window."
             )
 
-        return filtered_data
+        return nfiltered
+
+    def _integrate(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the average intensity, as well as the interpolated
+        intensity at window start and end, for all candidate windows.
+
+        Data points are integrated using the trapezoidal rule, that is
+        assuming that forecast data points are joined with a straight
+        line.  The integral over the data intervals fully contained in
+        a window is read off the cumulative integral of the
+        timeseries, so that the cost of evaluating all windows is
+        linear in the number of data points, independently of the
+        window size.
+
+        If the job has a power curve, the average intensity is
+        weighted by the fraction of nominal power used over time, so
+        that windows are ranked by total emissions.
+        """
+        t, v = self._shifts.astype(float), self._values
+        cumint = self._cumint
+        duration = (self.end - self.start).total_seconds()
+
+        # Windows must end before the last data point
+        window_start = epoch_seconds(self.start) - self._times[0] + t
+        window_start = window_start[window_start + duration <= t[-1]]
+        window_end = window_start + duration
+
+        # Account for the fact that the start and end of each window
+        # might not fall exactly on data points.  The starting
+        # intensity is interpolated between the data points on either
+        # side of the window start (lo and lo + 1).  The ending
+        # intensity value is interpolated between the data points on
+        # either side of the window end (hi and hi + 1).
+        # The job may start before the first data point, for instance
+        # with local forecasts, in which case intensity is extrapolated
+        # from the first data interval, as in integral_until().
+        last = len(t) - 2
+        lo = np.clip(np.searchsorted(t, window_start, "right") - 1, 0, last)
+        hi = np.clip(np.searchsorted(t, window_end, "left") - 1, 0, last)
+        start_values = v[lo] + (v[lo + 1] - v[lo]) / (t[lo + 1] - t[lo]) * (
+            window_start - t[lo]
+        )
+        end_values = v[hi] + (v[hi + 1] - v[hi]) / (t[hi + 1] - t[hi]) * (
+            window_end - t[hi]
+        )
+
+        integral = np.where(
+            lo == hi,
+            # Window start and end fall between the same two data points
+            0.5 * (start_values + end_values) * duration,
+            0.5 * (start_values + v[lo + 1]) * (t[lo + 1] - window_start)
+            + (cumint[hi] - cumint[np.minimum(lo + 1, hi)])
+            + 0.5 * (v[hi] + end_values) * (window_end - t[hi]),
+        )
+
+        if self.power_curve:
+            # Weight intensity by the fraction of nominal power used
+            # over time.  For a piecewise constant power curve, the
+            # weighted integral is a sum of integrals over each step,
+            # read off the cumulative integral for all windows at once.
+            edges, fractions = power_curve_steps(self.power_curve, self.duration)
+            offsets = self._times[0] + window_start
+            cumulative = [self.data.integral_until(offsets + e * 60) for e in edges]
+            integral = sum(
+                f * (b - a)
+                for f, a, b in zip(fractions, cumulative[:-1], cumulative[1:])
+            )
+            integral /= mean_power_fraction(self.power_curve, self.duration)
+
+        return integral / duration, start_values, end_values
 
     def __getitem__(self, index: int) -> CarbonIntensityAverageEstimate:
         """Return the average of timeseries data from index over the
         window size.  Data points are integrated using the trapeziodal
         rule, that is assuming that forecast data points are joined
-        with a straight line.
-
-        Integral value between two points is the intensity value at
-        the midpoint times the duration between the two points.  This
-        duration is assumed to be unity and the average is computed by
-        dividing the total integral value by the number of intervals.
+        with a straight line.  Averages for all windows are computed
+        upfront, see :py:meth:`_integrate`.
         """
 
         if index >= len(self):
             raise IndexError("Window index out of range")
 
-        # Account for the fact that the start and end of each window
-        # might not fall exactly on data points.  The starting
-        # intensity is interpolated between the first (index) and
-        # second data point (index + 1) in the window.  The ending
-        # intensity value is interpolated between the last and
-        # penultimate data points in the window.
-        window_start = self.start + index * self.data_stepsize
-        window_end = self.end + index * self.data_stepsize
-
-        # lbound: carbon intensity point estimate at window start
-        lbound = self.interp(
-            self.data[index],
-            self.data[index + 1],
-            when=window_start,
+        shift = timedelta(seconds=int(self._shifts[index]))
+        return CarbonIntensityAverageEstimate(
+            start=self.start + shift,
+            end=self.end + shift,
+            value=float(self._averages[index]),
+            start_value=float(self._start_values[index]),
+            end_value=float(self._end_values[index]),
         )
-        # rbound: carbon intensity point estimate at window end
-        # Handle case when last data point exactly matches last carbon intensity,
-        # so there is no further data point to interpolate from.
-        if index + self.ndata == len(self.data):
-            rbound = self.data[-1]
+
+    def best(
+        self, k: int = 1, min_gap: Optional[timedelta] = None
+    ) -> list[CarbonIntensityAverageEstimate]:
+        """Return the k windows with the lowest average intensity,
+        ordered by increasing average intensity.  Windows with equal
+        average intensity are ordered by start time, so that
+        ``wf.best()[0] == min(wf)``.
+
+        If ``min_gap`` is given, the start times of any two returned
+        windows are at least ``min_gap`` apart, see
+        :py:meth:`ranked`.  Otherwise the k windows are selected
+        without sorting all windows.
+        """
+        if min_gap:
+            return [w for w, _ in zip(self.ranked(min_gap), range(k))]
+
+        averages = self._averages[: len(self)]
+        k = min(k, len(averages))
+        if k <= 0:
+            return []
+        # All windows below the k-th smallest average, completed by
+        # the earliest windows equal to it.
+        kth = np.partition(averages, k - 1)[k - 1]
+        below = np.flatnonzero(averages < kth)
+        ties = np.flatnonzero(averages == kth)[: k - len(below)]
+        candidates = np.concatenate((below, ties))
+        candidates = candidates[np.lexsort((candidates, averages[candidates]))]
+        return [self[int(i)] for i in candidates]
+
+    def optimal(
+        self, resolution: timedelta = timedelta(minutes=1)
+    ) -> CarbonIntensityAverageEstimate:
+        """Return the window with the lowest average intensity among
+        all job start times, rather than only the candidate windows,
+        to the given resolution.  Start times range from the job start
+        time to the latest time satisfying the constraints.
+
+        Data points being joined by straight lines, the window average
+        is a piecewise quadratic function of the start time, with
+        breakpoints where the window start or end (or a power curve
+        step edge) crosses a data point.  Its minimum is either at a
+        breakpoint, or where its derivative vanishes within a piece,
+        which is found in closed form.  The best window on the
+        resolution grid around this minimum is returned, unless the
+        best candidate window is better.
+        """
+        windows = self.best()
+        if not windows:
+            raise ValueError("No valid window for the job in the forecast")
+        best = windows[0]
+
+        t = self._times
+        duration = self.duration * 60
+        if self.power_curve:
+            edges, fractions = power_curve_steps(self.power_curve, self.duration)
         else:
-            rbound = self.interp(
-                self.data[index + self.ndata - 1],
-                self.data[index + self.ndata],
-                when=window_end,
+            edges, fractions = [0, self.duration], [1.0]
+        steps = [
+            (f, a * 60, b * 60) for f, a, b in zip(fractions, edges[:-1], edges[1:])
+        ]
+        weight = sum(f * (b - a) for f, a, b in steps)
+
+        def average(when):
+            return (
+                sum(
+                    f
+                    * (
+                        self.data.integral_until(when + b)
+                        - self.data.integral_until(when + a)
+                    )
+                    for f, a, b in steps
+                )
+                / weight
             )
-        # window_data <- [lbound] + [...bulk...] + [rbound] where
-        # lbound and rbound are interpolated intensity values.
-        window_data = [lbound] + self.data[index + 1 : index + self.ndata] + [rbound]
-        acc = [
-            0.5 * (a.value + b.value) * (b.datetime - a.datetime).total_seconds()
-            for a, b in zip(window_data[:-1], window_data[1:])
+
+        def derivative(when):
+            return sum(
+                f * (self.data.value_at(when + b) - self.data.value_at(when + a))
+                for f, a, b in steps
+            )
+
+        earliest = epoch_seconds(self.start)
+        latest = t[-1] - duration
+        if self.max_window_minutes is not None:
+            latest = min(latest, earliest + self.max_window_minutes * 60)
+        before = np.inf
+        if self.end_constraint:
+            before = epoch_seconds(self.end_constraint)
+            latest = min(latest, before)
+
+        breaks = np.concatenate(
+            [[earliest, latest], *(t - e for _, e, _ in steps), t - duration]
+        )
+        breaks = np.unique(breaks[(breaks >= earliest) & (breaks <= latest)])
+        slope = derivative(breaks)
+        # Zeros of the derivative where it changes sign from negative
+        # to positive, interpolating linearly within each piece
+        rising = (slope[:-1] < 0) & (slope[1:] > 0)
+        zeros = breaks[:-1][rising] - slope[:-1][rising] * (
+            np.diff(breaks)[rising] / (slope[1:][rising] - slope[:-1][rising])
+        )
+        candidates = np.concatenate([breaks, zeros])
+        minimum = candidates[np.argmin(average(candidates))]
+
+        step = resolution.total_seconds()
+        rounded = np.floor(minimum / step) * step + np.array([0, step])
+        rounded = rounded[
+            (rounded >= earliest) & (rounded <= latest) & (rounded < before)
         ]
-        duration = window_data[-1].datetime - window_data[0].datetime
+        if len(rounded) == 0:
+            return best
+        averages = average(rounded)
+        when = rounded[np.argmin(averages)]
+        if averages.min() >= best.value:
+            return best
+        start = from_epoch_seconds(when, self.start.tzinfo)
         return CarbonIntensityAverageEstimate(
-            start=window_start,
-            end=window_end,
-            value=sum(acc) / duration.total_seconds(),
-            start_value=lbound.value,
-            end_value=rbound.value,
+            value=float(averages.min()),
+            start=start,
+            end=start + timedelta(minutes=self.duration),
+            start_value=float(self.data.value_at(when)),
+            end_value=float(self.data.value_at(when + duration)),
         )
 
+    def ranked(
+        self, min_gap: Optional[timedelta] = None
+    ) -> Iterator[CarbonIntensityAverageEstimate]:
+        """Iterate over windows by increasing average intensity, then
+        start time.  Windows are taken lazily off a heap, so that
+        consuming the first few windows does not sort all of them.
+
+        If ``min_gap`` is given, a window is skipped if it starts less
+        than ``min_gap`` before or after a window already returned.
+        """
+        heap = list(zip(self._averages[: len(self)].tolist(), range(len(self))))
+        heapq.heapify(heap)
+        selected: list[int] = []  # sorted indices of windows returned so far
+        gap = min_gap.total_seconds() if min_gap else 0
+        while heap:
+            _, index = heapq.heappop(heap)
+            if min_gap:
+                # Only the closest selected windows on either side
+                # can be less than min_gap away.
+                pos = bisect.bisect(selected, index)
+                neighbours = selected[max(pos - 1, 0) : pos + 1]
+                if any(
+                    abs(int(self._shifts[index] - self._shifts[j])) < gap
+                    for j in neighbours
+                ):
+                    continue
+                selected.insert(pos, index)
+            yield self[index]
+
     @staticmethod
     def interp(
         p1: CarbonIntensityPointEstimate,
@@ -208,33 +563,64 @@ class WindowedForecast:
         for index in range(len(self)):
             yield self[index]
 
-    def __len__(self):
+    def _count_windows(self) -> int:
         """Return number of valid forecast windows respecting all constraints."""
-        base_length = len(self.data) - self.ndata
-
-        if base_length <= 0:
-            return 0
-
-        max_valid_index = base_length - 1
+        nwindows = len(self._averages)
 
         # Check max window constraint only if specified
         if self.max_window_minutes is not None:
-            data_stepsize_minutes = self.data_stepsize.total_seconds() / 60
-            max_index_by_window = int(self.max_window_minutes / data_stepsize_minutes)
-            max_valid_index = min(max_valid_index, max_index_by_window)
+            nwindows = min(
+                nwindows,
+                int(
+                    np.searchsorted(self._shifts, self.max_window_minutes * 60, "right")
+                ),
+            )
 
-        # Check end constraint
+        # Check end constraint: windows must start before end_constraint.
         if self.end_constraint:
             if self.end_constraint.tzinfo != self.start.tzinfo:
                 end_constraint = self.end_constraint.astimezone(self.start.tzinfo)
             else:
                 end_constraint = self.end_constraint
 
-            # Find the maximum index where job start time is before end_constraint
-            for i in range(min(base_length, max_valid_index + 1)):
-                window_start = self.start + i * self.data_stepsize
-                if window_start >= end_constraint:
-                    max_valid_index = i - 1
-                    break
+            nbefore = np.searchsorted(
+                self._shifts, (end_constraint - self.start).total_seconds(), "left"
+            )
+            nwindows = min(nwindows, int(nbefore))
+
+        return nwindows
 
-        return max(0, max_valid_index + 1)
+    def __len__(self):
+        return self._length
+
+
+def best_windows_by_duration(
+    data: Union[CarbonIntensitySeries, list[CarbonIntensityPointEstimate]],
+    durations: Iterable[int],  # in minutes
+    start: datetime,
+    max_window_minutes: Optional[int] = None,
+    end_constraint: Optional[datetime] = None,
+    power_curve: Optional[PowerCurve] = None,
+) -> dict[int, Optional[CarbonIntensityAverageEstimate]]:
+    """Return the window with the lowest average intensity for each
+    job duration, or None if the forecast is too short for a
+    duration.
+
+    The cumulative integral of the forecast is computed once and
+    shared between durations, so that the cost for each duration is
+    linear in the number of forecast data points.
+    """
+    data = as_series(data)
+    data.cumulative_integral()
+    best: dict[int, Optional[CarbonIntensityAverageEstimate]] = {}
+    for duration in durations:
+        try:
+            wf = WindowedForecast(
+                data, duration, start, max_window_minutes, end_constraint, power_curve
+            )
+        except ValueError:
+            best[duration] = None
+            continue
+        windows = wf.best()
+        best[duration] = windows[0] if windows else None
+    return best
@@ -0,0 +1,160 @@
+"""This module exports a class :py:class:`ForecastCache
+<cats.forecast_cache.ForecastCache>` that stores parsed carbon
+intensity forecasts on disk, so that processes requesting the same
+forecast load it without parsing the API response again.
+
+Forecasts are keyed by their request URL which, for the supported
+APIs, identifies the API, the region and the forecast period (see
+:py:func:`ciuk_request_url <cats.CI_api_interface.ciuk_request_url>`).
+Each forecast is stored in its own file, as a short header giving
+the series timezone followed by ``(time, value)`` records, which are
+memory-mapped when loaded.  Files are written atomically, so that
+concurrent processes never load a partially written forecast.
+"""
+
+import hashlib
+import logging
+import os
+import time
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from ._fs import atomic_write_bytes, state_path
+from .forecast import CarbonIntensitySeries
+
+__all__ = ["ForecastCache", "default_cache_dir"]
+
+_MAGIC = b"CATSFC1\n"
+_HEADER_SIZE = 64  # magic then timezone key, padded with NUL bytes
+_DTYPE = np.dtype([("time", "<i8"), ("value", "<f8")])
+_MAX_LOADED = 64  # number of loaded forecasts kept in memory
+
+
+def default_cache_dir() -> str:
+    """Return the directory of cached forecasts."""
+    return state_path("cats_forecasts")
+
+
+class ForecastCache:
+    """Directory of parsed forecasts.
+
+    :param directory: Cache directory, created if needed.
+    :param max_age: Cached forecasts older than this number of seconds
+        are removed when a new forecast is saved.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_age: float = 48 * 3600):
+        self.directory = directory or default_cache_dir()
+        self.max_age = max_age
+        # Loaded forecasts, keyed by file, so that long running processes
+        # (cats serve) load each forecast once and keep its cumulative
+        # integral, see CarbonIntensitySeries.cumulative_integral()
+        self._loaded: dict[str, tuple[tuple[int, int], CarbonIntensitySeries]] = {}
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+        return os.path.join(self.directory, digest + ".fc")
+
+    def load(self, key: str) -> Optional[CarbonIntensitySeries]:
+        """Return the forecast saved under ``key``, or None if there is
+        no such valid forecast.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                version = (stat.st_ino, stat.st_mtime_ns)
+                loaded = self._loaded.get(path)
+                if loaded is not None and loaded[0] == version:
+                    return loaded[1]
+                header = f.read(_HEADER_SIZE)
+            if len(header) != _HEADER_SIZE or not header.startswith(_MAGIC):
+                raise ValueError("invalid header")
+            tzkey = header[len(_MAGIC) :].rstrip(b"\0").decode()
+            records = np.memmap(path, dtype=_DTYPE, mode="r", offset=_HEADER_SIZE)
+            tz = ZoneInfo(tzkey) if tzkey else None
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring invalid cached forecast {path}: {e}")
+            return None
+        series = CarbonIntensitySeries(records["time"], records["value"], tz)
+        if len(self._loaded) >= _MAX_LOADED:
+            del self._loaded[next(iter(self._loaded))]
+        self._loaded[path] = version, series
+        return series
+
+    def age(self, key: str) -> Optional[float]:
+        """Return the number of seconds since the forecast saved under
+        ``key`` was saved, or None if there is no such forecast.
+        """
+        try:
+            return time.time() - os.stat(self._path(key)).st_mtime
+        except OSError:
+            return None
+
+    def claim(self, key: str, max_age: float) -> bool:
+        """Return whether the calling process may fetch the forecast
+        saved under ``key``, marking it as being fetched for ``max_age``
+        seconds so that other processes calling this in the meantime do
+        not fetch it too.  The mark is a file created exclusively, which
+        expires after ``max_age`` seconds, so that a forecast is fetched
+        again if the process fetching it failed.
+        """
+        path = self._path(key)[: -len(".fc")] + ".claim"
+        for _ in range(2):
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(path).st_mtime < max_age:
+                        return False
+                    os.remove(path)  # expired, fetching failed
+                except FileNotFoundError:
+                    pass
+            except OSError as e:
+                logging.warning(f"Could not mark forecast as being fetched: {e}")
+                return True
+        return False
+
+    def save(self, key: str, series: CarbonIntensitySeries):
+        """Save a forecast under ``key``.  Forecasts with a timezone
+        other than None or a :py:class:`zoneinfo.ZoneInfo` are not
+        saved.
+        """
+        if series.tzinfo is None:
+            tzkey = ""
+        elif isinstance(series.tzinfo, ZoneInfo):
+            tzkey = series.tzinfo.key
+        else:
+            return
+        header = _MAGIC + tzkey.encode()
+        if len(series) == 0 or len(header) > _HEADER_SIZE:
+            return
+
+        records = np.empty(len(series), dtype=_DTYPE)
+        records["time"] = series.times
+        records["value"] = series.values
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            atomic_write_bytes(
+                self._path(key), header.ljust(_HEADER_SIZE, b"\0") + records.tobytes()
+            )
+        except OSError as e:
+            logging.warning(f"Could not save forecast to {self.directory}: {e}")
+            return
+        self._remove_expired()
+
+    def _remove_expired(self):
+        expiry = time.time() - self.max_age
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime < expiry:
+                        os.remove(entry.path)
+                except OSError:
+                    pass  # removed by another process
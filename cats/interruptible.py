@@ -0,0 +1,141 @@
+"""This module exports a function :py:func:`plan_segments
+<cats.interruptible.plan_segments>` that plans an interruptible job,
+for instance a job that checkpoints its state, as several shorter
+segments run during the lowest carbon intensity periods of a
+forecast.
+
+The time between the job start and deadline is divided into slots of
+``resolution`` minutes.  The optimal set of segments is found by
+dynamic programming over the slots, keeping track of the number of
+slots and segments used so far, as well as whether the job is running
+during the previous slot.
+"""
+
+import math
+from datetime import datetime, timedelta
+from typing import Optional, Union
+
+import numpy as np
+
+from .forecast import (
+    CarbonIntensityAverageEstimate,
+    CarbonIntensityPointEstimate,
+    CarbonIntensitySeries,
+    as_series,
+    epoch_seconds,
+)
+
+__all__ = ["plan_segments"]
+
+
+def plan_segments(
+    data: Union[CarbonIntensitySeries, list[CarbonIntensityPointEstimate]],
+    runtime: int,  # in minutes
+    start: datetime,
+    min_segment: int,  # in minutes
+    max_segments: int,
+    deadline: Optional[datetime] = None,
+    resolution: int = 5,  # in minutes
+) -> list[CarbonIntensityAverageEstimate]:
+    """Return the segments of an interruptible job minimising its
+    total carbon intensity, ordered by start time.
+
+    Segments start at or after ``start`` and end at or before
+    ``deadline``, or the end of the forecast.  Segment start and end
+    times are multiples of ``resolution`` minutes after ``start``, and
+    the total segment duration is ``runtime`` rounded up to a multiple
+    of ``resolution``.  Each segment lasts at least ``min_segment``
+    minutes (or the whole runtime if shorter), and there are at most
+    ``max_segments`` segments.
+
+    :raises ValueError: If no plan satisfies the constraints.
+    """
+    if min(runtime, min_segment, max_segments, resolution) <= 0:
+        raise ValueError(
+            "Runtime, minimum segment length, maximum number of segments "
+            "and resolution must be positive"
+        )
+    data = as_series(data)
+    step = resolution * 60
+    t0 = epoch_seconds(start)
+    if t0 < data.times[0]:
+        raise ValueError("Forecast data starts after the job start time")
+
+    horizon = data.times[-1] - t0
+    if deadline is not None:
+        horizon = min(horizon, epoch_seconds(deadline) - t0)
+    nslots = max(int(horizon // step), 0)
+    nrun = math.ceil(runtime / resolution)
+    nmin = min(math.ceil(min_segment / resolution), nrun)
+    if nrun > nslots:
+        raise ValueError(
+            "Insufficient forecast data to run the job before the deadline."
+        )
+
+    # cumint[t] is the integral of the forecast between the job start
+    # and the start of slot t.
+    cumint = data.integral_until(t0 + step * np.arange(nslots + 1))
+    cumint -= cumint[0]
+    slot = np.diff(cumint)
+    first_segment = cumint[nmin:] - cumint[:-nmin]  # shortest segment from slot t
+
+    # off[t, s, r] (resp. on[t, s, r]) is the lowest integral over r
+    # slots grouped into s segments among the first t slots, with the
+    # job not running (resp. running) during slot t - 1.
+    shape = (nslots + 1, max_segments + 1, nrun + 1)
+    off = np.full(shape, np.inf)
+    on = np.full(shape, np.inf)
+    off[0, 0, 0] = 0.0
+    for t in range(nslots):
+        # Job does not run during slot t
+        np.minimum(off[t + 1], np.minimum(off[t], on[t]), out=off[t + 1])
+        # Running segment is extended to slot t
+        np.minimum(on[t + 1, :, 1:], on[t, :, :-1] + slot[t], out=on[t + 1, :, 1:])
+        # New segment of minimum length starts at slot t
+        if t + nmin <= nslots:
+            np.minimum(
+                on[t + nmin, 1:, nmin:],
+                off[t, :-1, : nrun + 1 - nmin] + first_segment[t],
+                out=on[t + nmin, 1:, nmin:],
+            )
+
+    final = np.minimum(off[nslots, :, nrun], on[nslots, :, nrun])
+    nsegments = int(np.argmin(final))
+    if not np.isfinite(final[nsegments]):
+        raise ValueError("No job segments satisfy the constraints.")
+
+    # Walk back through the tables, following transitions that led to
+    # the optimal value.
+    slots = []  # (first slot, end slot) of each segment
+    t, s, r = nslots, nsegments, nrun
+    running = on[t, s, r] < off[t, s, r]
+    end = t
+    while t > 0:
+        if not running:
+            running = off[t - 1, s, r] != off[t, s, r]
+            t -= 1
+            end = t
+        elif r > nmin and on[t - 1, s, r - 1] + slot[t - 1] == on[t, s, r]:
+            t, r = t - 1, r - 1
+        else:
+            slots.append((t - nmin, end))
+            t, s, r = t - nmin, s - 1, r - nmin
+            running = False
+
+    segments = []
+    for first, last in reversed(slots):
+        seg_start = start + timedelta(minutes=first * resolution)
+        seg_end = start + timedelta(minutes=last * resolution)
+        start_value, end_value = np.interp(
+            [t0 + first * step, t0 + last * step], data.times, data.values
+        )
+        segments.append(
+            CarbonIntensityAverageEstimate(
+                value=float((cumint[last] - cumint[first]) / ((last - first) * step)),
+                start=seg_start,
+                end=seg_end,
+                start_value=float(start_value),
+                end_value=float(end_value),
+            )
+        )
+    return segments
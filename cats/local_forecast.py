@@ -0,0 +1,234 @@
+"""This module exports a class :py:class:`LocalForecast
+<cats.local_forecast.LocalForecast>` that reads carbon intensity
+forecasts from local files rather than from an online API, for compute
+nodes without network access, and for benchmarks and integration
+tests.
+
+Forecasts are read from CSV, JSON or NDJSON files, with one record per
+data point (see :py:func:`read_forecast_file
+<cats.local_forecast.read_forecast_file>`), or from a directory of
+such files holding archived snapshots of a forecast.  The snapshot
+used is the most recent one starting at or before the time of the
+request.
+
+A forecast can be replayed as if requested at a given time in the
+past: the snapshot is chosen for that time, then shifted forward so
+that the replayed time is now.  Replayed forecasts are the same,
+relative to the time of the request, on every run.
+"""
+
+import csv
+import json
+import os
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from .CI_api_interface import APIInterface, InvalidLocationError, parse_utc_timestamps
+from .forecast import CarbonIntensitySeries, epoch_seconds
+
+__all__ = ["LocalForecast", "local_api_interface", "read_forecast_file"]
+
+# Record fields holding data point times, values and locations, in
+# order of preference.  Values may also be nested as in the response of
+# the carbonintensity.org.uk API, {"intensity": {"forecast": value}}.
+_TIME_FIELDS = ("from", "time", "datetime", "unix")
+_VALUE_FIELDS = ("forecast", "intensity", "value")
+_LOCATION_FIELDS = ("location", "postcode")
+
+_EXTENSIONS = (".csv", ".json", ".ndjson", ".jsonl")
+
+
+def _field(record: dict, fields: tuple[str, ...]):
+    for field in fields:
+        if field in record:
+            return record[field]
+    raise KeyError(f"record has none of the fields {', '.join(fields)}")
+
+
+def _iter_records(path: str) -> Iterator[dict]:
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "r", newline="") as f:
+        if ext == ".csv":
+            yield from csv.DictReader(f)
+        elif ext in (".ndjson", ".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        elif ext == ".json":
+            records = json.load(f)
+            # Unwrap API responses, {"data": {"data": [...]}}
+            while isinstance(records, dict):
+                records = records["data"]
+            yield from records
+        else:
+            raise ValueError(
+                f"Unsupported forecast file {path}, expected one of "
+                + ", ".join(_EXTENSIONS)
+            )
+
+
+def _parse_times(times: list) -> np.ndarray:
+    if all(isinstance(t, (int, float)) for t in times):
+        return np.asarray(times, dtype=float)
+    try:
+        return parse_utc_timestamps(times)
+    except ValueError:
+        pass
+    # Other ISO 8601 timestamps, naive ones being UTC like API timestamps
+    seconds = []
+    for t in times:
+        try:
+            seconds.append(float(t))
+            continue
+        except ValueError:
+            pass
+        dt = datetime.fromisoformat(t.replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        seconds.append(dt.timestamp())
+    return np.asarray(seconds)
+
+
+def read_forecast_file(
+    path: str, location: Optional[str] = None, limit: Optional[int] = None
+) -> CarbonIntensitySeries:
+    """Read a forecast from a CSV, JSON or NDJSON file.
+
+    Each record is a data point, with a time in a ``from``, ``time``,
+    ``datetime`` or ``unix`` field, and a value in a ``forecast``,
+    ``intensity`` or ``value`` field.  Times are ISO 8601 timestamps,
+    UTC unless specified, or seconds since the epoch.  Records are
+    read one at a time, so that only the times and values are kept in
+    memory.
+
+    If records have a ``location`` or ``postcode`` field, only records
+    for ``location`` are read.
+
+    :param limit: Maximum number of data points read.
+    :raises InvalidLocationError: If no record is for ``location``.
+    :raises ValueError: If the file is not a valid forecast.
+    """
+    location = location.strip().upper() if location else None
+    times, values = [], []
+    located = False
+    try:
+        for record in _iter_records(path):
+            if location is not None:
+                try:
+                    record_location = _field(record, _LOCATION_FIELDS)
+                except KeyError:
+                    pass
+                else:
+                    located = True
+                    if str(record_location).strip().upper() != location:
+                        continue
+            value = _field(record, _VALUE_FIELDS)
+            if isinstance(value, dict):
+                value = value["forecast"]
+            times.append(_field(record, _TIME_FIELDS))
+            values.append(float(value))
+            if limit is not None and len(times) >= limit:
+                break
+        seconds = _parse_times(times)
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid forecast file {path}: {e}")
+    if located and not times:
+        raise InvalidLocationError
+    if not times:
+        raise ValueError(f"Invalid forecast file {path}: no data points")
+
+    order = np.argsort(seconds, kind="stable")
+    return CarbonIntensitySeries(
+        times=seconds[order], values=np.asarray(values)[order], tzinfo=ZoneInfo("UTC")
+    )
+
+
+class LocalForecast:
+    """Forecasts read from a local file or directory of snapshots.
+
+    :param path: Forecast file, or directory of forecast files.
+    :param replay_from: If given, forecasts are replayed as if
+        requested at this time.
+    """
+
+    def __init__(self, path: str, replay_from: Optional[datetime] = None):
+        self.path = path
+        self.replay_from = replay_from
+        # Parsed forecasts and snapshot start times, keyed by file and
+        # modification time, so that long running processes see
+        # updated files
+        self._forecasts: dict[tuple, CarbonIntensitySeries] = {}
+        self._starts: dict[tuple, float] = {}
+
+    def _key(self, path: str, *args) -> tuple:
+        return (path, os.stat(path).st_mtime_ns, *args)
+
+    def _snapshot(self, when: float) -> str:
+        if not os.path.isdir(self.path):
+            return self.path
+        snapshots = []
+        for entry in sorted(os.scandir(self.path), key=lambda e: e.name):
+            if entry.is_file() and entry.name.lower().endswith(_EXTENSIONS):
+                key = self._key(entry.path)
+                if key not in self._starts:
+                    first = read_forecast_file(entry.path, limit=1)
+                    self._starts[key] = float(first.times[0])
+                snapshots.append((self._starts[key], entry.path))
+        if not snapshots:
+            raise ValueError(f"No forecast files in {self.path}")
+        snapshots.sort(key=lambda s: s[0])
+        # Most recent snapshot started at the time of the request, or
+        # the first snapshot if all of them start later
+        starts = [start for start, _ in snapshots]
+        n = max(int(np.searchsorted(starts, when, "right")) - 1, 0)
+        return snapshots[n][1]
+
+    def request_url(self, timestamp: datetime, location: str) -> str:
+        """Return the URL of the file the forecast for ``location`` is
+        read from, if requested at ``timestamp``.
+        """
+        when = epoch_seconds(self.replay_from or timestamp)
+        return "file://" + os.path.abspath(self._snapshot(when))
+
+    def load(self, timestamp: datetime, location: str) -> CarbonIntensitySeries:
+        """Return the forecast for ``location``, as if requested at
+        ``timestamp``, or at the replayed time shifted to ``timestamp``.
+
+        :raises InvalidLocationError: If the forecast file only has
+            data points for other locations.
+        """
+        when = epoch_seconds(self.replay_from or timestamp)
+        path = self._snapshot(when)
+        key = self._key(path, location.strip().upper())
+        if key not in self._forecasts:
+            self._forecasts[key] = read_forecast_file(path, location)
+        forecast = self._forecasts[key]
+        if self.replay_from is None:
+            return forecast
+        shift = round(epoch_seconds(timestamp) - when)
+        return CarbonIntensitySeries(
+            forecast.times + shift, forecast.values, forecast.tzinfo
+        )
+
+
+def local_api_interface(
+    path: str, replay_from: Optional[datetime] = None, max_duration: int = 2820
+) -> APIInterface:
+    """Return an :py:class:`APIInterface
+    <cats.CI_api_interface.APIInterface>` reading forecasts from local
+    files, see :py:class:`LocalForecast`.
+
+    :param max_duration: Maximum job duration in minutes, defaulting
+        to that of the carbonintensity.org.uk API, as for forecasts
+        archived from this API.
+    """
+    forecast = LocalForecast(path, replay_from)
+    return APIInterface(
+        get_request_url=forecast.request_url,
+        parse_response_data=read_forecast_file,
+        max_duration=max_duration,
+        load_forecast=forecast.load,
+    )
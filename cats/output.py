@@ -5,6 +5,7 @@ from typing import Optional
 
 from .carbonFootprint import Estimates
 from .forecast import CarbonIntensityAverageEstimate
+from .placement import Placement
 
 @dataclasses.dataclass
 class CATSOutput:
@@ -22,6 +23,16 @@ class CATSOutput:
     countryISO3: str
     emmissionEstimate: Optional[Estimates] = None
     colour: bool = False
+    carbonIntensityRanked: Optional[list[CarbonIntensityAverageEstimate]] = None
+    carbonIntensityByDuration: Optional[
+        dict[int, Optional[CarbonIntensityAverageEstimate]]
+    ] = None
+    carbonIntensitySegments: Optional[list[CarbonIntensityAverageEstimate]] = None
+    carbonIntensityBatch: Optional[list[Optional[CarbonIntensityAverageEstimate]]] = (
+        None
+    )
+    carbonIntensityPlacements: Optional[list[Placement]] = None
+    forecastStale: Optional[bool] = None  # whether a cached forecast was used
 
     def __str__(self) -> str:
         if self.colour:
@@ -49,22 +60,80 @@ Best job start time                       = {col_dt_opt}{self.carbonIntensityOpt
 Carbon intensity if job started now       = {col_ci_now}{self.carbonIntensityNow.value:.2f} gCO2eq/kWh{col_normal}
 Carbon intensity at optimal time          = {col_ci_opt}{self.carbonIntensityOptimal.value:.2f} gCO2eq/kWh{col_normal}"""
 
+        if self.forecastStale:
+            out += "\nWarning: the current forecast is unavailable, using a stale one"
+
         if self.emmissionEstimate:
             out += f"""
 Estimated emissions if job started now    = {col_ee_now}{self.emmissionEstimate.now}{col_normal}
 Estimated emissions at optimal time       = {col_ee_opt}{self.emmissionEstimate.best} (- {self.emmissionEstimate.savings}){col_normal}"""
 
+        if self.carbonIntensityRanked:
+            out += "\nBest job start times (carbon intensity):"
+            for rank, ci in enumerate(self.carbonIntensityRanked, start=1):
+                out += f"\n{rank:>4}. {col_dt_opt}{ci.start:%Y-%m-%d %H:%M:%S}{col_normal} ({ci.value:.2f} gCO2eq/kWh)"
+
+        if self.carbonIntensityByDuration:
+            out += "\nBest job start time by job duration (carbon intensity):"
+            for duration, best in self.carbonIntensityByDuration.items():
+                if best is None:
+                    out += f"\n{duration:>6} min: no forecast available"
+                else:
+                    out += f"\n{duration:>6} min: {col_dt_opt}{best.start:%Y-%m-%d %H:%M:%S}{col_normal} ({best.value:.2f} gCO2eq/kWh)"
+
+        if self.carbonIntensitySegments:
+            out += "\nJob segments (carbon intensity):"
+            for ci in self.carbonIntensitySegments:
+                out += f"\n    {col_dt_opt}{ci.start:%Y-%m-%d %H:%M:%S} - {ci.end:%Y-%m-%d %H:%M:%S}{col_normal} ({ci.value:.2f} gCO2eq/kWh)"
+
+        if self.carbonIntensityBatch:
+            out += "\nBatch job start times (carbon intensity):"
+            for n, window in enumerate(self.carbonIntensityBatch, start=1):
+                if window is None:
+                    out += f"\n{n:>4}. no capacity available"
+                else:
+                    out += f"\n{n:>4}. {col_dt_opt}{window.start:%Y-%m-%d %H:%M:%S}{col_normal} ({window.value:.2f} gCO2eq/kWh)"
+
+        if self.carbonIntensityPlacements:
+            out += "\nBest job start time by location (carbon intensity):"
+            for p in self.carbonIntensityPlacements:
+                out += f"\n{p.location:>8}: {col_dt_opt}{p.window.start:%Y-%m-%d %H:%M:%S}{col_normal} ({p.window.value:.2f} gCO2eq/kWh"
+                if p.emissions is not None:
+                    out += f", {p.emissions:.2f} gCO2eq"
+                out += ")"
+
         logging.info("Use '--format=json' to get this in machine readable format")
         return out
 
     def to_json(self, dateformat: str = "", **kwargs) -> str:
         data = dataclasses.asdict(self)
-        for ci in ["carbonIntensityNow", "carbonIntensityOptimal"]:
+        # Only report ranked windows, windows by duration, job
+        # segments, batch job windows, placements and forecast
+        # staleness when requested
+        for key in [
+            "carbonIntensityRanked",
+            "carbonIntensityByDuration",
+            "carbonIntensitySegments",
+            "carbonIntensityBatch",
+            "carbonIntensityPlacements",
+            "forecastStale",
+        ]:
+            if data[key] is None:
+                del data[key]
+        estimates = [data["carbonIntensityNow"], data["carbonIntensityOptimal"]]
+        estimates += data.get("carbonIntensityRanked", [])
+        estimates += data.get("carbonIntensitySegments", [])
+        estimates += [
+            ci for ci in data.get("carbonIntensityByDuration", {}).values() if ci
+        ]
+        estimates += [ci for ci in data.get("carbonIntensityBatch", []) if ci]
+        estimates += [p["window"] for p in data.get("carbonIntensityPlacements", [])]
+        for ci in estimates:
             if dateformat == "":
-                data[ci]["start"] = data[ci]["start"].isoformat()
-                data[ci]["end"] = data[ci]["end"].isoformat()
+                ci["start"] = ci["start"].isoformat()
+                ci["end"] = ci["end"].isoformat()
             else:
-                data[ci]["start"] = data[ci]["start"].strftime(dateformat)
-                data[ci]["end"] = data[ci]["end"].strftime(dateformat)
+                ci["start"] = ci["start"].strftime(dateformat)
+                ci["end"] = ci["end"].strftime(dateformat)
 
         return json.dumps(data, **kwargs)
\ No newline at end of file
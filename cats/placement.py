@@ -0,0 +1,121 @@
+"""This module exports a function :py:func:`rank_placements
+<cats.placement.rank_placements>` that chooses where, among several
+candidate sites, and when to run a job so that its emissions are
+lowest.
+
+Each site has its own location, and so carbon intensity forecast, as
+well as its own PUE and job power.  Emissions of a window at a site
+are proportional to the window average carbon intensity, weighted by
+the site PUE and job power (see :py:func:`get_footprint_reduction_estimate
+<cats.carbonFootprint.get_footprint_reduction_estimate>`).  The
+windows of all sites are ranked together, from the arrays of window
+averages computed by :py:class:`WindowedForecast
+<cats.forecast.WindowedForecast>`.
+"""
+
+from collections.abc import Mapping
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Union
+
+import numpy as np
+
+from .carbonFootprint import PowerCurve, mean_power_fraction
+from .forecast import (
+    CarbonIntensityAverageEstimate,
+    CarbonIntensityPointEstimate,
+    CarbonIntensitySeries,
+    WindowedForecast,
+)
+
+__all__ = ["Site", "Placement", "rank_placements"]
+
+
+@dataclass
+class Site:
+    """A candidate site to run a job.  If the job power is unknown,
+    sites are compared by carbon intensity weighted by PUE only.
+    """
+
+    location: str
+    PUE: float = 1.0
+    power: Optional[float] = None  # nominal job power, in W
+    power_curve: Optional[PowerCurve] = None
+
+
+@dataclass
+class Placement:
+    """Best job window at a site, and corresponding job emissions in
+    gCO2eq, or None if the job power at the site is unknown.
+    """
+
+    location: str
+    window: CarbonIntensityAverageEstimate
+    emissions: Optional[float] = None
+
+
+def rank_placements(
+    sites: list[Site],
+    forecasts: Mapping[
+        str, Union[CarbonIntensitySeries, list[CarbonIntensityPointEstimate]]
+    ],
+    duration: int,  # in minutes
+    start: datetime,
+    max_window_minutes: Optional[int] = None,
+    end_constraint: Optional[datetime] = None,
+) -> list[Placement]:
+    """Return the best window at each site, given the forecast for
+    each site location, ordered by increasing emissions.  The first
+    placement is the best (location, start time) pair over all sites.
+
+    :raises ValueError: If job power is given for some sites only, or
+        the forecast for a site does not cover the job duration.
+    """
+    if not sites:
+        return []
+    if len({site.power is None for site in sites}) > 1:
+        raise ValueError("Job power must be given for all sites or none")
+
+    windowed = []  # windowed forecast of each site
+    weights = np.empty(len(sites))  # energy of the job at each site
+    for n, site in enumerate(sites):
+        wf = WindowedForecast(
+            forecasts[site.location],
+            duration,
+            start,
+            max_window_minutes=max_window_minutes,
+            end_constraint=end_constraint,
+            power_curve=site.power_curve,
+        )
+        if len(wf) == 0:
+            raise ValueError(
+                f"No start time satisfies the constraints at {site.location}"
+            )
+        windowed.append(wf)
+        # energy in kWh, see get_footprint_reduction_estimate()
+        weights[n] = (
+            site.PUE
+            * (duration / 60)
+            * (1.0 if site.power is None else site.power)
+            * mean_power_fraction(site.power_curve, duration)
+            / 1000
+        )
+
+    # Windows of all sites are laid out in a single array of emissions,
+    # sorted by site then emissions, so that the best window of each
+    # site comes first in its block.
+    counts = np.array([len(wf) for wf in windowed])
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    emissions = np.concatenate([wf._averages[: len(wf)] for wf in windowed])
+    emissions *= np.repeat(weights, counts)
+    site_index = np.repeat(np.arange(len(sites)), counts)
+    best = np.lexsort((np.arange(len(emissions)), emissions, site_index))[offsets]
+
+    return [
+        Placement(
+            location=sites[n].location,
+            window=windowed[n][int(best[n] - offsets[n])],
+            emissions=None if sites[n].power is None else float(emissions[best[n]]),
+        )
+        for n in np.lexsort((np.arange(len(sites)), emissions[best]))
+    ]
@@ -0,0 +1,315 @@
+"""This module exports a class :py:class:`Planner
+<cats.planner.Planner>` to plan jobs from Python, for instance from a
+long running service or a workflow engine plugin, rather than by
+running ``cats``.
+
+A planner reads the configuration file and sets up the forecast API
+once, and plans each job with :py:meth:`Planner.plan`, which returns a
+:py:class:`CATSOutput <cats.output.CATSOutput>` as ``cats`` reports
+it::
+
+    from cats import Planner
+
+    planner = Planner(config="cats_config.yml")
+    output = planner.plan(90, "OX1", profile="my_gpu_profile")
+    print(output.carbonIntensityOptimal.start)
+
+Forecasts are fetched as by ``cats`` (see :py:func:`get_CI_forecast
+<cats.CI_api_query.get_CI_forecast>`), through the HTTP session and
+forecast caches shared by all planners of the process, so that
+planning a job on a cached forecast makes no request.  Jobs are
+planned by :py:func:`plan_job`, as by ``cats``, and profiles are read
+once by each planner.  Errors are raised rather than printed:
+:py:class:`InvalidLocationError
+<cats.CI_api_interface.InvalidLocationError>` for an unknown location,
+:py:class:`OSError` if the forecast cannot be fetched or the location
+looked up from the IP address, and :py:class:`ValueError` for invalid
+job parameters or configuration.
+"""
+
+from argparse import Namespace
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+from typing import Any, Optional, Union
+
+from .carbonFootprint import (
+    PowerCurve,
+    get_footprint_reduction_estimate,
+    mean_power_fraction,
+)
+from .CI_api_interface import APIInterface
+from .CI_api_query import REQUEST_TIMEOUT, get_CI_forecast, get_CI_forecast_or_stale
+from .cli import earliest_start, parse_time_constraint, validate_window_constraints
+from .configure import (
+    CI_API_from_config_or_args,
+    config_from_file,
+    get_job_config,
+    get_location_from_config_or_args,
+)
+from .forecast import (
+    CarbonIntensityPointEstimate,
+    CarbonIntensitySeries,
+    WindowedForecast,
+    best_windows_by_duration,
+)
+from .output import CATSOutput
+from .window_cache import WindowCache
+
+__all__ = ["Planner", "plan_job"]
+
+# Best windows of the jobs planned by the process
+_window_cache = WindowCache()
+
+
+def _time(value: Union[datetime, str, None]) -> Optional[datetime]:
+    if isinstance(value, str):
+        return parse_time_constraint(value)
+    return value
+
+
+def plan_job(
+    forecast: Union[CarbonIntensitySeries, list[CarbonIntensityPointEstimate]],
+    duration: int,
+    location: str,
+    start: datetime,
+    *,
+    max_window: int = 2820,
+    end_constraint: Optional[datetime] = None,
+    power_curve: Optional[PowerCurve] = None,
+    top: Optional[int] = None,
+    min_gap: Optional[int] = None,
+    durations: Optional[list[int]] = None,
+    exact_start: Optional[str] = None,
+    PUE: Optional[float] = None,
+    jobinfo: Optional[list[tuple[int, float]]] = None,
+    window_cache: Optional[WindowCache] = None,
+) -> CATSOutput:
+    """Return the best time to start a job on a forecast, as ``cats``
+    reports it.  This is the planning step shared by ``cats`` and
+    :py:meth:`Planner.plan`.
+
+    :param duration: Job duration in minutes.
+    :param start: Earliest job start time, usually the current time.
+    :param power_curve: Power curve weighting the carbon intensity over
+        the job duration.
+    :param PUE: The job emissions are estimated if ``PUE`` and
+        ``jobinfo`` are given, see :py:func:`get_footprint_reduction_estimate
+        <cats.carbonFootprint.get_footprint_reduction_estimate>`.
+    :param window_cache: Cache of the best windows, defaulting to a
+        cache kept in memory by the process, see
+        :py:class:`WindowCache <cats.window_cache.WindowCache>`.
+    :raises ValueError: If the forecast does not cover the job.
+
+    Other parameters are those of the ``cats`` options with the same
+    name.
+    """
+    if window_cache is None:
+        window_cache = _window_cache
+    gap = timedelta(minutes=min_gap) if min_gap else None
+    now_avg, ranked = window_cache.windows(
+        forecast,
+        duration,
+        start,
+        max_window_minutes=max_window,
+        end_constraint=end_constraint,
+        power_curve=power_curve,
+        k=top or 1,
+        min_gap=gap,
+    )
+    best_avg = ranked[0]
+    if exact_start:
+        wf = WindowedForecast(
+            forecast,
+            duration,
+            start=start,
+            max_window_minutes=max_window,
+            end_constraint=end_constraint,
+            power_curve=power_curve,
+        )
+        best_avg = wf.optimal(timedelta(**{f"{exact_start}s": 1}))
+
+    output = CATSOutput(now_avg, best_avg, location, "GBR")
+    if top:
+        output.carbonIntensityRanked = ranked
+    if durations:
+        output.carbonIntensityByDuration = best_windows_by_duration(
+            forecast,
+            durations,
+            start=start,
+            max_window_minutes=max_window,
+            end_constraint=end_constraint,
+            power_curve=power_curve,
+        )
+    if PUE is not None and jobinfo is not None:
+        output.emmissionEstimate = get_footprint_reduction_estimate(
+            PUE=PUE,
+            jobinfo=jobinfo,
+            runtime=timedelta(minutes=duration),
+            average_best_ci=best_avg.value,
+            average_now_ci=now_avg.value,
+            power_fraction=mean_power_fraction(power_curve, duration),
+        )
+    return output
+
+
+class Planner:
+    """Plan jobs with the same configuration and forecast API.
+
+    :param api: Forecast API, as the ``--api`` option of ``cats``.
+        Defaults to the ``api`` entry of the configuration.
+    :param config: Path to a configuration file, or the configuration
+        itself.  Defaults to the configuration file used by ``cats``.
+    :param location: Location of jobs planned without one.  Defaults
+        to the ``location`` entry of the configuration, or to the
+        location of the IP address, looked up on the first such job.
+    :param timeout: Timeout of forecast API requests in seconds.
+    :param replay_from: Replay local forecasts as if requested at this
+        time, as the ``--replay-from`` option of ``cats``.
+    :param max_stale: If given, use a cached forecast fetched up to
+        this number of minutes ago if the current forecast is not
+        cached, as the ``--max-stale`` option of ``cats``.
+    """
+
+    def __init__(
+        self,
+        api: Optional[str] = None,
+        config: Union[str, Mapping[str, Any], None] = None,
+        location: Optional[str] = None,
+        timeout=None,
+        replay_from: Union[datetime, str, None] = None,
+        max_stale: Optional[int] = None,
+    ):
+        if config is None or isinstance(config, str):
+            config = config_from_file(configpath=config)
+        self.config = dict(config or {})
+        self._args = Namespace(
+            api=api, location=location, replay_from=_time(replay_from), sites=None
+        )
+        self.api_interface: APIInterface = CI_API_from_config_or_args(
+            self._args, self.config
+        )
+        self.timeout = timeout or REQUEST_TIMEOUT
+        self.max_stale = max_stale
+        self._location: Optional[str] = None
+        # Job information and power curve of each profile, as read by
+        # get_job_config()
+        self._job_configs: dict[tuple, tuple] = {}
+
+    @property
+    def location(self) -> str:
+        """Location of jobs planned without one."""
+        if self._location is None:
+            self._location = get_location_from_config_or_args(self._args, self.config)
+        return self._location
+
+    def forecast(self, location: Optional[str] = None) -> CarbonIntensitySeries:
+        """Return the current forecast for a location, fetching it if
+        it is not cached.
+        """
+        series, _ = self._forecast(location or self.location)
+        return series
+
+    def _forecast(self, location: str) -> tuple[CarbonIntensitySeries, Optional[bool]]:
+        if self.max_stale is None:
+            return get_CI_forecast(location, self.api_interface, self.timeout), None
+        return get_CI_forecast_or_stale(
+            location, self.api_interface, self.max_stale * 60, self.timeout
+        )
+
+    def _job_config(
+        self,
+        profile: Optional[str],
+        footprint: bool,
+        cpu: Optional[int],
+        gpu: Optional[int],
+        memory: Optional[int],
+    ) -> tuple[
+        Optional[list[tuple[int, float]]], Optional[float], Optional[PowerCurve]
+    ]:
+        key = (profile, footprint, cpu, gpu, memory)
+        if key not in self._job_configs:
+            args = Namespace(
+                profile=profile, footprint=footprint, cpu=cpu, gpu=gpu, memory=memory
+            )
+            self._job_configs[key] = get_job_config(args, self.config)
+        return self._job_configs[key]
+
+    def plan(
+        self,
+        duration: int,
+        location: Optional[str] = None,
+        *,
+        window: int = 2820,
+        start: Union[datetime, str, None] = None,
+        end: Union[datetime, str, None] = None,
+        profile: Optional[str] = None,
+        footprint: bool = False,
+        cpu: Optional[int] = None,
+        gpu: Optional[int] = None,
+        memory: Optional[int] = None,
+        top: Optional[int] = None,
+        min_gap: Optional[int] = None,
+        durations: Optional[list[int]] = None,
+        exact_start: Optional[str] = None,
+        now: Optional[datetime] = None,
+        forecast: Union[
+            CarbonIntensitySeries, list[CarbonIntensityPointEstimate], None
+        ] = None,
+    ) -> CATSOutput:
+        """Return the best time to start a job, as ``cats`` reports it.
+
+        Parameters are those of the ``cats`` options with the same
+        name, times being given as datetimes or strings.
+
+        :param duration: Job duration in minutes.
+        :param location: Job location, defaulting to :py:attr:`location`.
+        :param start: Earliest job start time, as ``--start-window``.
+        :param end: Latest job start time, as ``--end-window``.
+        :param profile: Profile of the configuration, whose power curve
+            weights the carbon intensity over the job duration.
+        :param footprint: Estimate the job emissions, from the profile
+            and the number of ``cpu``, ``gpu`` and ``memory`` in GB.
+        :param now: Time the job is planned from, defaulting to the
+            current time.
+        :param forecast: Forecast to plan the job on, defaulting to the
+            current forecast for the location.
+        :raises ValueError: If job parameters or the configuration are
+            invalid, or the forecast does not cover the job.
+        """
+        if duration <= 0:
+            raise ValueError("Job duration must be a positive number of minutes")
+        start_constraint, end_constraint, max_window = validate_window_constraints(
+            _time(start), _time(end), window
+        )
+        if duration > min(self.api_interface.max_duration, max_window):
+            raise ValueError(
+                f"Job duration ({duration} minutes) exceeds the window or the maximum "
+                f"duration of the API ({self.api_interface.max_duration} minutes)"
+            )
+
+        jobinfo, PUE, power_curve = self._job_config(
+            profile, footprint, cpu, gpu, memory
+        )
+
+        location = location or self.location
+        stale = None
+        if forecast is None:
+            forecast, stale = self._forecast(location)
+
+        output = plan_job(
+            forecast,
+            duration,
+            location,
+            earliest_start(now or datetime.now().astimezone(), start_constraint),
+            max_window=max_window,
+            end_constraint=end_constraint,
+            power_curve=power_curve,
+            top=top,
+            min_gap=min_gap,
+            durations=durations,
+            exact_start=exact_start,
+            PUE=PUE,
+            jobinfo=jobinfo,
+        )
+        output.forecastStale = stale
+        return output
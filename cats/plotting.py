@@ -8,6 +8,8 @@ try:
 except ImportError:
     have_matplotlib = False
 
+from .forecast import as_series, epoch_seconds
+
 
 def plotplan(CI_forecast, output):
     """
@@ -18,9 +20,9 @@ def plotplan(CI_forecast, output):
         print("e.g. \"pip install 'climate-aware-task-scheduler[plots]'\"")
         return
 
-    # Just for now pull the CI forecast apart... probably belongs as method...
-    values = []
-    times = []
+    CI_forecast = as_series(CI_forecast)
+    values = CI_forecast.values
+    times = CI_forecast.datetimes()
     now_values = []
     now_times = []
     opt_values = []
@@ -32,22 +34,16 @@ def plotplan(CI_forecast, output):
     now_times.append(output.carbonIntensityNow.start)
     now_values.append(output.carbonIntensityNow.start_value)
 
-    # Build the three time series of point from the API
-    for point in CI_forecast:
-        values.append(point.value)
-        times.append(point.datetime)
-        if (
-            point.datetime >= output.carbonIntensityOptimal.start
-            and point.datetime <= output.carbonIntensityOptimal.end
-        ):
-            opt_values.append(point.value)
-            opt_times.append(point.datetime)
-        if (
-            point.datetime >= output.carbonIntensityNow.start
-            and point.datetime <= output.carbonIntensityNow.end
-        ):
-            now_values.append(point.value)
-            now_times.append(point.datetime)
+    # Select the points from the API within the now and optimal windows
+    for window, window_times, window_values in [
+        (output.carbonIntensityOptimal, opt_times, opt_values),
+        (output.carbonIntensityNow, now_times, now_values),
+    ]:
+        in_window = (CI_forecast.times >= epoch_seconds(window.start)) & (
+            CI_forecast.times <= epoch_seconds(window.end)
+        )
+        window_values.extend(values[in_window])
+        window_times.extend(t for t, inside in zip(times, in_window) if inside)
 
     # For our now and optimal series, end with the end data (interpolated)
     opt_times.append(output.carbonIntensityOptimal.end)
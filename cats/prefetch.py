@@ -0,0 +1,142 @@
+"""This module implements the ``cats prefetch`` command, that fetches
+the carbon intensity forecasts of configured locations just after
+each half hour, when the forecast period of the carbonintensity.org.uk
+API changes (see :py:func:`ciuk_period
+<cats.CI_api_interface.ciuk_period>`).  Forecasts are saved to the
+caches shared by all processes of the user (see :py:func:`get_CI_forecast
+<cats.CI_api_query.get_CI_forecast>`), so that ``cats`` runs find the
+current forecast cached rather than fetching it.
+
+The command runs until interrupted, or fetches forecasts once with
+``--once``, for instance from a systemd timer or cron job.
+"""
+
+import logging
+import math
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from .CI_api_query import MAX_CONNECTIONS, REQUEST_TIMEOUT, get_CI_forecast
+from .configure import (
+    CI_API_from_config_or_args,
+    config_from_file,
+    get_location_from_config_or_args,
+)
+
+__all__ = ["main", "next_run", "prefetch"]
+
+# Forecast period of the carbonintensity.org.uk API, in seconds
+PERIOD = 1800
+
+
+def next_run(now: float, delay: float) -> float:
+    """Return the time of the first run after ``now``, ``delay``
+    seconds after a half hour, in seconds since the epoch.
+    """
+    return (math.floor((now - delay) / PERIOD) + 1) * PERIOD + delay
+
+
+def prefetch(
+    locations: list[str], CI_API_interface, timeout=REQUEST_TIMEOUT
+) -> dict[str, Optional[Exception]]:
+    """Fetch the current forecast of each location concurrently, and
+    return the error raised for each location, or None if its forecast
+    was fetched.
+    """
+
+    def fetch(location: str) -> Optional[Exception]:
+        try:
+            get_CI_forecast(location, CI_API_interface, timeout)
+        except Exception as e:
+            return e
+        return None
+
+    if not locations:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(MAX_CONNECTIONS, len(locations))) as pool:
+        return dict(zip(locations, pool.map(fetch, locations)))
+
+
+def parse_arguments() -> ArgumentParser:
+    parser = ArgumentParser(
+        prog="cats prefetch",
+        description="Fetch the carbon intensity forecasts of configured locations "
+        "just after each half hour, so that cats finds them cached.",
+    )
+    parser.add_argument(
+        "-a",
+        "--api",
+        type=str,
+        help="API to use to obtain carbon intensity forecasts. Overrides `config.yml`.",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        help="Path to a configuration file. Default: as for cats.",
+    )
+    parser.add_argument(
+        "-l",
+        "--location",
+        type=str,
+        help="Location to fetch forecasts for. Overrides `config.yml`.",
+    )
+    parser.add_argument(
+        "--sites",
+        type=lambda s: [loc.strip() for loc in s.split(",") if loc.strip()],
+        help="Comma separated list of locations to fetch forecasts for. "
+        "Default: the locations of the `sites` entry of `config.yml`, if any, "
+        "or the location used by cats.",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Fetch forecasts once and exit, for instance from a systemd timer.",
+    )
+    parser.add_argument(
+        "--delay",
+        type=float,
+        default=90,
+        help="Number of seconds after each half hour to fetch forecasts. Default: 90.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="Timeout of requests to the carbon intensity forecast API, in seconds, "
+        "including retries.",
+    )
+    return parser
+
+
+def main(arguments=None) -> int:
+    args = parse_arguments().parse_args(arguments)
+    config = config_from_file(configpath=args.config)
+    try:
+        CI_API_interface = CI_API_from_config_or_args(args, config)
+        locations = args.sites or list(config.get("sites") or {})
+        if not locations:
+            locations = [get_location_from_config_or_args(args, config)]
+    except (ValueError, OSError) as e:
+        logging.error(f"Error: {e}")
+        return 1
+    timeout = args.timeout or REQUEST_TIMEOUT
+
+    try:
+        while True:
+            errors = prefetch(locations, CI_API_interface, timeout)
+            for location, error in errors.items():
+                if error is not None:
+                    logging.error(f"Could not fetch forecast for {location}: {error}")
+            fetched = [loc for loc, error in errors.items() if error is None]
+            print(
+                f"cats prefetch: fetched forecasts for {len(fetched)} of "
+                f"{len(locations)} locations at {time.strftime('%Y-%m-%d %H:%M:%S')}",
+                flush=True,
+            )
+            if args.once:
+                return 0 if len(fetched) == len(locations) else 1
+            now = time.time()
+            time.sleep(next_run(now, args.delay) - now)
+    except KeyboardInterrupt:
+        return 0
@@ -0,0 +1,80 @@
+"""This module exports a class :py:class:`RegionIndex
+<cats.region_index.RegionIndex>` mapping locations to the forecast
+regions they belong to, such as UK outward postcodes to one of the
+regions of carbonintensity.org.uk.
+
+Many locations share the same region forecast.  Once the region of a
+location is known, its forecast is taken from the forecast for all
+regions, fetched once per forecast period and shared by all
+locations, rather than fetched for each location (see
+:py:func:`get_CI_forecast <cats.CI_api_query.get_CI_forecast>`).  The
+index is built as locations are first requested, and saved to a JSON
+file shared between processes.
+"""
+
+import json
+import logging
+from typing import Optional
+
+from ._fs import atomic_write_text, state_path
+
+__all__ = ["RegionIndex", "default_index_path"]
+
+
+def default_index_path() -> str:
+    """Return the path of the region index."""
+    return state_path("cats_regions.json")
+
+
+class RegionIndex:
+    """Index of the forecast region of locations, for each API.
+
+    :param path: Path of the JSON file the index is loaded from and
+        saved to.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_index_path()
+        self._regions: Optional[dict[str, int]] = None
+
+    @staticmethod
+    def _key(api: str, location: str) -> str:
+        return f"{api}:{location.strip().upper()}"
+
+    def _read(self) -> dict[str, int]:
+        try:
+            with open(self.path, "r") as f:
+                return dict(json.load(f))
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, TypeError) as e:
+            logging.warning(f"Ignoring invalid region index {self.path}: {e}")
+            return {}
+
+    def _load(self) -> dict[str, int]:
+        if self._regions is None:
+            self._regions = self._read()
+        return self._regions
+
+    def get(self, api: str, location: str) -> Optional[int]:
+        """Return the region of a location for an API, or None if
+        unknown.
+        """
+        return self._load().get(self._key(api, location))
+
+    def set(self, api: str, location: str, region: int):
+        """Record the region of a location for an API.
+
+        The index is read again before it is saved, so that regions
+        recorded meanwhile by other processes are kept.
+        """
+        key = self._key(api, location)
+        if self._load().get(key) == region:
+            return
+        regions = self._read()
+        regions[key] = region
+        self._regions = regions
+        try:
+            atomic_write_text(self.path, json.dumps(regions))
+        except OSError as e:
+            logging.warning(f"Could not save region index {self.path}: {e}")
@@ -0,0 +1,201 @@
+"""This module exports a function :py:func:`get_with_retries
+<cats.resilience.get_with_retries>` making HTTP requests to forecast
+and geolocation services, with timeouts and retries, and a class
+:py:class:`CircuitBreaker <cats.resilience.CircuitBreaker>` that
+stops requests to a host after repeated failures.
+
+Requests failing with a connection error, a timeout or a server error
+are retried after a random delay, growing exponentially with each
+attempt, so that processes retrying at the same time spread out
+rather than all retrying together.
+
+The state of the circuit breaker is saved to a JSON file, so that it
+is shared by all processes of the user (see :py:func:`state_dir
+<cats._fs.state_dir>`).
+Once requests to a host have failed ``threshold`` times in a row, the
+circuit is open: for the next ``reset_after`` seconds, requests to
+this host fail immediately with :py:class:`CircuitOpenError
+<cats.resilience.CircuitOpenError>`, unless the response is in the
+HTTP cache, and callers fall back to cached data.  The next request
+after that is attempted again, closing the circuit if it succeeds.
+"""
+
+import json
+import logging
+import random
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+from ._fs import atomic_write_text, state_path
+
+__all__ = [
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "default_breaker_path",
+    "get_with_retries",
+]
+
+# Number of retries of failed requests, and delay before the first one
+# in seconds, doubled for each following retry
+MAX_RETRIES = 2
+BACKOFF = 0.5
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of making a request to a host that failed
+    repeatedly.  Like the errors of requests, this is an
+    :py:class:`OSError`, and does not need requests to be imported.
+    """
+
+
+def default_breaker_path() -> str:
+    """Return the path of the circuit breaker state."""
+    return state_path("cats_circuit.json")
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+class CircuitBreaker:
+    """Circuit breaker for each host, shared between processes.
+
+    :param path: Path of the JSON file the state is saved to.
+    :param threshold: Number of failures in a row opening the circuit.
+    :param reset_after: Number of seconds the circuit stays open.
+    """
+
+    def __init__(
+        self, path: Optional[str] = None, threshold: int = 3, reset_after: float = 300
+    ):
+        self.path = path or default_breaker_path()
+        self.threshold = threshold
+        self.reset_after = reset_after
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r") as f:
+                return dict(json.load(f))
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, TypeError) as e:
+            logging.warning(f"Ignoring invalid circuit breaker state {self.path}: {e}")
+            return {}
+
+    def _save(self, state: dict):
+        try:
+            atomic_write_text(self.path, json.dumps(state))
+        except OSError as e:
+            logging.warning(f"Could not save circuit breaker state {self.path}: {e}")
+
+    def is_open(self, url: str) -> bool:
+        """Return whether requests to the host of ``url`` are stopped."""
+        host = self._load().get(_host(url), {})
+        return host.get("open_until", 0) > time.time()
+
+    def record_success(self, url: str):
+        state = self._load()
+        if state.pop(_host(url), None) is not None:
+            self._save(state)
+
+    def record_failure(self, url: str):
+        state = self._load()
+        host = state.setdefault(_host(url), {"failures": 0})
+        host["failures"] += 1
+        if host["failures"] >= self.threshold:
+            host["open_until"] = time.time() + self.reset_after
+            logging.warning(
+                f"Requests to {_host(url)} failed {host['failures']} times, "
+                f"not retrying for {self.reset_after:.0f} seconds"
+            )
+        self._save(state)
+
+
+def _failed(response) -> bool:
+    # Server errors and rate limiting may succeed later, other errors
+    # such as an invalid location will not
+    return response.status_code >= 500 or response.status_code == 429
+
+
+def _capped(timeout, end: Optional[float]):
+    # Request timeout, reduced to the time left before end if any
+    if end is None:
+        return timeout
+    left = max(end - time.monotonic(), 0.001)
+    if isinstance(timeout, tuple):
+        return tuple(left if t is None else min(t, left) for t in timeout)
+    return left if timeout is None else min(timeout, left)
+
+
+def get_with_retries(
+    session,
+    url: str,
+    headers: Optional[dict] = None,
+    timeout=None,
+    retries: int = MAX_RETRIES,
+    backoff: Optional[float] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    deadline: Optional[float] = None,
+):
+    """Return the response to a GET request, retrying failed requests
+    after a random delay between 0 and ``backoff * 2**n`` seconds
+    before the ``n``-th retry.
+
+    The response to the last attempt is returned, even if it is a
+    server error.
+
+    :param session: requests session, or the requests module.
+    :param timeout: Request timeout in seconds, see requests.
+    :param backoff: Delay before the first retry, defaulting to
+        :py:data:`BACKOFF`.
+    :param breaker: Circuit breaker recording failures, if any.
+    :param deadline: Maximum number of seconds spent on all attempts,
+        if any.  Retries are not made past this time, and their
+        timeout is reduced to the time left.
+    :raises CircuitOpenError: If the circuit is open for the host of
+        ``url``, and the response is not in the HTTP cache.
+    :raises requests.RequestException: If the last attempt fails with
+        a connection error or a timeout.
+    """
+    import requests
+
+    if breaker is not None and breaker.is_open(url):
+        import requests_cache
+
+        if isinstance(session, requests_cache.CachedSession):
+            # Responses in the HTTP cache need no request, any other is
+            # a 504 response
+            r = session.get(url, headers=headers, only_if_cached=True)
+            if r.status_code != 504:
+                return r
+        raise CircuitOpenError(f"Not retrying {_host(url)} after repeated failures")
+
+    backoff = BACKOFF if backoff is None else backoff
+    end = None if deadline is None else time.monotonic() + deadline
+    error: Optional[Exception] = None
+    for attempt in range(retries + 1):
+        if attempt > 0:
+            delay = random.uniform(0, backoff * 2 ** (attempt - 1))
+            if end is not None and time.monotonic() + delay >= end:
+                break
+            time.sleep(delay)
+        try:
+            r = session.get(
+                url,
+                headers=headers,
+                timeout=_capped(timeout, end) if attempt > 0 else timeout,
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+            continue
+        if not _failed(r):
+            if breaker is not None:
+                breaker.record_success(url)
+            return r
+        error = None
+    if breaker is not None:
+        breaker.record_failure(url)
+    if error is not None:
+        raise error
+    return r
@@ -2,6 +2,7 @@ import subprocess
 
 from typing import Optional
 
+from .forecast import CarbonIntensityAverageEstimate
 from .output import CATSOutput
 
 # To add a scheduler, add a date format here
@@ -55,3 +56,41 @@ def schedule_sbatch(output: CATSOutput, args: list[str]) -> Optional[str]:
     except subprocess.CalledProcessError as e:  # pragma: no cover
         return f"Scheduling with sbatch failed with code {e.returncode}, see output below:\n{e.output}"
 
+
+
+def schedule_sbatch_segments(
+    segments: list[CarbonIntensityAverageEstimate], args: list[str]
+) -> Optional[str]:
+    """Schedule an interruptible job as one sbatch(1) job per segment,
+    each starting at the segment start time, limited to the segment
+    duration and depending on the previous segment job.  Segment jobs
+    depend on any termination of the previous one (``afterany``), as
+    the previous segment usually ends by reaching its time limit.
+
+    :return: Error as a string, or None if successful
+    """
+    jobid = None
+    for segment in segments:
+        minutes = int((segment.end - segment.start).total_seconds() // 60)
+        sbatch_args = [
+            "sbatch",
+            "--parsable",
+            "--begin",
+            segment.start.strftime(SCHEDULER_DATE_FORMAT["sbatch"]),
+            "--time",
+            str(minutes),
+        ]
+        if jobid is not None:
+            sbatch_args += ["--dependency", f"afterany:{jobid}"]
+        try:
+            sbatch_output = subprocess.check_output([*sbatch_args, *args])
+        except FileNotFoundError:
+            return (
+                "No sbatch command found in PATH, ensure slurm is configured correctly"
+            )
+        except subprocess.CalledProcessError as e:
+            return f"Scheduling with sbatch failed with code {e.returncode}, see output below:\n{e.output}"
+        # --parsable output is "jobid[;cluster]"
+        jobid = sbatch_output.decode("utf-8").strip().split(";")[0]
+        print(f"Submitted batch job {jobid}")
+    return None
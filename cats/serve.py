@@ -0,0 +1,209 @@
+"""This module implements the ``cats serve`` command, a long running
+process answering ``cats`` queries over a Unix domain socket, and the
+client sending them.
+
+Each ``cats`` run otherwise pays the interpreter startup, imports,
+configuration parsing and forecast loading again.  The server keeps
+imported modules, parsed configuration files and loaded forecasts in
+memory, with their cumulative integrals (see
+:py:class:`ForecastCache <cats.forecast_cache.ForecastCache>`), and
+answers each query by running :py:func:`cats.cli.main` on the query
+arguments, so that answers are the same as those of ``cats``.
+
+``cats`` sends its query to the server when the ``CATS_SOCKET``
+environment variable gives the socket path, and runs the query itself
+if the server is not running.  Queries scheduling a command or
+plotting are always run by ``cats`` itself, so that commands are
+submitted from the environment of the caller.
+
+The protocol is one JSON object per line: a query
+``{"args": [...], "cwd": "...", "env": {...}}`` with the command line
+arguments, working directory and cats environment variables of the
+client, answered by ``{"status": 0, "stdout": "...", "stderr": "..."}``.
+
+This module only imports the standard library, so that the client
+starts quickly.
+"""
+
+import io
+import json
+import os
+import socket
+import socketserver
+import traceback
+from argparse import ArgumentParser
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Optional
+
+from ._fs import state_path
+
+__all__ = ["default_socket_path", "main", "query"]
+
+# Environment variables of the client used by cats
+CLIENT_ENVIRONMENT = ["CATS_CONFIG_FILE"]
+
+# Unix domain sockets are not available on Windows
+_UNIX_SOCKETS = hasattr(socket, "AF_UNIX")
+
+
+def default_socket_path() -> str:
+    """Return the default socket path, in the directory of the files
+    shared between the user's ``cats`` processes (see
+    :py:func:`cats._fs.state_dir`), or the ``CATS_SOCKET`` environment
+    variable if set.
+    """
+    return os.environ.get("CATS_SOCKET") or state_path("cats.sock")
+
+
+def query(
+    arguments: list[str], socket_path: Optional[str] = None, timeout: float = 60
+) -> tuple[int, str, str]:
+    """Send a query to the server, and return the exit status, standard
+    output and standard error of ``cats`` with these arguments.
+
+    :raises OSError: If the server is not running, or Unix domain
+        sockets are not available.
+    """
+    if not _UNIX_SOCKETS:
+        raise OSError("Unix domain sockets are not available on this platform")
+    request = {
+        "args": arguments,
+        "cwd": os.getcwd(),
+        "env": {name: os.environ.get(name) for name in CLIENT_ENVIRONMENT},
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path or default_socket_path())
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("cats server closed the connection")
+    response = json.loads(line)
+    return response["status"], response["stdout"], response["stderr"]
+
+
+def _set_environment(values: dict[str, Optional[str]]):
+    for name, value in values.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+
+def answer(request: dict) -> dict:
+    """Run ``cats`` with the arguments of a query, in the working
+    directory and environment of the client, and return the response.
+    """
+    from .cli import main as cats_main
+
+    stdout, stderr = io.StringIO(), io.StringIO()
+    cwd = os.getcwd()
+    client = request.get("env") or {}
+    # Queries are answered here, not sent to a server
+    overrides = {name: client.get(name) for name in CLIENT_ENVIRONMENT}
+    overrides["CATS_SOCKET"] = None
+    environment = {name: os.environ.get(name) for name in overrides}
+    try:
+        os.chdir(request.get("cwd") or cwd)
+        _set_environment(overrides)
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                status = cats_main(list(request["args"]))
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else int(e.code is not None)
+            except Exception:
+                traceback.print_exc()
+                status = 1
+    finally:
+        os.chdir(cwd)
+        _set_environment(environment)
+    return {"status": status, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            response = answer(request)
+        except (ValueError, KeyError, TypeError) as e:
+            response = {"status": 2, "stdout": "", "stderr": f"Invalid query: {e}\n"}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+# Not defined on Windows, where cats serve is not available
+if _UNIX_SOCKETS:
+
+    class PlanningServer(socketserver.UnixStreamServer):
+        """Server answering one query at a time, as queries change the
+        working directory and redirect standard output.
+        """
+
+        def __init__(self, socket_path: str):
+            if os.path.exists(socket_path):
+                # Remove the socket of a server no longer running
+                try:
+                    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                        sock.connect(socket_path)
+                except OSError:
+                    os.remove(socket_path)
+                else:
+                    raise OSError(
+                        f"A cats server is already listening on {socket_path}"
+                    )
+            super().__init__(socket_path, _Handler)
+            os.chmod(socket_path, 0o600)  # queries run as the server user
+
+        def server_close(self):
+            super().server_close()
+            try:
+                os.remove(self.server_address)
+            except OSError:
+                pass
+
+
+def parse_arguments() -> ArgumentParser:
+    parser = ArgumentParser(
+        prog="cats serve",
+        description="Answer cats queries over a Unix domain socket, keeping "
+        "configuration and forecasts in memory. cats sends its queries to the "
+        "server when the CATS_SOCKET environment variable gives the socket path.",
+    )
+    parser.add_argument(
+        "--socket",
+        help="Path of the Unix domain socket. Default: CATS_SOCKET if set, or "
+        "cats.sock in the cats-UID directory of the temporary directory.",
+    )
+    return parser
+
+
+def main(arguments=None) -> int:
+    args = parse_arguments().parse_args(arguments)
+    if not _UNIX_SOCKETS:
+        print("cats serve: Unix domain sockets are not available on this platform")
+        return 1
+    socket_path = args.socket or default_socket_path()
+    try:
+        server = PlanningServer(socket_path)
+    except OSError as e:
+        print(f"cats serve: {e}")
+        return 1
+    # Import the modules answering queries now rather than on the first one
+    from . import (  # noqa: F401
+        CI_api_query,
+        capacity,
+        carbonFootprint,
+        configure,
+        interruptible,
+        output,
+        placement,
+        schedulers,
+    )
+
+    print(f"cats serve: listening on {socket_path}", flush=True)
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
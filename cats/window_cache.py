@@ -0,0 +1,240 @@
+"""This module exports a class :py:class:`WindowCache
+<cats.window_cache.WindowCache>` that memoises the best job start
+times computed by :py:class:`WindowedForecast
+<cats.forecast.WindowedForecast>`, so that repeated queries on the same
+forecast are answered without integrating the forecast again.
+
+Jobs planned by ``cats`` and :py:class:`Planner
+<cats.planner.Planner>` go through a window cache (see
+:py:func:`plan_job <cats.planner.plan_job>`).  Results are keyed by
+the forecast content hash (see :py:meth:`CarbonIntensitySeries.digest
+<cats.forecast.CarbonIntensitySeries.digest>`) and the query
+parameters, the start time being rounded down to the minute.  Only results for the most recent forecast are kept: when
+a query is made on a different forecast, all cached results are
+dropped.  The number of cached results is bounded, the least recently
+used result being evicted first.
+
+Cached results can optionally be persisted to a JSON file, by default
+in the directory of files shared by the processes of the user (see
+:py:func:`state_dir <cats._fs.state_dir>`), as ``cats`` does, so that
+they are shared between successive runs of cats.
+"""
+
+import json
+import logging
+from collections import OrderedDict
+from dataclasses import replace
+from datetime import datetime, timedelta, tzinfo
+from typing import Optional, Union
+
+from ._fs import atomic_write_text, state_path
+from .carbonFootprint import PowerCurve
+from .forecast import (
+    CarbonIntensityAverageEstimate,
+    CarbonIntensityPointEstimate,
+    CarbonIntensitySeries,
+    WindowedForecast,
+    as_series,
+    epoch_seconds,
+)
+
+__all__ = ["WindowCache", "default_cache_path"]
+
+
+def default_cache_path() -> str:
+    """Return the path of the persisted window cache."""
+    return state_path("cats_windows.json")
+
+
+def _shifted(
+    estimate: CarbonIntensityAverageEstimate, shift: timedelta, tz: Optional[tzinfo]
+) -> CarbonIntensityAverageEstimate:
+    start, end = estimate.start + shift, estimate.end + shift
+    if tz is not None:
+        start, end = start.astimezone(tz), end.astimezone(tz)
+    return replace(estimate, start=start, end=end)
+
+
+def _estimate_to_list(estimate: CarbonIntensityAverageEstimate) -> list:
+    return [
+        estimate.value,
+        estimate.start.isoformat(),
+        estimate.end.isoformat(),
+        estimate.start_value,
+        estimate.end_value,
+    ]
+
+
+def _estimate_from_list(item: list) -> CarbonIntensityAverageEstimate:
+    value, start, end, start_value, end_value = item
+    return CarbonIntensityAverageEstimate(
+        value=value,
+        start=datetime.fromisoformat(start),
+        end=datetime.fromisoformat(end),
+        start_value=start_value,
+        end_value=end_value,
+    )
+
+
+class WindowCache:
+    """Bounded cache of the best windows of a forecast.
+
+    :param maxsize: Maximum number of cached query results.
+    :param path: Path of a JSON file the cache is loaded from and
+        saved to after each new result, or None to keep the cache in
+        memory only.
+    """
+
+    def __init__(self, maxsize: int = 128, path: Optional[str] = None):
+        if maxsize <= 0:
+            raise ValueError("Window cache size must be positive")
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._digest: Optional[str] = None  # forecast of cached results
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        if path is not None:
+            self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """Drop all cached results"""
+        self._digest = None
+        self._entries.clear()
+
+    def best(
+        self,
+        data: Union[CarbonIntensitySeries, list[CarbonIntensityPointEstimate]],
+        duration: int,  # in minutes
+        start: datetime,
+        max_window_minutes: Optional[int] = None,
+        end_constraint: Optional[datetime] = None,
+        power_curve: Optional[PowerCurve] = None,
+        k: int = 1,
+        min_gap: Optional[timedelta] = None,
+    ) -> list[CarbonIntensityAverageEstimate]:
+        """Return the k windows with the lowest average intensity, as
+        ``WindowedForecast(...).best(k, min_gap)`` would, computing
+        them only if the same query was not made on the same forecast
+        before, see :py:meth:`windows`.
+        """
+        _, ranked = self.windows(
+            data,
+            duration,
+            start,
+            max_window_minutes,
+            end_constraint,
+            power_curve,
+            k,
+            min_gap,
+        )
+        return ranked
+
+    def windows(
+        self,
+        data: Union[CarbonIntensitySeries, list[CarbonIntensityPointEstimate]],
+        duration: int,  # in minutes
+        start: datetime,
+        max_window_minutes: Optional[int] = None,
+        end_constraint: Optional[datetime] = None,
+        power_curve: Optional[PowerCurve] = None,
+        k: int = 1,
+        min_gap: Optional[timedelta] = None,
+    ) -> tuple[CarbonIntensityAverageEstimate, list[CarbonIntensityAverageEstimate]]:
+        """Return the window starting at ``start`` and the k windows
+        with the lowest average intensity, as ``wf[0]`` and
+        ``wf.best(k, min_gap)`` for ``wf = WindowedForecast(...)``,
+        computing them only if the same query was not made on the same
+        forecast before.
+
+        Queries are matched with ``start`` rounded down to the minute,
+        as the current time differs between runs: the windows of a
+        matching query are shifted to ``start``, their averages being
+        those of windows starting less than a minute apart.
+
+        :raises ValueError: As :py:class:`WindowedForecast
+            <cats.forecast.WindowedForecast>`, or if no window fits
+            the constraints.  Errors are not cached.
+        """
+        data = as_series(data)
+        digest = data.digest()
+        if digest != self._digest:
+            self._entries.clear()
+            self._digest = digest
+
+        key = json.dumps(
+            [
+                duration,
+                int(epoch_seconds(start) // 60),
+                start.tzinfo is None,
+                max_window_minutes,
+                end_constraint.isoformat() if end_constraint else None,
+                power_curve and [list(step) for step in power_curve],
+                k,
+                min_gap.total_seconds() if min_gap else None,
+            ]
+        )
+        try:
+            result = self._entries[key]
+        except KeyError:
+            pass
+        else:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            shift = timedelta(
+                seconds=epoch_seconds(start) - epoch_seconds(result[0].start)
+            )
+            now, *ranked = [_shifted(e, shift, start.tzinfo) for e in result]
+            return now, ranked
+
+        self.misses += 1
+        wf = WindowedForecast(
+            data,
+            duration,
+            start,
+            max_window_minutes=max_window_minutes,
+            end_constraint=end_constraint,
+            power_curve=power_curve,
+        )
+        if len(wf) == 0:
+            raise ValueError("No valid window for the job in the forecast")
+        # The window starting at start comes first
+        result = (wf[0], *wf.best(k, min_gap))
+        self._entries[key] = result
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        if self.path is not None:
+            self._save()
+        return result[0], list(result[1:])
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                saved = json.load(f)
+            entries = [
+                (key, tuple(_estimate_from_list(item) for item in result))
+                for key, result in saved["entries"]
+            ]
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring invalid window cache {self.path}: {e}")
+            return
+        self._digest = saved.get("digest")
+        self._entries = OrderedDict(entries[-self.maxsize :])
+
+    def _save(self):
+        saved = {
+            "digest": self._digest,
+            "entries": [
+                [key, [_estimate_to_list(e) for e in result]]
+                for key, result in self._entries.items()
+            ],
+        }
+        try:
+            atomic_write_text(self.path, json.dumps(saved))
+        except OSError as e:
+            logging.warning(f"Could not save window cache {self.path}: {e}")
@@ -1,13 +1,33 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+from zoneinfo import ZoneInfo
+
 import pytest
+import requests
 
-import cats
-from cats.CI_api_interface import API_interfaces, InvalidLocationError
-from cats.forecast import CarbonIntensityPointEstimate
+import cats.CI_api_query
+from cats.CI_api_interface import (
+    API_interfaces,
+    APIInterface,
+    InvalidLocationError,
+    ciuk_parse_bulk_response_data,
+    ciuk_parse_response_data,
+    parse_utc_timestamps,
+)
+from cats.forecast import CarbonIntensityPointEstimate, CarbonIntensitySeries
+from cats.forecast_cache import ForecastCache
+from cats.region_index import RegionIndex
+from cats.resilience import CircuitBreaker, CircuitOpenError
 
 
-def test_api_call():
+def test_api_call(forecast_cache):
     """
-    This just checks the API call runs and returns a list of point estimates
+    This just checks the API call runs and returns a series of point estimates
 
     Also confirms that datetime objects are timezone aware, as per
     https://docs.python.org/3/library/datetime.html#determining-if-an-object-is-aware-or-naive
@@ -19,7 +39,7 @@ def test_api_call():
         "OX1 3QD", api_interface
     )
     assert response == response_full_postcode
-    assert isinstance(response, list)
+    assert isinstance(response, CarbonIntensitySeries)
     for item in response:
         assert isinstance(item, CarbonIntensityPointEstimate)
         assert (item.datetime.tzinfo is not None) and (
@@ -27,7 +47,7 @@ def test_api_call():
         )
 
 
-def test_bad_postcode():
+def test_bad_postcode(forecast_cache):
     api_interface = API_interfaces["carbonintensity.org.uk"]
 
     with pytest.raises(InvalidLocationError):
@@ -35,3 +55,383 @@ def test_bad_postcode():
 
     with pytest.raises(InvalidLocationError):
         cats.CI_api_query.get_CI_forecast("A", api_interface)
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, url):
+        self.url = url
+
+    def json(self):
+        return self.url
+
+
+FAKE_API = APIInterface(
+    get_request_url=lambda timestamp, location: location,
+    parse_response_data=lambda location: CarbonIntensitySeries(
+        times=[0, 1800], values=[len(location), len(location)]
+    ),
+    max_duration=30,
+)
+
+
+def test_get_session():
+    assert cats.CI_api_query.get_session() is cats.CI_api_query.get_session()
+
+
+@pytest.fixture
+def forecast_cache(tmp_path):
+    with (
+        patch("cats.CI_api_query.forecast_cache", ForecastCache(tmp_path)) as cache,
+        patch("cats.CI_api_query.region_index", RegionIndex(tmp_path / "regions")),
+        patch("cats.CI_api_query.breaker", CircuitBreaker(tmp_path / "circuit")),
+        patch("cats.resilience.BACKOFF", 0),
+    ):
+        yield cache
+
+
+@patch("cats.CI_api_query.get_session")
+def test_get_CI_forecast_cached(get_session, forecast_cache):
+    get_session.return_value.get.side_effect = lambda url, headers, timeout: (
+        FakeResponse(url)
+    )
+    forecast = cats.CI_api_query.get_CI_forecast("OX1", FAKE_API)
+    assert forecast_cache.load("OX1") == forecast
+    assert cats.CI_api_query.get_CI_forecast("OX1", FAKE_API) == forecast
+    assert get_session.return_value.get.call_count == 1
+
+
+@patch("cats.CI_api_query.get_session")
+def test_get_CI_forecasts(get_session, forecast_cache):
+    # Requests are concurrent: each one waits for all others to start
+    barrier = threading.Barrier(3, timeout=5)
+
+    def get(url, headers, timeout):
+        assert timeout == 2
+        barrier.wait()
+        return FakeResponse(url)
+
+    get_session.return_value.get.side_effect = get
+    forecasts = cats.CI_api_query.get_CI_forecasts(
+        ["OX1", "M15", "EH8", "OX1"], FAKE_API, timeout=2
+    )
+    assert list(forecasts) == ["OX1", "M15", "EH8"]
+    assert forecasts["EH8"].values.tolist() == [3, 3]
+    assert cats.CI_api_query.get_CI_forecasts([], FAKE_API) == {}
+
+
+@patch("cats.CI_api_query.get_session")
+def test_get_CI_forecasts_error(get_session, forecast_cache):
+    def get(url, headers, timeout):
+        if url == "M15":
+            raise requests.Timeout
+        return FakeResponse(url)
+
+    get_session.return_value.get.side_effect = get
+    with pytest.raises(requests.Timeout):
+        cats.CI_api_query.get_CI_forecasts(["OX1", "M15"], FAKE_API)
+
+
+def strptime_timestamps(timestamps):
+    "Reference timestamp parsing, one by one"
+    return [
+        datetime.strptime(t, "%Y-%m-%dT%H:%MZ").replace(tzinfo=timezone.utc).timestamp()
+        for t in timestamps
+    ]
+
+
+def test_parse_utc_timestamps():
+    start = datetime(2024, 2, 28, 22, 30, tzinfo=timezone.utc)
+    timestamps = [
+        (start + timedelta(minutes=30 * i)).strftime("%Y-%m-%dT%H:%MZ")
+        for i in range(96)
+    ]
+    parsed = parse_utc_timestamps(timestamps)
+    assert parsed.tolist() == strptime_timestamps(timestamps)
+    assert parse_utc_timestamps([]).tolist() == []
+
+    # Timestamps not of fixed width are parsed one by one
+    assert parse_utc_timestamps(["2024-1-5T10:00Z"]).tolist() == strptime_timestamps(
+        ["2024-1-5T10:00Z"]
+    )
+
+
+@pytest.mark.parametrize(
+    "timestamp",
+    [
+        "2023-13-04T12:30Z",
+        "2023-02-29T12:30Z",
+        "2023-05-04T24:00Z",
+        "2023-05-04T12:60Z",
+        "0000-05-04T12:30Z",
+        "2023-05-04 12:30Z",
+        "2023-05-04T12:30+",
+        "2023-05-04T1a:30Z",
+    ],
+)
+def test_parse_utc_timestamps_invalid(timestamp):
+    with pytest.raises(ValueError):
+        strptime_timestamps([timestamp])
+    with pytest.raises(ValueError):
+        parse_utc_timestamps(["2023-05-04T12:30Z", timestamp])
+
+
+def test_ciuk_parse_response_data():
+    response = {
+        "data": {
+            "data": [
+                {"from": "2023-05-04T12:30Z", "intensity": {"forecast": 120}},
+                {"from": "2023-05-04T13:00Z", "intensity": {"forecast": 100}},
+            ]
+        }
+    }
+    series = ciuk_parse_response_data(response)
+    assert series.datetimes() == [
+        datetime(2023, 5, 4, 12, 30, tzinfo=ZoneInfo("UTC")),
+        datetime(2023, 5, 4, 13, 0, tzinfo=ZoneInfo("UTC")),
+    ]
+    assert series.values.tolist() == [120, 100]
+    with pytest.raises(InvalidLocationError):
+        ciuk_parse_response_data({})
+
+
+def test_ciuk_parse_bulk_response_data():
+    response = {
+        "data": [
+            {
+                "from": "2023-05-04T12:30Z",
+                "regions": [
+                    {"regionid": 1, "intensity": {"forecast": 120}},
+                    {"regionid": 2, "intensity": {"forecast": 50}},
+                ],
+            },
+            {
+                "from": "2023-05-04T13:00Z",
+                "regions": [{"regionid": 1, "intensity": {"forecast": 100}}],
+            },
+        ]
+    }
+    forecasts = ciuk_parse_bulk_response_data(response)
+    assert list(forecasts) == [1]
+    assert forecasts[1] == ciuk_parse_response_data(
+        {
+            "data": {
+                "data": [
+                    {"from": "2023-05-04T12:30Z", "intensity": {"forecast": 120}},
+                    {"from": "2023-05-04T13:00Z", "intensity": {"forecast": 100}},
+                ]
+            }
+        }
+    )
+
+
+def ciuk_response(url):
+    "Response of the carbonintensity.org.uk API, with region 12 forecasts"
+    period = [{"from": "2023-05-04T12:30Z"}, {"from": "2023-05-04T13:00Z"}]
+    if "/postcode/" in url:
+        data = [dict(p, intensity={"forecast": 100}) for p in period]
+        return {"data": {"regionid": 12, "data": data}}
+    regions = [{"regionid": r, "intensity": {"forecast": 100 + r}} for r in (3, 12)]
+    return {"data": [dict(p, regions=regions) for p in period]}
+
+
+class CIUKResponse(FakeResponse):
+    def json(self):
+        return ciuk_response(self.url)
+
+
+@patch("cats.CI_api_query.get_session")
+def test_get_CI_forecast_regions(get_session, forecast_cache):
+    get_session.return_value.get.side_effect = lambda url, headers, timeout: (
+        CIUKResponse(url)
+    )
+    api_interface = API_interfaces["carbonintensity.org.uk"]
+    get_CI_forecast = cats.CI_api_query.get_CI_forecast
+
+    # The region of a location is unknown until its first request
+    assert get_CI_forecast("OX1", api_interface).values.tolist() == [100, 100]
+    api = cats.CI_api_query._api_key(api_interface)
+    assert cats.CI_api_query.region_index.get(api, " ox1") == 12
+    urls = [c.args[0] for c in get_session.return_value.get.call_args_list]
+    assert len(urls) == 1 and urls[0].endswith("/postcode/OX1")
+
+    # Then the forecast for all regions is fetched once, and shared
+    # between all locations of the region
+    forecast = get_CI_forecast("OX1", api_interface)
+    assert forecast.values.tolist() == [112, 112]
+    get_CI_forecast("OX2", api_interface)  # region not known yet
+    assert get_CI_forecast("OX2", api_interface) == forecast
+    assert get_CI_forecast("OX1", api_interface) == forecast
+    urls = [c.args[0] for c in get_session.return_value.get.call_args_list]
+    assert len(urls) == 3
+    assert urls[1].endswith("/fw48h") and urls[2].endswith("/postcode/OX2")
+
+
+def test_region_index(tmp_path):
+    index = RegionIndex(tmp_path / "regions.json")
+    assert index.get("api", "OX1") is None
+    index.set("api", "OX1", 12)
+    assert index.get("api", "ox1 ") == 12
+    assert index.get("other", "OX1") is None
+    assert RegionIndex(tmp_path / "regions.json").get("api", "OX1") == 12
+
+    # Regions recorded by other processes are kept
+    other = RegionIndex(tmp_path / "regions.json")
+    assert other.get("api", "M15") is None
+    index.set("api", "M15", 3)
+    other.set("api", "EH8", 6)
+    assert other.get("api", "M15") == 3
+    index = RegionIndex(tmp_path / "regions.json")
+    assert [index.get("api", loc) for loc in ["OX1", "M15", "EH8"]] == [12, 3, 6]
+
+    (tmp_path / "invalid.json").write_text("not json")
+    assert RegionIndex(tmp_path / "invalid.json").get("api", "OX1") is None
+
+
+def forecast_around_now(values):
+    "Forecast series starting two hours ago, in half hour steps"
+    start = datetime.now(timezone.utc).timestamp() - 7200
+    return CarbonIntensitySeries(
+        times=[start + i * 1800 for i in range(len(values))],
+        values=values,
+        tzinfo=ZoneInfo("UTC"),
+    )
+
+
+@patch("cats.CI_api_query.get_session")
+def test_get_CI_forecast_or_stale(get_session, forecast_cache):
+    get_session.return_value.get.side_effect = lambda url, headers, timeout: (
+        FakeResponse(url)
+    )
+    stale = forecast_around_now(list(range(10)))
+    forecast_cache.save(cats.CI_api_query._latest_key("OX1", FAKE_API), stale)
+
+    forecast, is_stale = cats.CI_api_query.get_CI_forecast_or_stale(
+        "OX1", FAKE_API, max_stale=600
+    )
+    assert is_stale
+    # Trimmed to start at the data point preceding the current time
+    assert forecast == stale[4:]
+    for thread in threading.enumerate():
+        if thread.name == "cats-forecast-refresh":
+            thread.join()
+    get_session.return_value.get.assert_called_once()
+
+    # The refreshed forecast is used next
+    forecast, is_stale = cats.CI_api_query.get_CI_forecast_or_stale(
+        "OX1", FAKE_API, max_stale=600
+    )
+    assert not is_stale
+    assert forecast == FAKE_API.parse_response_data("OX1")
+    get_session.return_value.get.assert_called_once()
+
+
+@patch("cats.CI_api_query._start_refresh")
+def test_get_CI_forecast_or_stale_refreshed_once(start_refresh, forecast_cache):
+    stale = forecast_around_now(list(range(10)))
+    forecast_cache.save(cats.CI_api_query._latest_key("OX1", FAKE_API), stale)
+    for _ in range(3):
+        forecast, is_stale = cats.CI_api_query.get_CI_forecast_or_stale(
+            "OX1", FAKE_API, max_stale=600
+        )
+        assert is_stale
+    # Processes using the stale forecast meanwhile do not refresh it
+    start_refresh.assert_called_once()
+
+    # Unless the refresh failed
+    for path in os.scandir(forecast_cache.directory):
+        if path.name.endswith(".claim"):
+            os.utime(path, (0, 0))
+    cats.CI_api_query.get_CI_forecast_or_stale("OX1", FAKE_API, max_stale=600)
+    assert start_refresh.call_count == 2
+
+
+def test_refresh_command():
+    api = API_interfaces["carbonintensity.org.uk"]
+    command = cats.CI_api_query._refresh_command("OX1", api, 2.5)
+    assert command[0] == sys.executable
+    assert command[3:] == ["--once", "--api", "carbonintensity.org.uk"] + [
+        "--sites",
+        "OX1",
+        "--timeout",
+        "2.5",
+    ]
+    # APIs not known by name are refreshed in a thread
+    assert cats.CI_api_query._refresh_command("OX1", FAKE_API, 2.5) is None
+
+
+def test_stale_refresh_does_not_delay_exit(tmp_path):
+    # The stale forecast is used at once, and the process exits without
+    # waiting for the refresh, here taking 10 seconds
+    code = f"""
+import sys, time
+from unittest.mock import patch
+import cats.CI_api_query as q
+from cats.CI_api_interface import API_interfaces
+from cats.forecast import CarbonIntensitySeries
+from cats.forecast_cache import ForecastCache
+from cats.region_index import RegionIndex
+from cats.resilience import CircuitBreaker
+
+api = API_interfaces["carbonintensity.org.uk"]
+q.forecast_cache = ForecastCache({str(tmp_path)!r})
+q.region_index = RegionIndex({str(tmp_path / "regions")!r})
+q.breaker = CircuitBreaker({str(tmp_path / "circuit")!r})
+start = time.time() - 7200
+stale = CarbonIntensitySeries([start + i * 1800 for i in range(10)], list(range(10)))
+q.forecast_cache.save(q._latest_key("OX1", api), stale)
+sleep = [sys.executable, "-c", "import time; time.sleep(10)"]
+with patch("cats.CI_api_query._refresh_command", return_value=sleep):
+    forecast, is_stale = q.get_CI_forecast_or_stale("OX1", api, max_stale=600)
+assert is_stale
+"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], check=True, timeout=30)
+    assert time.perf_counter() - start < 5
+
+
+@patch("cats.CI_api_query.get_session")
+def test_get_CI_forecast_or_stale_unusable(get_session, forecast_cache):
+    get_session.return_value.get.side_effect = lambda url, headers, timeout: (
+        FakeResponse(url)
+    )
+    fresh = FAKE_API.parse_response_data("OX1")
+
+    # Stale forecast too old
+    key = cats.CI_api_query._latest_key("OX1", FAKE_API)
+    forecast_cache.save(key, forecast_around_now(list(range(10))))
+    assert cats.CI_api_query.get_CI_forecast_or_stale(
+        "OX1", FAKE_API, max_stale=-1
+    ) == (fresh, False)
+
+    # Stale forecast not covering the future
+    forecast_cache.save(key, forecast_around_now([1, 2, 3]))
+    os.remove(forecast_cache._path("OX1"))  # current forecast fetched above
+    assert cats.CI_api_query.get_CI_forecast_or_stale(
+        "OX1", FAKE_API, max_stale=600
+    ) == (fresh, False)
+
+
+@patch("cats.CI_api_query.get_session")
+def test_get_CI_forecast_unavailable(get_session, forecast_cache):
+    get_session.return_value.get.side_effect = requests.ConnectionError
+    breaker = cats.CI_api_query.breaker
+    for _ in range(breaker.threshold):
+        with pytest.raises(requests.ConnectionError):
+            cats.CI_api_query.get_CI_forecast("OX1", FAKE_API)
+    assert get_session.return_value.get.call_count == 3 * breaker.threshold
+
+    # Requests are stopped once the circuit is open
+    with pytest.raises(CircuitOpenError):
+        cats.CI_api_query.get_CI_forecast("OX1", FAKE_API)
+    assert get_session.return_value.get.call_count == 3 * breaker.threshold
+
+    # Stale forecasts are used whatever their age, without refreshing
+    stale = forecast_around_now(list(range(10)))
+    forecast_cache.save(cats.CI_api_query._latest_key("OX1", FAKE_API), stale)
+    forecast, is_stale = cats.CI_api_query.get_CI_forecast_or_stale(
+        "OX1", FAKE_API, max_stale=-1
+    )
+    assert is_stale and forecast == stale[4:]
+    assert get_session.return_value.get.call_count == 3 * breaker.threshold
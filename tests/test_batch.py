@@ -0,0 +1,176 @@
+import io
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+import cats.batch
+from cats.batch import plan_jobs
+from cats.CI_api_interface import InvalidLocationError
+from cats.cli import main
+from cats.forecast import WindowedForecast
+from cats.local_forecast import read_forecast_file
+from cats.planner import Planner
+
+CSV = Path(__file__).parent / "carbon_intensity_24h.csv"
+NOW = datetime(2023, 5, 4, 12, 45, tzinfo=timezone.utc)
+FORECAST = read_forecast_file(CSV)
+
+
+def jobs(*specs):
+    return [json.dumps(spec) + "\n" for spec in specs]
+
+
+@patch("cats.planner.get_CI_forecast")
+def test_plan_jobs(get_CI_forecast):
+    def fetch(location, iface, timeout):
+        if location == "XX1":
+            raise InvalidLocationError
+        return FORECAST
+
+    get_CI_forecast.side_effect = fetch
+    lines = jobs(
+        {"id": "a", "duration": 60, "location": "OX1"},
+        {"duration": 90, "location": "M15", "window": 600},
+        {"id": "c", "duration": 60, "location": "OX1"},
+        {"duration": 60},
+        {"duration": 60, "location": "XX1"},
+        {"duration": 60, "location": "XX1"},
+        {"duration": 0},
+        {"duration": 60, "profile": "gpu"},
+    )
+    results = list(
+        plan_jobs([*lines, "\n", "{"], Planner(f"file:{CSV}", {}, "EH8"), now=NOW)
+    )
+    assert [r["id"] for r in results] == ["a", 2, "c", 4, 5, 6, 7, 8, 10]
+    # Each forecast is fetched once
+    assert sorted(c.args[0] for c in get_CI_forecast.call_args_list) == [
+        "EH8",
+        "M15",
+        "OX1",
+        "XX1",
+    ]
+
+    wf = WindowedForecast(FORECAST, 60, start=NOW, max_window_minutes=2820)
+    assert results[0]["carbonIntensityOptimal"]["value"] == pytest.approx(
+        wf.best()[0].value
+    )
+    assert results[0]["carbonIntensityNow"]["value"] == pytest.approx(wf[0].value)
+    assert (
+        results[0]["carbonIntensityOptimal"]["start"] == wf.best()[0].start.isoformat()
+    )
+    assert results[2] == {**results[0], "id": "c"}
+    assert results[3]["location"] == "EH8"
+    assert results[4]["error"] == results[5]["error"] == "unknown location XX1"
+    assert "positive number of minutes" in results[6]["error"]
+    assert "profiles" in results[7]["error"]
+    assert "invalid JSON" in results[8]["error"]
+
+
+def test_plan_jobs_constraints():
+    def plan(**job):
+        (result,) = plan_jobs(
+            jobs({"duration": 60, "location": "OX1", **job}),
+            Planner(f"file:{CSV}", {}),
+            now=NOW,
+        )
+        return result
+
+    start = datetime.fromisoformat(
+        plan(start="2023-05-05T02:00Z")["carbonIntensityNow"]["start"]
+    )
+    assert start == datetime(2023, 5, 5, 2, tzinfo=timezone.utc)
+    optimal = plan(end="2023-05-04T18:00Z")["carbonIntensityOptimal"]
+    assert datetime.fromisoformat(optimal["start"]) <= datetime(
+        2023, 5, 4, 18, tzinfo=timezone.utc
+    )
+    assert "exceeds the window" in plan(window=30)["error"]
+    assert (
+        "before end window"
+        in plan(start="2023-05-05T02:00Z", end="2023-05-05T01:00Z")["error"]
+    )
+
+
+def test_plan_jobs_failures():
+    config = {"profiles": {"flat": {"cpu": {"power": 10, "nunits": 1}}}}
+    config["profiles"]["bad"] = {"power_curve": [[5, 1]]}
+    lines = jobs(
+        {"duration": 60, "location": "OX1", "profile": "bad"},
+        {"duration": 60, "location": "OX1", "end": NOW.isoformat()},
+        {"duration": 60},
+        {"duration": 60, "location": "OX1"},
+    )
+    planner = Planner(f"file:{CSV}", config)
+    with patch(
+        "cats.planner.get_location_from_config_or_args",
+        side_effect=OSError("Could not get location from ipapi.co"),
+    ):
+        results = list(plan_jobs(lines, planner, now=NOW))
+    assert "power_curve" in results[0]["error"]
+    assert "No valid window" in results[1]["error"]
+    assert "ipapi.co" in results[2]["error"]
+    assert "carbonIntensityOptimal" in results[3]
+
+
+def test_plan_jobs_streams(monkeypatch):
+    monkeypatch.setattr(cats.batch, "MAX_RESULTS", 4)
+    read = []
+
+    def lines():
+        for n in range(100):
+            read.append(n)
+            yield json.dumps({"duration": 30 + n % 10, "location": "OX1"})
+
+    results = plan_jobs(lines(), Planner(f"file:{CSV}", {}), now=NOW)
+    # Each result is yielded once its job is read
+    next(results)
+    assert read == [0]
+    assert sum(1 for _ in results) == 99
+
+
+class FrozenDatetime(datetime):
+    frozen = NOW
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.frozen
+
+
+@patch("cats.planner.get_CI_forecast", return_value=FORECAST)
+def test_plan_jobs_now(get_CI_forecast, monkeypatch):
+    # Each job is planned from the time it is read, and forecasts are
+    # fetched again in each forecast period
+    monkeypatch.setattr(cats.batch, "datetime", FrozenDatetime)
+    times = [NOW, NOW.replace(second=30), NOW.replace(hour=13, minute=5)]
+
+    def lines():
+        for n, time in enumerate(times):
+            FrozenDatetime.frozen = time
+            yield json.dumps({"id": n, "duration": 60, "location": "OX1"})
+
+    results = list(plan_jobs(lines(), Planner(f"file:{CSV}", {})))
+    assert get_CI_forecast.call_count == 2
+    # Jobs read in the same minute share their result
+    assert results[1] == {**results[0], "id": 1}
+    starts = [datetime.fromisoformat(r["carbonIntensityNow"]["start"]) for r in results]
+    assert starts[0] == NOW and starts[2] == times[2]
+
+
+def test_main_batch(monkeypatch, capsys):
+    stdin = jobs({"id": "a", "duration": 60, "location": "OX1"}, {"duration": -1})
+    monkeypatch.setattr("sys.stdin", io.StringIO("".join(stdin)))
+    args = ["batch", "--api", f"file:{CSV}", "--replay-from", "2023-05-04T12:30Z"]
+    assert main(args) == 1
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["carbonIntensityOptimal"]["value"] > 0
+    assert json.loads(lines[1])["id"] == 2
+
+    monkeypatch.setattr("sys.stdin", io.StringIO(stdin[0]))
+    assert main([*args, "--dateformat", "%H:%M"]) == 0
+    (line,) = capsys.readouterr().out.splitlines()
+    assert len(json.loads(line)["carbonIntensityOptimal"]["start"]) == 5
+
+    assert main(["batch", "--api", "doesnotexist.co.uk"]) == 1
@@ -0,0 +1,104 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from cats.capacity import BatchJob, plan_batch, read_batch_jobs
+from cats.forecast import CarbonIntensitySeries, WindowedForecast
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+VALUES = [50, 40, 10, 12, 60, 70, 8, 9, 30, 5, 80, 90, 20]
+SERIES = CarbonIntensitySeries(
+    times=[START.timestamp() + i * 1800 for i in range(len(VALUES))],
+    values=VALUES,
+    tzinfo=timezone.utc,
+)
+
+
+def usage(jobs, plan):
+    "Nodes in use during each half hour slot"
+    used = Counter()
+    for job, window in zip(jobs, plan):
+        t = window.start
+        while t < window.end:
+            used[t] += job.nodes
+            t += timedelta(minutes=30)
+    return used
+
+
+def test_plan_batch_unconstrained():
+    jobs = [BatchJob(60, 2), BatchJob(90), BatchJob(60, 2)]
+    plan = plan_batch(SERIES, jobs, START, capacity=100)
+    assert plan[0] == plan[2] == WindowedForecast(SERIES, 60, START).best()[0]
+    assert plan[1] == WindowedForecast(SERIES, 90, START).best()[0]
+
+
+def test_plan_batch_spreads_jobs():
+    jobs = [BatchJob(30)] * 5
+    plan = plan_batch(SERIES, jobs, START, capacity=2)
+    assert max(usage(jobs, plan).values()) == 2
+    # Unit jobs fill the lowest intensity slots first
+    slots = sorted(0.5 * (a + b) for a, b in zip(VALUES[:-1], VALUES[1:]))
+    expected = [s for s in slots[:3] for _ in range(2)][:5]
+    assert sorted(w.value for w in plan) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("capacity", [1, 3, 4, 8])
+def test_plan_batch_capacity(capacity):
+    rng = np.random.default_rng(capacity)
+    jobs = [
+        BatchJob(int(d), int(n))
+        for d, n in zip(rng.choice([30, 60, 90], 20), rng.integers(1, 4, 20))
+    ]
+    plan = plan_batch(SERIES, jobs, START, capacity=capacity)
+    planned = [(job, w) for job, w in zip(jobs, plan) if w is not None]
+    assert planned
+    assert max(usage(*zip(*planned)).values()) <= capacity
+    assert all(w.end - w.start == timedelta(minutes=j.duration) for j, w in planned)
+
+
+def test_plan_batch_unplanned():
+    jobs = [BatchJob(30, 3), BatchJob(30, 2)]
+    plan = plan_batch(SERIES, jobs, START, capacity=2)
+    assert plan[0] is None
+    assert plan[1] == WindowedForecast(SERIES, 30, START).best()[0]
+
+
+def test_plan_batch_constraints():
+    jobs = [BatchJob(30)] * 4
+    end_constraint = START + timedelta(hours=2)
+    plan = plan_batch(SERIES, jobs, START, capacity=1, end_constraint=end_constraint)
+    assert sorted(w.start for w in plan) == [
+        START + timedelta(minutes=30 * i) for i in range(4)
+    ]
+    with pytest.raises(ValueError):
+        plan_batch(SERIES, jobs, START, capacity=0)
+
+
+def test_plan_batch_many_jobs():
+    rng = np.random.default_rng(0)
+    series = CarbonIntensitySeries(
+        times=[START.timestamp() + i * 1800 for i in range(96)],
+        values=rng.uniform(50, 250, 96),
+        tzinfo=timezone.utc,
+    )
+    jobs = [
+        BatchJob(int(d), int(n))
+        for d, n in zip(rng.integers(1, 24, 5000) * 30, rng.integers(1, 8, 5000))
+    ]
+    plan = plan_batch(series, jobs, START, capacity=2000)
+    planned = [(job, w) for job, w in zip(jobs, plan) if w is not None]
+    assert max(usage(*zip(*planned)).values()) <= 2000
+
+
+def test_read_batch_jobs(tmp_path):
+    path = tmp_path / "jobs.csv"
+    path.write_text("60,2\n\n90\n")
+    assert read_batch_jobs(path) == [BatchJob(60, 2), BatchJob(90, 1)]
+    path.write_text("60,two\n")
+    with pytest.raises(ValueError):
+        read_batch_jobs(path)
+    path.write_text("60,0\n")
+    with pytest.raises(ValueError):
+        read_batch_jobs(path)
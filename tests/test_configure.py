@@ -1,5 +1,6 @@
 import os
 from contextlib import contextmanager
+from datetime import datetime, timezone
 from unittest.mock import Mock, patch
 
 import pytest
@@ -12,8 +13,14 @@ from cats.configure import (
     config_from_file,
     get_job_info,
     get_location_from_config_or_args,
+    get_replay_from,
+    get_runtime_config,
+    get_sites,
+    read_power_curve,
 )
 from cats.constants import MEMORY_POWER_PER_GB
+from cats.placement import Site
+from cats.resilience import CircuitBreaker
 
 CATS_CONFIG = {
     "location": "EH8",
@@ -85,10 +92,10 @@ def test_config_from_env(local_config_file):
     assert configmapping == CATS_CONFIG
 
 
-@patch("cats.configure.requests")
-def test_get_location_from_config_or_args(mock_requests):
+@patch("requests.get")
+def test_get_location_from_config_or_args(get):
     expected_location = "SW7"
-    mock_requests.get.return_value = Mock(
+    get.return_value = Mock(
         **{
             "status_code": 200,
             "json.return_value": {"postal": expected_location},
@@ -108,10 +115,20 @@ def test_get_location_from_config_or_args(mock_requests):
     args = parse_arguments().parse_args(["--duration", "1"])
     config = {}
     location = get_location_from_config_or_args(args, config)
-    mock_requests.get.assert_called_once()
+    get.assert_called_once()
     assert location == expected_location
 
 
+@patch("requests.get")
+def test_get_location_from_ipapi_unavailable(get, tmp_path):
+    breaker = CircuitBreaker(tmp_path / "circuit.json", threshold=1)
+    breaker.record_failure("https://ipapi.co/json/")
+    args = parse_arguments().parse_args(["--duration", "1"])
+    with patch("cats.configure.breaker", breaker), pytest.raises(OSError, match="ipapi"):
+        get_location_from_config_or_args(args, {})
+    get.assert_not_called()
+
+
 def get_CI_API_from_config_or_args(args, config):
     expected_interface = API_interfaces["carbonintensity.org.uk"]
     args = parse_arguments().parse_args(
@@ -132,6 +149,22 @@ def get_CI_API_from_config_or_args(args, config):
         CI_API_from_config_or_args(args, CATS_CONFIG)
 
 
+def test_CI_API_from_config_or_args_local():
+    config = {"api": "file:tests/carbon_intensity_24h.csv"}
+    args = parse_arguments().parse_args(["--duration", "1"])
+    interface = CI_API_from_config_or_args(args, config)
+    assert interface.load_forecast is not None
+    assert get_replay_from(args, config) is None
+
+    expected = datetime(2023, 5, 4, 12, 30, tzinfo=timezone.utc)
+    config["replay_from"] = "2023-05-04T12:30"
+    assert get_replay_from(args, config) == expected
+    args = parse_arguments().parse_args(
+        ["--duration", "1", "--replay-from", "2023-05-04T12:30Z"]
+    )
+    assert get_replay_from(args, {}) == expected
+
+
 def test_get_jobinfo():
     profiles = {
         "CPU_partition": {
@@ -173,5 +206,102 @@ def test_get_jobinfo():
     args = parse_arguments().parse_args(
         ["--duration", "2", "--profile", "unknown_profile", "--memory", "8"]
     )
-    with pytest.raises(SystemExit):
+    with pytest.raises(ValueError, match="should be one of"):
+        get_job_info(args, profiles)
+
+    args = parse_arguments().parse_args(["--duration", "2"])
+    with pytest.raises(ValueError, match="memory"):
         get_job_info(args, profiles)
+    args = parse_arguments().parse_args(["--duration", "2", "--memory", "8"])
+    profiles = {"CPU_partition": {"cpu": {"nunits": 8}}}
+    with pytest.raises(ValueError, match="power specification for device cpu"):
+        get_job_info(args, profiles)
+
+
+def test_read_power_curve(tmp_path):
+    assert read_power_curve([[0, 0.5], [10, 1]]) == [(0, 0.5), (10, 1)]
+    csvfile = tmp_path / "curve.csv"
+    csvfile.write_text("0,0.5\n10,1\n")
+    assert read_power_curve(str(csvfile)) == [(0, 0.5), (10, 1)]
+    for invalid in [[], [[5, 1]], [[0, 1], [0, 2]], [[0, -1]], [[0]]]:
+        with pytest.raises(ValueError, match="power_curve"):
+            read_power_curve(invalid)
+
+
+def test_get_runtime_config_power_curve(tmp_path):
+    config = dict(
+        CATS_CONFIG,
+        profiles={
+            "flat": {"cpu": {"power": 10, "nunits": 1}},
+            "ramp": {
+                "cpu": {"power": 10, "nunits": 1},
+                "power_curve": [[0, 0.5], [10, 1]],
+            },
+        },
+        PUE=1.2,
+    )
+    configfile = tmp_path / "config.yml"
+    with open(configfile, "w") as stream:
+        yaml.dump(config, stream)
+
+    args = parse_arguments().parse_args(
+        ["--config", str(configfile), "-d", "60", "--profile", "ramp"]
+    )
+    assert get_runtime_config(args)[-1] == [(0, 0.5), (10, 1)]
+
+    args = parse_arguments().parse_args(
+        ["--config", str(configfile), "-d", "60", "--profile", "ramp", "--footprint", "--memory", "4"]
+    )
+    _, _, _, jobinfo, _, power_curve = get_runtime_config(args)
+    assert jobinfo == [(1, 10), (4, MEMORY_POWER_PER_GB)]
+    assert power_curve == [(0, 0.5), (10, 1)]
+
+    # No power curve unless a profile is used
+    args = parse_arguments().parse_args(["--config", str(configfile), "-d", "60"])
+    assert get_runtime_config(args)[-1] is None
+
+    for invalid, error in [
+        (["--profile", "tpu"], "should be one of"),
+        (["--footprint"], "memory"),
+        (["--api", "doesnotexist.co.uk"], "not a valid API"),
+        (["-d", "0"], "positive integer"),
+    ]:
+        args = parse_arguments().parse_args(
+            ["--config", str(configfile), "-d", "60", *invalid]
+        )
+        with pytest.raises(ValueError, match=error):
+            get_runtime_config(args)
+
+
+def test_get_sites(tmp_path):
+    config = dict(
+        CATS_CONFIG,
+        profiles={
+            "flat": {"cpu": {"power": 10, "nunits": 1}},
+            "ramp": {
+                "cpu": {"power": 10, "nunits": 2},
+                "power_curve": [[0, 0.5], [10, 1]],
+            },
+        },
+        sites={"OX1": {"PUE": 1.5, "profile": "ramp"}, "M15": {"PUE": 1.1}},
+        PUE=1.2,
+    )
+    configfile = tmp_path / "config.yml"
+    with open(configfile, "w") as stream:
+        yaml.dump(config, stream)
+
+    args = parse_arguments().parse_args(["--config", str(configfile), "-d", "60"])
+    assert get_sites(args, ["OX1", "M15", "EH8"]) == [
+        Site("OX1", PUE=1.5, power=20, power_curve=[(0, 0.5), (10, 1)]),
+        Site("M15", PUE=1.1, power=10),
+        Site("EH8", PUE=1.2, power=10),
+    ]
+
+    # Job power is unknown without profiles
+    del config["profiles"]
+    with open(configfile, "w") as stream:
+        yaml.dump(config, stream)
+    assert get_sites(args, ["OX1", "EH8"]) == [
+        Site("OX1", PUE=1.5),
+        Site("EH8", PUE=1.2),
+    ]
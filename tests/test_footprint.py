@@ -2,7 +2,11 @@ import datetime
 
 from numpy.testing import assert_allclose
 
-from cats.carbonFootprint import Estimates, get_footprint_reduction_estimate
+from cats.carbonFootprint import (
+    Estimates,
+    get_footprint_reduction_estimate,
+    mean_power_fraction,
+)
 
 JOBINFO = [(1, 2.0), (2, 3.0), (8, 1.0)]
 
@@ -17,3 +21,24 @@ def test_get_footprint_reduction_estimate():
         average_now_ci=200,  # gCO2/kWh
     )
     assert_allclose(expected, est)
+
+
+def test_get_footprint_reduction_estimate_power_fraction():
+    expected = Estimates(now=1.6, best=1.2, savings=0.4)
+    est = get_footprint_reduction_estimate(
+        PUE=1.0,
+        jobinfo=JOBINFO,
+        runtime=datetime.timedelta(minutes=60),
+        average_best_ci=150,  # gCO2/kWh
+        average_now_ci=200,  # gCO2/kWh
+        power_fraction=0.5,
+    )
+    assert_allclose(expected, est)
+
+
+def test_mean_power_fraction():
+    assert mean_power_fraction(None, 60) == 1.0
+    assert mean_power_fraction([(0, 0.5), (30, 1.0)], 60) == 0.75
+    # Steps past the job end are ignored
+    assert mean_power_fraction([(0, 0.5), (30, 1.0), (90, 0.0)], 60) == 0.75
+    assert mean_power_fraction([(0, 0.5), (90, 1.0)], 60) == 0.5
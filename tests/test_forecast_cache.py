@@ -0,0 +1,64 @@
+import os
+from datetime import timezone
+from zoneinfo import ZoneInfo
+
+from cats.forecast import CarbonIntensitySeries
+from cats.forecast_cache import ForecastCache
+
+SERIES = CarbonIntensitySeries(
+    times=[1704067200 + i * 1800 for i in range(5)],
+    values=[50.0, 40, 10, 12, 60],
+    tzinfo=ZoneInfo("UTC"),
+)
+
+
+def test_forecast_cache(tmp_path):
+    cache = ForecastCache(tmp_path / "forecasts")
+    assert cache.load("url") is None
+    cache.save("url", SERIES)
+    assert cache.load("url") == SERIES
+    assert cache.load("other url") is None
+
+    # Cache is shared between instances
+    assert ForecastCache(tmp_path / "forecasts").load("url") == SERIES
+
+    naive = CarbonIntensitySeries(SERIES.times, SERIES.values)
+    cache.save("naive", naive)
+    assert cache.load("naive") == naive
+
+
+def test_forecast_cache_not_saved(tmp_path):
+    cache = ForecastCache(tmp_path)
+    cache.save("url", CarbonIntensitySeries([], []))
+    cache.save("url", CarbonIntensitySeries([0, 1], [1, 2], timezone.utc))
+    assert cache.load("url") is None
+
+
+def test_forecast_cache_invalid(tmp_path):
+    cache = ForecastCache(tmp_path)
+    cache.save("url", SERIES)
+    (path,) = tmp_path.iterdir()
+    path.write_bytes(b"garbage")
+    assert cache.load("url") is None
+
+
+def test_forecast_cache_expiry(tmp_path):
+    cache = ForecastCache(tmp_path, max_age=3600)
+    cache.save("old", SERIES)
+    (path,) = tmp_path.iterdir()
+    os.utime(path, (0, 0))
+    cache.save("new", SERIES)
+    assert cache.load("old") is None
+    assert cache.load("new") == SERIES
+
+
+def test_forecast_cache_claim(tmp_path):
+    cache = ForecastCache(tmp_path / "forecasts")
+    assert cache.claim("url", max_age=60)
+    # Claimed for all instances until the claim expires
+    assert not ForecastCache(tmp_path / "forecasts").claim("url", max_age=60)
+    assert cache.claim("other url", max_age=60)
+    for path in (tmp_path / "forecasts").iterdir():
+        os.utime(path, (0, 0))
+    assert cache.claim("url", max_age=60)
+    assert not cache.claim("url", max_age=60)
@@ -0,0 +1,44 @@
+import os
+import stat
+from unittest.mock import patch
+
+import pytest
+
+from cats._fs import atomic_write_bytes, atomic_write_text, state_dir, state_path
+
+
+def test_atomic_write(tmp_path):
+    path = tmp_path / "state.json"
+    atomic_write_text(str(path), "{}")
+    atomic_write_bytes(str(path), b"[]")
+    assert path.read_text() == "[]"
+    assert os.listdir(tmp_path) == ["state.json"]
+
+    # The file is left as it was, without temporary files, on failure
+    with patch("os.replace", side_effect=OSError("read-only")):
+        with pytest.raises(OSError, match="read-only"):
+            atomic_write_text(str(path), "{}")
+    assert path.read_text() == "[]"
+    assert os.listdir(tmp_path) == ["state.json"]
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="Unix only")
+def test_state_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    state_dir.cache_clear()
+    try:
+        path = state_dir()
+        assert path == str(tmp_path / f"cats-{os.getuid()}")
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o700
+        assert state_path("cats_regions.json") == os.path.join(
+            path, "cats_regions.json"
+        )
+
+        # A file in place of the directory is not used
+        state_dir.cache_clear()
+        os.rmdir(path)
+        open(path, "w").close()
+        other = state_dir()
+        assert other != path and stat.S_IMODE(os.stat(other).st_mode) == 0o700
+    finally:
+        state_dir.cache_clear()
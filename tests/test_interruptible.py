@@ -0,0 +1,82 @@
+import itertools
+import math
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from numpy.testing import assert_allclose
+
+from cats.forecast import CarbonIntensitySeries
+from cats.interruptible import plan_segments
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+VALUES = [50, 40, 10, 12, 60, 70, 8, 9, 30, 5, 80, 90, 20]
+SERIES = CarbonIntensitySeries(
+    times=[START.timestamp() + i * 1800 for i in range(len(VALUES))],
+    values=VALUES,
+    tzinfo=timezone.utc,
+)
+
+
+def brute_force(runtime, min_segment, max_segments):
+    "Lowest total intensity over all valid sets of half-hour slots"
+    slots = [0.5 * (a + b) for a, b in zip(VALUES[:-1], VALUES[1:])]
+    nrun = math.ceil(runtime / 30)
+    nmin = min(math.ceil(min_segment / 30), nrun)
+    best = math.inf
+    for chosen in itertools.combinations(range(len(slots)), nrun):
+        lengths = [1]
+        for a, b in zip(chosen[:-1], chosen[1:]):
+            if b == a + 1:
+                lengths[-1] += 1
+            else:
+                lengths.append(1)
+        if len(lengths) <= max_segments and min(lengths) >= nmin:
+            best = min(best, sum(slots[i] for i in chosen))
+    return best
+
+
+@pytest.mark.parametrize("runtime", [30, 90, 150, 240])
+@pytest.mark.parametrize("min_segment", [30, 60, 90])
+@pytest.mark.parametrize("max_segments", [1, 2, 3])
+def test_plan_segments_optimal(runtime, min_segment, max_segments):
+    segments = plan_segments(
+        SERIES, runtime, START, min_segment, max_segments, resolution=30
+    )
+    assert 1 <= len(segments) <= max_segments
+    for a, b in zip(segments[:-1], segments[1:]):
+        assert a.end < b.start
+    lengths = [s.end - s.start for s in segments]
+    assert sum(lengths, timedelta()) == timedelta(minutes=math.ceil(runtime / 30) * 30)
+    assert min(lengths) >= timedelta(minutes=min(min_segment, runtime))
+    total = sum(s.value * (s.end - s.start) / timedelta(minutes=30) for s in segments)
+    assert_allclose(total, brute_force(runtime, min_segment, max_segments))
+
+
+def test_plan_segments_values():
+    segments = plan_segments(SERIES, 60, START, 30, 2, resolution=30)
+    # The two half hours with the lowest average intensity are
+    # 01:00-01:30 (10 -> 12) and 03:00-03:30 (8 -> 9)
+    assert [(s.start, s.end) for s in segments] == [
+        (START + timedelta(hours=1), START + timedelta(hours=1, minutes=30)),
+        (START + timedelta(hours=3), START + timedelta(hours=3, minutes=30)),
+    ]
+    assert segments[0].start_value == 10
+    assert segments[0].end_value == 12
+    assert segments[0].value == 11
+    assert segments[1].value == 8.5
+
+
+def test_plan_segments_deadline():
+    deadline = START + timedelta(hours=2)
+    segments = plan_segments(SERIES, 60, START, 30, 2, deadline, resolution=30)
+    assert segments[-1].end <= deadline
+    with pytest.raises(ValueError, match="deadline"):
+        plan_segments(SERIES, 180, START, 30, 2, deadline, resolution=30)
+
+
+def test_plan_segments_infeasible():
+    # 90 minutes runtime in a one hour forecast
+    with pytest.raises(ValueError):
+        plan_segments(SERIES[:3], 90, START, 30, 3, resolution=30)
+    with pytest.raises(ValueError, match="positive"):
+        plan_segments(SERIES, 60, START, 30, 0)
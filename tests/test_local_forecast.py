@@ -0,0 +1,98 @@
+import json
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+from cats.CI_api_interface import InvalidLocationError
+from cats.CI_api_query import get_CI_forecast
+from cats.local_forecast import LocalForecast, local_api_interface, read_forecast_file
+
+CSV = Path(__file__).parent / "carbon_intensity_24h.csv"
+START = datetime(2023, 5, 4, 12, 30, tzinfo=timezone.utc)
+
+
+def records(start, values):
+    return [
+        {
+            "from": (start + timedelta(minutes=30 * i)).strftime("%Y-%m-%dT%H:%MZ"),
+            "intensity": {"forecast": v},
+        }
+        for i, v in enumerate(values)
+    ]
+
+
+def test_read_forecast_file_formats(tmp_path):
+    forecast = read_forecast_file(CSV)
+    assert len(forecast) == 96
+    assert forecast[0].datetime == START
+    assert forecast[0].value == 11
+
+    points = records(START, forecast.values.tolist())
+    (tmp_path / "api.json").write_text(json.dumps({"data": {"data": points}}))
+    assert read_forecast_file(tmp_path / "api.json") == forecast
+    (tmp_path / "points.ndjson").write_text(
+        "\n".join(json.dumps(p) for p in reversed(points)) + "\n"
+    )
+    assert read_forecast_file(tmp_path / "points.ndjson") == forecast
+
+    (tmp_path / "unix.csv").write_text("unix,value\n1683203400,11\n1683205200,15\n")
+    assert read_forecast_file(tmp_path / "unix.csv") == forecast[:2]
+
+
+def test_read_forecast_file_invalid(tmp_path):
+    (tmp_path / "forecast.txt").write_text("")
+    with pytest.raises(ValueError):
+        read_forecast_file(tmp_path / "forecast.txt")
+    (tmp_path / "forecast.csv").write_text("time,price\n2023-05-04T12:30Z,1\n")
+    with pytest.raises(ValueError):
+        read_forecast_file(tmp_path / "forecast.csv")
+    (tmp_path / "forecast.csv").write_text("time,value\n")
+    with pytest.raises(ValueError):
+        read_forecast_file(tmp_path / "forecast.csv")
+
+
+def test_read_forecast_file_locations(tmp_path):
+    path = tmp_path / "forecast.csv"
+    path.write_text(
+        "location,time,value\n"
+        "OX1,2023-05-04T12:30Z,10\n"
+        "M15,2023-05-04T12:30Z,20\n"
+        "OX1,2023-05-04T13:00:00+00:00,30\n"
+    )
+    assert read_forecast_file(path, " ox1").values.tolist() == [10, 30]
+    assert read_forecast_file(path, "M15").values.tolist() == [20]
+    with pytest.raises(InvalidLocationError):
+        read_forecast_file(path, "EH8")
+
+
+def test_local_forecast_snapshots(tmp_path):
+    for day, value in [(0, 10), (1, 20), (2, 30)]:
+        start = START + timedelta(days=day)
+        (tmp_path / f"{start:%Y%m%d}.json").write_text(
+            json.dumps(records(start, [value] * 4))
+        )
+    local = LocalForecast(tmp_path)
+    assert local.load(START + timedelta(hours=30), "OX1").values[0] == 20
+    assert local.load(START + timedelta(days=5), "OX1").values[0] == 30
+    # Requests before all snapshots use the first one
+    assert local.load(START - timedelta(days=1), "OX1").values[0] == 10
+    assert local.request_url(START, "OX1").endswith("20230504.json")
+
+
+def test_local_forecast_replay():
+    replay_from = START + timedelta(minutes=45)
+    local = LocalForecast(CSV, replay_from=replay_from)
+    now = datetime(2030, 1, 1, 9, 0, tzinfo=timezone.utc)
+    forecast = local.load(now, "OX1")
+    archived = read_forecast_file(CSV)
+    assert forecast.values.tolist() == archived.values.tolist()
+    assert forecast[0].datetime == START + (now - replay_from)
+
+
+def test_get_CI_forecast_local():
+    interface = local_api_interface(CSV, replay_from=START)
+    forecast = get_CI_forecast("OX1", interface)
+    assert forecast.values.tolist() == read_forecast_file(CSV).values.tolist()
+    now = datetime.now(timezone.utc)
+    assert abs(forecast[0].datetime - now) < timedelta(minutes=1)
@@ -1,6 +1,10 @@
 # Tests main() function
+import json
+import re
 import subprocess
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
 from unittest.mock import patch
 
 import pytest
@@ -8,9 +12,20 @@ import pytest
 from cats.cli import print_banner, main
 from cats.CI_api_interface import API_interfaces, InvalidLocationError
 from cats.constants import CATS_ASCII_BANNER_COLOUR, CATS_ASCII_BANNER_NO_COLOUR
-from cats.forecast import CarbonIntensityAverageEstimate
+from cats.forecast import (
+    CarbonIntensityAverageEstimate,
+    CarbonIntensitySeries,
+    WindowedForecast,
+)
 from cats.output import CATSOutput
-from cats.schedulers import SCHEDULER_DATE_FORMAT, schedule_at, schedule_sbatch
+from cats.resilience import CircuitOpenError
+from cats.schedulers import (
+    SCHEDULER_DATE_FORMAT,
+    schedule_at,
+    schedule_sbatch,
+    schedule_sbatch_segments,
+)
+from cats.window_cache import WindowCache
 
 API = API_interfaces["carbonintensity.org.uk"]
 
@@ -50,6 +65,46 @@ def test_schedule_sbatch_success(fp):
     schedule_sbatch(OUTPUT, ["./script.sh"])
 
 
+def test_schedule_sbatch_segments(fp, capsys):
+    later_start = now_start + timedelta(hours=2)
+    segments = [
+        OUTPUT.carbonIntensityOptimal,
+        CarbonIntensityAverageEstimate(
+            20, later_start, later_start + timedelta(minutes=30), 0.0, 0.0
+        ),
+    ]
+    fp.register_subprocess(
+        [
+            "sbatch",
+            "--parsable",
+            "--begin",
+            now_start.strftime(SCHEDULER_DATE_FORMAT["sbatch"]),
+            "--time",
+            "5",
+            "./script.sh",
+        ],
+        stdout=b"123456\n",
+    )
+    fp.register_subprocess(
+        [
+            "sbatch",
+            "--parsable",
+            "--begin",
+            later_start.strftime(SCHEDULER_DATE_FORMAT["sbatch"]),
+            "--time",
+            "30",
+            "--dependency",
+            "afterany:123456",
+            "./script.sh",
+        ],
+        stdout=b"123457;cluster\n",
+    )
+    assert schedule_sbatch_segments(segments, ["./script.sh"]) is None
+    assert capsys.readouterr().out == (
+        "Submitted batch job 123456\nSubmitted batch job 123457\n"
+    )
+
+
 def test_schedule_sbatch_failure():
     assert schedule_sbatch(OUTPUT, ["./script.sh"])
 
@@ -106,7 +161,7 @@ def test_schedule_at_side_effects(exc, err):
         assert schedule_at(OUTPUT, ["ls"]) == err
 
 
-def raiseLocationError():
+def raiseLocationError(*args):
     raise InvalidLocationError
 
 
@@ -123,3 +178,287 @@ def test_main_failures(get_CI_forecast):
 
     # Duration larger than API maximum
     assert main(["-d", "5000", "--loc", "OX1"]) == 1
+
+    # Invalid configuration
+    assert main(["-d", "5", "--loc", "OX1", "--api", "doesnotexist.co.uk"]) == 1
+    assert main(["-d", "5", "--loc", "OX1", "--profile", "tpu"]) == 1
+
+
+def forecast_from_now(values, step=30):
+    "Forecast series starting on the last half hour, as returned by the API"
+    start = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    start -= timedelta(minutes=start.minute % step)
+    return CarbonIntensitySeries(
+        times=[start.timestamp() + i * step * 60 for i in range(len(values))],
+        values=values,
+        tzinfo=timezone.utc,
+    )
+
+
+class FrozenDatetime(datetime):
+    frozen = datetime.now(timezone.utc)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.frozen.astimezone(tz)
+
+
+@patch("cats.cli.get_CI_forecast")
+def test_main_window_cache(get_CI_forecast, tmp_path, capsys, monkeypatch):
+    get_CI_forecast.return_value = forecast_from_now([100, 90, 20, 30, 60, 10] * 4)
+    args = ["-d", "60", "--loc", "OX1", "--format", "json", "--top", "2"]
+    path = tmp_path / "windows.json"
+    minute = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    monkeypatch.setattr("cats.cli.datetime", SimpleNamespace(datetime=FrozenDatetime))
+    with (
+        patch("cats.window_cache.default_cache_path", return_value=str(path)),
+        patch("cats.window_cache.WindowedForecast", wraps=WindowedForecast) as wf,
+    ):
+        outputs = []
+        for seconds in [10, 40]:
+            # Each run starts with an empty cache in memory, as a new process
+            monkeypatch.setattr("cats.planner._window_cache", WindowCache())
+            FrozenDatetime.frozen = minute + timedelta(seconds=seconds)
+            assert main(args) == 0
+            assert path.exists()
+            outputs.append(json.loads(capsys.readouterr().out))
+    # The second run, in the same minute, finds the windows saved by the
+    # first one, shifted to its start time
+    wf.assert_called_once()
+    ranked = [o["carbonIntensityRanked"] for o in outputs]
+    assert [w["value"] for w in ranked[0]] == [w["value"] for w in ranked[1]]
+    assert [
+        datetime.fromisoformat(w["start"]) + timedelta(seconds=30) for w in ranked[0]
+    ] == [datetime.fromisoformat(w["start"]) for w in ranked[1]]
+
+
+@patch("cats.cli.get_CI_forecast")
+def test_main_top(get_CI_forecast, capsys):
+    get_CI_forecast.return_value = forecast_from_now(
+        [100, 90, 80, 20, 30, 60, 10, 50, 70, 40] * 4
+    )
+    assert main(["-d", "30", "--loc", "OX1", "--format", "json", "--top", "3"]) == 0
+    output = json.loads(capsys.readouterr().out)
+    ranked = output["carbonIntensityRanked"]
+    assert len(ranked) == 3
+    assert ranked[0] == output["carbonIntensityOptimal"]
+    assert [r["value"] for r in ranked] == sorted(r["value"] for r in ranked)
+
+    assert (
+        main(
+            [
+                "-d",
+                "30",
+                "--loc",
+                "OX1",
+                "--format",
+                "json",
+                "--top",
+                "3",
+                "--min-gap",
+                "600",
+            ]
+        )
+        == 0
+    )
+    starts = sorted(
+        datetime.fromisoformat(r["start"])
+        for r in json.loads(capsys.readouterr().out)["carbonIntensityRanked"]
+    )
+    assert all(b - a >= timedelta(minutes=600) for a, b in zip(starts[:-1], starts[1:]))
+
+
+@patch("cats.cli.get_CI_forecast")
+def test_main_durations(get_CI_forecast, capsys):
+    get_CI_forecast.return_value = forecast_from_now(
+        [100, 90, 80, 20, 30, 60, 10, 50, 70, 40] * 4
+    )
+    assert (
+        main(
+            [
+                "-d",
+                "30",
+                "--loc",
+                "OX1",
+                "--format",
+                "json",
+                "--durations",
+                "60,90,5000",
+            ]
+        )
+        == 0
+    )
+    by_duration = json.loads(capsys.readouterr().out)["carbonIntensityByDuration"]
+    assert list(by_duration) == ["60", "90", "5000"]
+    assert by_duration["60"]["value"] <= by_duration["90"]["value"]
+    assert by_duration["5000"] is None
+
+
+@patch("cats.cli.get_CI_forecast")
+def test_main_exact_start(get_CI_forecast, capsys):
+    get_CI_forecast.return_value = forecast_from_now(
+        [100, 90, 80, 20, 30, 60, 10, 50, 70, 40] * 4
+    )
+    args = ["-d", "45", "--loc", "OX1", "--format", "json"]
+    assert main(args) == 0
+    grid = json.loads(capsys.readouterr().out)["carbonIntensityOptimal"]
+    assert main([*args, "--exact-start"]) == 0
+    exact = json.loads(capsys.readouterr().out)["carbonIntensityOptimal"]
+    assert exact["value"] <= grid["value"]
+    assert datetime.fromisoformat(exact["start"]).second == 0
+
+
+@patch("cats.cli.get_CI_forecast")
+def test_main_batch(get_CI_forecast, capsys, tmp_path):
+    get_CI_forecast.return_value = forecast_from_now(
+        [100, 90, 80, 20, 30, 60, 10, 50, 70, 40] * 4
+    )
+    jobs = tmp_path / "jobs.csv"
+    jobs.write_text("60,2\n60,2\n30,1\n")
+    args = ["-d", "60", "--loc", "OX1", "--format", "json", "--jobs", str(jobs)]
+    assert main([*args, "--capacity", "3"]) == 0
+    batch = json.loads(capsys.readouterr().out)["carbonIntensityBatch"]
+    assert len(batch) == 3
+    # Both large jobs cannot run at the same time
+    assert batch[0]["start"] != batch[1]["start"]
+
+    # Capacity is required
+    assert main(args) == 1
+    jobs.write_text("sixty\n")
+    assert main([*args, "--capacity", "3"]) == 1
+
+
+@patch("cats.cli.get_CI_forecasts")
+def test_main_locations(get_CI_forecasts, tmp_path, capsys):
+    get_CI_forecasts.return_value = {
+        "OX1": forecast_from_now([100, 90, 80, 70, 60, 50, 40, 30, 20, 10] * 4),
+        "EH8": forecast_from_now([10, 20, 30, 40, 50, 60, 70, 80, 90, 10] * 4),
+    }
+    args = ["-d", "60", "--sites", "OX1,EH8", "--format", "json"]
+    assert main(args) == 0
+    get_CI_forecasts.assert_called_once()
+    assert get_CI_forecasts.call_args[0][0] == ["OX1", "EH8"]
+    output = json.loads(capsys.readouterr().out)
+    assert output["location"] == "EH8"
+    placements = output["carbonIntensityPlacements"]
+    assert [p["location"] for p in placements] == ["EH8", "OX1"]
+    assert placements[0]["window"] == output["carbonIntensityOptimal"]
+
+    # Emissions are estimated at the chosen site
+    config = {
+        "PUE": 1.2,
+        "profiles": {
+            "cpu": {"cpu": {"power": 10, "nunits": 2}},
+            "small": {"cpu": {"power": 5, "nunits": 2}},
+        },
+        "sites": {"OX1": {"PUE": 1.5}, "EH8": {"PUE": 1.1, "profile": "small"}},
+    }
+    (tmp_path / "config.yml").write_text(json.dumps(config))
+    footprint = ["--config", str(tmp_path / "config.yml"), "--footprint"]
+    assert main([*args, *footprint, "--memory", "8"]) == 0
+    output = json.loads(capsys.readouterr().out)
+    placement = output["carbonIntensityPlacements"][0]
+    assert placement["location"] == output["location"] == "EH8"
+    now, best, savings = output["emmissionEstimate"]
+    # up to the window cache, see WindowCache.windows()
+    assert best == pytest.approx(placement["emissions"], rel=1e-3)
+
+    get_CI_forecasts.side_effect = InvalidLocationError
+    assert main(args) == 1
+
+
+@patch("cats.cli.get_CI_forecast")
+def test_main_unavailable(get_CI_forecast):
+    get_CI_forecast.side_effect = CircuitOpenError
+    assert main(["-d", "60", "--loc", "OX1"]) == 1
+
+
+@patch("cats.cli.get_CI_forecast_or_stale")
+def test_main_max_stale(get_CI_forecast_or_stale, capsys):
+    forecast = forecast_from_now([100, 90, 80, 20, 30, 60, 10, 50, 70, 40] * 4)
+    get_CI_forecast_or_stale.return_value = forecast, True
+    args = ["-d", "60", "--loc", "OX1", "--format", "json", "--max-stale", "90"]
+    assert main([*args, "--timeout", "2"]) == 0
+    assert get_CI_forecast_or_stale.call_args[0][2:] == (5400, 2)
+    assert json.loads(capsys.readouterr().out)["forecastStale"] is True
+
+
+@patch("cats.cli.get_CI_forecast")
+def test_main_segments(get_CI_forecast, capsys):
+    get_CI_forecast.return_value = forecast_from_now(
+        [100, 90, 80, 20, 30, 60, 10, 50, 70, 40] * 4
+    )
+    args = ["-d", "60", "--loc", "OX1", "--format", "json", "--max-segments", "2"]
+    assert main(args) == 0
+    segments = json.loads(capsys.readouterr().out)["carbonIntensitySegments"]
+    assert 1 <= len(segments) <= 2
+
+    # Segments can only be scheduled with sbatch
+    assert main(args + ["-s", "at", "-c", "ls"]) == 1
+
+
+def test_main_local_forecast(capsys):
+    args = [
+        "-d",
+        "60",
+        "--loc",
+        "OX1",
+        "--format",
+        "json",
+        "--api",
+        "file:tests/carbon_intensity_24h.csv",
+    ]
+    # Replayed forecasts are the same relative to now on every run
+    outputs = []
+    for _ in range(2):
+        assert main([*args, "--replay-from", "2023-05-04T12:30Z"]) == 0
+        outputs.append(json.loads(capsys.readouterr().out))
+    assert outputs[0]["carbonIntensityOptimal"]["value"] == pytest.approx(
+        outputs[1]["carbonIntensityOptimal"]["value"]
+    )
+
+    # Without replay, the forecast ends before the job could start
+    assert main(args) == 1
+    assert "Error in planning job" in capsys.readouterr().out
+
+
+def slow(seconds, value):
+    def function(*args, **kwargs):
+        time.sleep(seconds)
+        return value
+
+    return function
+
+
+@patch("cats.cli.get_runtime_config")
+@patch("cats.cli.get_CI_forecast")
+def test_main_speculative_forecast(
+    get_CI_forecast, get_runtime_config, tmp_path, monkeypatch, capsys
+):
+    monkeypatch.setattr("cats.configure.last_location_path", str(tmp_path / "loc"))
+    forecast = forecast_from_now([100, 90, 80, 20, 30, 60, 10, 50, 70, 40] * 4)
+    get_CI_forecast.side_effect = slow(0.2, forecast)
+    get_runtime_config.side_effect = slow(0.2, (API, "OX1", 60, None, None, None))
+
+    # The forecast is fetched while the configuration is read
+    assert main(["-d", "60", "--loc", "OX1", "--timings"]) == 0
+    get_CI_forecast.assert_called_once_with("OX1", API, (5, 30))
+    report = capsys.readouterr().err
+    saved = int(re.search(r"saved (\d+) ms", report).group(1))
+    assert 100 < saved <= 250
+
+    # Without a location, the location of the previous such run is used
+    get_CI_forecast.reset_mock()
+    assert main(["-d", "60", "--timings"]) == 0
+    get_CI_forecast.assert_called_once()
+    assert (tmp_path / "loc").read_text() == "OX1"
+    assert main(["-d", "60", "--timings"]) == 0
+    assert "saved 0 ms" not in capsys.readouterr().err.splitlines()[-1]
+
+    # A wrong guess is discarded
+    (tmp_path / "loc").write_text("M15")
+    get_CI_forecast.reset_mock()
+    assert main(["-d", "60", "--timings"]) == 0
+    assert sorted(c.args[0] for c in get_CI_forecast.call_args_list) == ["M15", "OX1"]
+    assert "discarded the forecast fetched for M15" in capsys.readouterr().err
+    assert (tmp_path / "loc").read_text() == "OX1"
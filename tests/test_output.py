@@ -5,6 +5,7 @@ import pytest
 from cats.output import CATSOutput
 from cats.carbonFootprint import Estimates
 from cats.forecast import CarbonIntensityAverageEstimate
+from cats.placement import Placement
 
 now_start = datetime(2024, 3, 15, 16, 0, 0)  # 4pm - 5pm
 now_end = datetime(2024, 3, 15, 17, 0, 0)
@@ -27,6 +28,63 @@ OUTPUT_WITH_EMISSION_ESTIMATE = CATSOutput(
     Estimates(19, 9, 10),
 )
 
+OUTPUT_WITH_RANKED = CATSOutput(
+    CarbonIntensityAverageEstimate(50, now_start, now_end, 0.0, 0.0),
+    CarbonIntensityAverageEstimate(20, optimal_start, optimal_end, 0.0, 0.0),
+    "OX1",
+    "GBR",
+    carbonIntensityRanked=[
+        CarbonIntensityAverageEstimate(20, optimal_start, optimal_end, 0.0, 0.0),
+        CarbonIntensityAverageEstimate(25, now_start, now_end, 0.0, 0.0),
+    ],
+)
+
+OUTPUT_BY_DURATION = CATSOutput(
+    CarbonIntensityAverageEstimate(50, now_start, now_end, 0.0, 0.0),
+    CarbonIntensityAverageEstimate(20, optimal_start, optimal_end, 0.0, 0.0),
+    "OX1",
+    "GBR",
+    carbonIntensityByDuration={
+        120: CarbonIntensityAverageEstimate(25, optimal_start, now_end, 0.0, 0.0),
+        5000: None,
+    },
+)
+
+OUTPUT_BATCH = CATSOutput(
+    CarbonIntensityAverageEstimate(50, now_start, now_end, 0.0, 0.0),
+    CarbonIntensityAverageEstimate(20, optimal_start, optimal_end, 0.0, 0.0),
+    "OX1",
+    "GBR",
+    carbonIntensityBatch=[
+        CarbonIntensityAverageEstimate(20, optimal_start, optimal_end, 0.0, 0.0),
+        None,
+    ],
+)
+
+OUTPUT_PLACEMENTS = CATSOutput(
+    CarbonIntensityAverageEstimate(50, now_start, now_end, 0.0, 0.0),
+    CarbonIntensityAverageEstimate(20, optimal_start, optimal_end, 0.0, 0.0),
+    "OX1",
+    "GBR",
+    carbonIntensityPlacements=[
+        Placement(
+            "OX1",
+            CarbonIntensityAverageEstimate(20, optimal_start, optimal_end, 0.0, 0.0),
+        ),
+        Placement(
+            "EH8", CarbonIntensityAverageEstimate(25, now_start, now_end, 0.0, 0.0)
+        ),
+    ],
+)
+
+OUTPUT_STALE = CATSOutput(
+    CarbonIntensityAverageEstimate(50, now_start, now_end, 0.0, 0.0),
+    CarbonIntensityAverageEstimate(20, optimal_start, optimal_end, 0.0, 0.0),
+    "OX1",
+    "GBR",
+    forecastStale=True,
+)
+
 
 @pytest.mark.parametrize(
     "output,expected",
@@ -47,6 +105,54 @@ Carbon intensity at optimal time          = 20.00 gCO2eq/kWh
 Estimated emissions if job started now    = 19
 Estimated emissions at optimal time       = 9 (- 10)""",
         ),
+        (
+            OUTPUT_WITH_RANKED,
+            """
+Best job start time                       = 2024-03-16 02:00:00
+Carbon intensity if job started now       = 50.00 gCO2eq/kWh
+Carbon intensity at optimal time          = 20.00 gCO2eq/kWh
+Best job start times (carbon intensity):
+   1. 2024-03-16 02:00:00 (20.00 gCO2eq/kWh)
+   2. 2024-03-15 16:00:00 (25.00 gCO2eq/kWh)""",
+        ),
+        (
+            OUTPUT_BY_DURATION,
+            """
+Best job start time                       = 2024-03-16 02:00:00
+Carbon intensity if job started now       = 50.00 gCO2eq/kWh
+Carbon intensity at optimal time          = 20.00 gCO2eq/kWh
+Best job start time by job duration (carbon intensity):
+   120 min: 2024-03-16 02:00:00 (25.00 gCO2eq/kWh)
+  5000 min: no forecast available""",
+        ),
+        (
+            OUTPUT_BATCH,
+            """
+Best job start time                       = 2024-03-16 02:00:00
+Carbon intensity if job started now       = 50.00 gCO2eq/kWh
+Carbon intensity at optimal time          = 20.00 gCO2eq/kWh
+Batch job start times (carbon intensity):
+   1. 2024-03-16 02:00:00 (20.00 gCO2eq/kWh)
+   2. no capacity available""",
+        ),
+        (
+            OUTPUT_STALE,
+            """
+Best job start time                       = 2024-03-16 02:00:00
+Carbon intensity if job started now       = 50.00 gCO2eq/kWh
+Carbon intensity at optimal time          = 20.00 gCO2eq/kWh
+Warning: the current forecast is unavailable, using a stale one""",
+        ),
+        (
+            OUTPUT_PLACEMENTS,
+            """
+Best job start time                       = 2024-03-16 02:00:00
+Carbon intensity if job started now       = 50.00 gCO2eq/kWh
+Carbon intensity at optimal time          = 20.00 gCO2eq/kWh
+Best job start time by location (carbon intensity):
+     OX1: 2024-03-16 02:00:00 (20.00 gCO2eq/kWh)
+     EH8: 2024-03-15 16:00:00 (25.00 gCO2eq/kWh)""",
+        ),
     ],
 )
 def test_string_repr(output, expected):
@@ -94,3 +200,44 @@ def test_output_json(output, expected):
 def test_output_json_with_dateformat(output, expected):
     # use date format expected by at(1)
     assert output.to_json(dateformat="%Y%m%d%H%M", sort_keys=2) == expected
+
+
+
+def test_output_json_ranked():
+    assert OUTPUT_WITH_RANKED.to_json(dateformat="%Y%m%d%H%M", sort_keys=2).endswith(
+        """"carbonIntensityRanked": ["""
+        """{"end": "202403160300", "end_value": 0.0, "start": "202403160200", "start_value": 0.0, "value": 20}, """
+        """{"end": "202403151700", "end_value": 0.0, "start": "202403151600", "start_value": 0.0, "value": 25}], """
+        """"colour": false, "countryISO3": "GBR", "emmissionEstimate": null, "location": "OX1"}"""
+    )
+
+
+def test_output_json_by_duration():
+    assert OUTPUT_BY_DURATION.to_json(dateformat="%Y%m%d%H%M", sort_keys=2).startswith(
+        """{"carbonIntensityByDuration": {"120": """
+        """{"end": "202403151700", "end_value": 0.0, "start": "202403160200", "start_value": 0.0, "value": 25}, """
+        """"5000": null}, """
+    )
+
+
+def test_output_json_batch():
+    assert OUTPUT_BATCH.to_json(dateformat="%Y%m%d%H%M", sort_keys=2).startswith(
+        """{"carbonIntensityBatch": ["""
+        """{"end": "202403160300", "end_value": 0.0, "start": "202403160200", "start_value": 0.0, "value": 20}, """
+        """null], """
+    )
+
+
+def test_output_json_placements():
+    assert OUTPUT_PLACEMENTS.to_json(dateformat="%Y%m%d%H%M", sort_keys=2).startswith(
+        """{"carbonIntensityNow": {"end": "202403151700", "end_value": 0.0, "start": "202403151600", "start_value": 0.0, "value": 50}, """
+        """"carbonIntensityOptimal": {"end": "202403160300", "end_value": 0.0, "start": "202403160200", "start_value": 0.0, "value": 20}, """
+        """"carbonIntensityPlacements": [{"emissions": null, "location": "OX1", "window": """
+        """{"end": "202403160300", "end_value": 0.0, "start": "202403160200", "start_value": 0.0, "value": 20}}, """
+    )
+
+
+def test_output_json_stale():
+    assert OUTPUT_STALE.to_json(sort_keys=2).endswith(
+        """"forecastStale": true, "location": "OX1"}"""
+    )
@@ -0,0 +1,57 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from cats.forecast import CarbonIntensitySeries, WindowedForecast
+from cats.placement import Site, rank_placements
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def series(values):
+    return CarbonIntensitySeries(
+        times=[START.timestamp() + i * 1800 for i in range(len(values))],
+        values=values,
+        tzinfo=timezone.utc,
+    )
+
+
+FORECASTS = {
+    "OX1": series([50, 40, 10, 12, 60, 70, 8, 9, 30]),
+    "EH8": series([20, 20, 20, 15, 15, 15, 20, 20, 20]),
+    "M15": series([90, 80, 70, 60, 50, 40, 30, 20, 10]),
+}
+
+
+def test_rank_placements():
+    sites = [Site("OX1"), Site("EH8"), Site("M15")]
+    placements = rank_placements(sites, FORECASTS, 60, START)
+    assert [p.location for p in placements] == ["OX1", "EH8", "M15"]
+    for p in placements:
+        assert p.window == WindowedForecast(FORECASTS[p.location], 60, START).best()[0]
+        assert p.emissions is None
+
+    # Sites are ranked by intensity weighted by PUE
+    sites = [Site("OX1", PUE=2.0), Site("EH8"), Site("M15", PUE=1.5)]
+    placements = rank_placements(sites, FORECASTS, 60, START)
+    assert [p.location for p in placements] == ["EH8", "OX1", "M15"]
+
+    assert rank_placements([], FORECASTS, 60, START) == []
+
+
+def test_rank_placements_emissions():
+    sites = [
+        Site("OX1", PUE=1.2, power=100),
+        Site("EH8", PUE=1.5, power=50, power_curve=[(0, 0.5), (30, 1.0)]),
+    ]
+    placements = rank_placements(sites, FORECASTS, 60, START, max_window_minutes=90)
+    by_location = {p.location: p for p in placements}
+    ox1 = by_location["OX1"]
+    assert ox1.emissions == pytest.approx(1.2 * 100 / 1000 * ox1.window.value)
+    eh8 = by_location["EH8"]
+    assert eh8.emissions == pytest.approx(1.5 * 50 * 0.75 / 1000 * eh8.window.value)
+    assert ox1.window.start <= START.replace(hour=1, minute=30)
+    assert placements[0].emissions <= placements[1].emissions
+
+    with pytest.raises(ValueError):
+        rank_placements([Site("OX1", power=100), Site("EH8")], FORECASTS, 60, START)
@@ -0,0 +1,132 @@
+import json
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+import cats
+from cats.CI_api_interface import InvalidLocationError
+from cats.cli import main
+from cats.forecast import WindowedForecast
+from cats.local_forecast import read_forecast_file
+from cats.output import CATSOutput
+from cats.planner import Planner
+
+CSV = Path(__file__).parent / "carbon_intensity_24h.csv"
+NOW = datetime(2023, 5, 4, 12, 45, tzinfo=timezone.utc)
+FORECAST = read_forecast_file(CSV)
+
+CONFIG = {
+    "PUE": 1.2,
+    "profiles": {
+        "cpu": {"cpu": {"power": 10, "nunits": 4}},
+        "gpu": {
+            "gpu": {"power": 300, "nunits": 1},
+            "power_curve": [[0, 0.3], [15, 1.0]],
+        },
+    },
+}
+
+
+def test_planner_export():
+    assert cats.Planner is Planner
+    with pytest.raises(AttributeError):
+        cats.Scheduler
+
+
+def test_plan_as_cli(capsys):
+    args = ["-d", "60", "--loc", "OX1", "--format", "json", "--top", "3"]
+    args += ["--api", f"file:{CSV}", "--replay-from", "2023-05-04T12:30Z"]
+    assert main(args) == 0
+    expected = json.loads(capsys.readouterr().out)
+
+    planner = Planner(f"file:{CSV}", {}, replay_from="2023-05-04T12:30Z")
+    output = planner.plan(60, "OX1", top=3)
+    assert isinstance(output, CATSOutput)
+    assert output.location == "OX1"
+    assert [w.value for w in output.carbonIntensityRanked] == pytest.approx(
+        [w["value"] for w in expected["carbonIntensityRanked"]]
+    )
+
+
+def test_plan():
+    planner = Planner(f"file:{CSV}", CONFIG, location="OX1")
+    output = planner.plan(60, now=NOW)
+    wf = WindowedForecast(FORECAST, 60, start=NOW, max_window_minutes=2820)
+    assert output.carbonIntensityNow == wf[0]
+    assert output.carbonIntensityOptimal == wf.best()[0]
+    assert output.emmissionEstimate is None and output.forecastStale is None
+
+    output = planner.plan(60, now=NOW, end="2023-05-04T18:00Z", durations=[30, 90])
+    assert output.carbonIntensityOptimal.start <= datetime.fromisoformat(
+        "2023-05-04T18:00+00:00"
+    )
+    assert list(output.carbonIntensityByDuration) == [30, 90]
+    start = NOW + timedelta(hours=6)
+    output = planner.plan(60, now=NOW, start=start, exact_start="minute")
+    assert output.carbonIntensityNow.start == start
+
+    # Power curves weight the carbon intensity over the job duration
+    curve = WindowedForecast(
+        FORECAST,
+        60,
+        start=NOW,
+        max_window_minutes=2820,
+        power_curve=[(0, 0.3), (15, 1.0)],
+    )
+    output = planner.plan(60, profile="gpu", now=NOW)
+    assert output.carbonIntensityOptimal == curve.best()[0]
+
+    output = planner.plan(60, footprint=True, profile="cpu", memory=8, now=NOW)
+    assert output.emmissionEstimate.savings > 0
+    output = planner.plan(60, footprint=True, profile="cpu", cpu=8, memory=8, now=NOW)
+    assert output.emmissionEstimate.savings > 0
+
+
+def test_plan_errors():
+    planner = Planner(f"file:{CSV}", CONFIG, location="OX1")
+    with pytest.raises(ValueError, match="positive"):
+        planner.plan(0)
+    with pytest.raises(ValueError, match="exceeds the window"):
+        planner.plan(60, window=30)
+    with pytest.raises(ValueError, match="before end window"):
+        planner.plan(60, start="2023-05-05T02:00Z", end="2023-05-05T01:00Z")
+    with pytest.raises(ValueError, match="Profile tpu"):
+        planner.plan(60, profile="tpu")
+    with pytest.raises(ValueError, match="memory"):
+        planner.plan(60, footprint=True)
+    with pytest.raises(ValueError, match="PUE"):
+        Planner(f"file:{CSV}", {"profiles": CONFIG["profiles"]}).plan(
+            60, "OX1", footprint=True, memory=8
+        )
+    with pytest.raises(ValueError, match="No profiles"):
+        Planner(f"file:{CSV}", {}).plan(60, "OX1", profile="cpu")
+    with pytest.raises(ValueError, match="data point"):
+        planner.plan(60, now=NOW + timedelta(days=3))
+    with pytest.raises(ValueError, match="No valid window"):
+        planner.plan(60, now=NOW, end=NOW)
+    with pytest.raises(ValueError, match="not a valid API"):
+        Planner("doesnotexist.co.uk", {})
+    with pytest.raises(ValueError, match="power_curve"):
+        Planner(f"file:{CSV}", {"profiles": {"cpu": {"power_curve": [[5, 1]]}}}).plan(
+            60, "OX1", profile="cpu"
+        )
+
+
+@patch("cats.planner.get_CI_forecast", side_effect=InvalidLocationError)
+def test_plan_invalid_location(get_CI_forecast):
+    planner = Planner("carbonintensity.org.uk", {})
+    with pytest.raises(InvalidLocationError):
+        planner.plan(60, "XX1")
+
+
+@patch("cats.planner.get_CI_forecast_or_stale", return_value=(FORECAST, True))
+@patch("cats.planner.config_from_file", return_value=CONFIG)
+def test_plan_setup_once(config_from_file, get_CI_forecast_or_stale):
+    planner = Planner("carbonintensity.org.uk", location="OX1", max_stale=30)
+    for _ in range(3):
+        output = planner.plan(60, profile="gpu", now=NOW)
+        assert output.forecastStale
+    config_from_file.assert_called_once()
+    assert get_CI_forecast_or_stale.call_args.args[2] == 1800
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import yaml
+
+from cats.CI_api_interface import InvalidLocationError
+from cats.cli import main
+from cats.prefetch import next_run, prefetch
+
+
+def epoch(*args):
+    return datetime(2024, 1, 1, *args, tzinfo=timezone.utc).timestamp()
+
+
+def test_next_run():
+    assert next_run(epoch(12, 0), 90) == epoch(12, 1, 30)
+    assert next_run(epoch(12, 1, 29), 90) == epoch(12, 1, 30)
+    assert next_run(epoch(12, 1, 30), 90) == epoch(12, 31, 30)
+    assert next_run(epoch(12, 45), 90) == epoch(13, 1, 30)
+
+
+@patch("cats.prefetch.get_CI_forecast")
+def test_prefetch(get_CI_forecast):
+    def fetch(location, iface, timeout):
+        if location == "XX1":
+            raise InvalidLocationError
+
+    get_CI_forecast.side_effect = fetch
+    errors = prefetch(["OX1", "XX1", "M15"], None, timeout=2)
+    assert list(errors) == ["OX1", "XX1", "M15"]
+    assert errors["OX1"] is None and errors["M15"] is None
+    assert isinstance(errors["XX1"], InvalidLocationError)
+    assert prefetch([], None) == {}
+
+
+@patch("cats.prefetch.get_CI_forecast")
+def test_main_prefetch_once(get_CI_forecast, tmp_path, capsys):
+    config = tmp_path / "config.yml"
+    config.write_text(yaml.dump({"location": "OX1", "sites": {"M15": {}, "EH8": {}}}))
+    assert main(["prefetch", "--once", "--config", str(config)]) == 0
+    assert sorted(c.args[0] for c in get_CI_forecast.call_args_list) == ["EH8", "M15"]
+    assert "fetched forecasts for 2 of 2 locations" in capsys.readouterr().out
+
+    get_CI_forecast.reset_mock()
+    config.write_text(yaml.dump({"location": "OX1"}))
+    assert main(["prefetch", "--once", "--config", str(config)]) == 0
+    assert [c.args[0] for c in get_CI_forecast.call_args_list] == ["OX1"]
+
+    get_CI_forecast.side_effect = InvalidLocationError
+    args = ["prefetch", "--once", "--config", str(config), "--sites", "XX1"]
+    assert main(args) == 1
+    assert main([*args, "--api", "doesnotexist.co.uk"]) == 1
+
+
+@patch("cats.prefetch.time.sleep", side_effect=KeyboardInterrupt)
+@patch("cats.prefetch.get_CI_forecast")
+def test_main_prefetch_loop(get_CI_forecast, sleep, capsys):
+    assert main(["prefetch", "--api", "carbonintensity.org.uk", "-l", "OX1"]) == 0
+    get_CI_forecast.assert_called_once()
+    assert 0 < sleep.call_args.args[0] <= 1800
@@ -82,4 +82,33 @@ def test_32_bug_report():
         start_value= interp1, 
         end_value= interp2 
     )
-    assert best_avg == expected_best
\ No newline at end of file
+    assert best_avg == expected_best
+
+def test_start_before_first_data_point():
+    """
+    Jobs starting before the first data point, as with local or replayed
+    forecasts, extrapolate intensity from the first data interval rather
+    than wrapping around to the last data point.
+    """
+    d = datetime(year=2024, month=1, day=1)
+    data = [
+        CarbonIntensityPointEstimate(datetime=d + timedelta(minutes=30 * i), value=v)
+        for i, v in enumerate([100, 20, 300, 400, 500, 600])
+    ]
+    result = WindowedForecast(data, 60, start=d - timedelta(minutes=10))
+
+    # The line through the first two points is 126.67 ten minutes before
+    # the first point, and 206.67 at the job end, fifty minutes after it
+    start_value = 100 + (100 - 20) / 3
+    end_value = 20 + (300 - 20) * 20 / 30
+    value = (
+        0.5 * (start_value + 20) * 40 + 0.5 * (20 + end_value) * 20
+    ) / 60
+    assert result[0] == CarbonIntensityAverageEstimate(
+        start=d - timedelta(minutes=10),
+        end=d + timedelta(minutes=50),
+        value=value,
+        start_value=start_value,
+        end_value=end_value,
+    )
+    assert result.optimal().value <= result[0].value
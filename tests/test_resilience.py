@@ -0,0 +1,93 @@
+from unittest.mock import Mock, patch
+
+import pytest
+import requests
+
+from cats.resilience import CircuitBreaker, CircuitOpenError, get_with_retries
+
+URL = "https://api.example.org/forecast"
+
+
+def response(status_code):
+    return Mock(status_code=status_code)
+
+
+@pytest.fixture
+def breaker(tmp_path):
+    return CircuitBreaker(tmp_path / "circuit.json", threshold=2, reset_after=60)
+
+
+@patch("cats.resilience.time.sleep")
+def test_get_with_retries(sleep, breaker):
+    session = Mock()
+    session.get.side_effect = [requests.Timeout, response(503), response(200)]
+    r = get_with_retries(session, URL, timeout=3, breaker=breaker)
+    assert r.status_code == 200
+    assert session.get.call_count == 3
+    assert session.get.call_args.kwargs["timeout"] == 3
+    # Jittered delays, at most doubled for each retry
+    delays = [c.args[0] for c in sleep.call_args_list]
+    assert 0 <= delays[0] <= 0.5 and 0 <= delays[1] <= 1.0
+
+    # Client errors are not retried
+    session.get.side_effect = [response(400)]
+    assert get_with_retries(session, URL, breaker=breaker).status_code == 400
+
+
+@patch("cats.resilience.time.sleep")
+def test_get_with_retries_failure(sleep, breaker):
+    session = Mock()
+    session.get.side_effect = requests.ConnectionError
+    with pytest.raises(requests.ConnectionError):
+        get_with_retries(session, URL, retries=1, breaker=breaker)
+    assert session.get.call_count == 2
+    assert not breaker.is_open(URL)
+
+    # Server errors are returned after the last retry
+    session.get.side_effect = None
+    session.get.return_value = response(500)
+    assert get_with_retries(session, URL, retries=1, breaker=breaker).status_code == 500
+    assert session.get.call_count == 4
+
+
+@patch("cats.resilience.time.sleep")
+def test_circuit_breaker(sleep, breaker, tmp_path):
+    session = Mock()
+    session.get.side_effect = requests.ConnectionError
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            get_with_retries(session, URL, retries=0, breaker=breaker)
+    # The circuit is open for all processes, and for the host only
+    assert CircuitBreaker(tmp_path / "circuit.json").is_open(URL + "?other")
+    assert not breaker.is_open("https://ipapi.co/json/")
+    with pytest.raises(CircuitOpenError):
+        get_with_retries(session, URL, breaker=breaker)
+    assert session.get.call_count == 2
+
+    # Then closed by the first successful request
+    with patch("cats.resilience.time.time", return_value=1e12):
+        assert not breaker.is_open(URL)
+        session.get.side_effect = [response(200)]
+        get_with_retries(session, URL, breaker=breaker)
+    assert not breaker.is_open(URL)
+    with pytest.raises(requests.ConnectionError):
+        session.get.side_effect = requests.ConnectionError
+        get_with_retries(session, URL, retries=0, breaker=breaker)
+    assert not breaker.is_open(URL)
+
+
+@patch("cats.resilience.time.sleep")
+def test_get_with_retries_deadline(sleep, breaker):
+    session = Mock()
+    session.get.side_effect = requests.Timeout
+    with patch("cats.resilience.time.monotonic", side_effect=[0, 1, 1, 11]):
+        with pytest.raises(requests.Timeout):
+            get_with_retries(
+                session, URL, timeout=(5, 30), deadline=10, backoff=0, breaker=breaker
+            )
+    # The second attempt is given the time left, and no third attempt is
+    # made past the deadline
+    assert session.get.call_count == 2
+    timeouts = [c.kwargs["timeout"] for c in session.get.call_args_list]
+    assert timeouts == [(5, 30), (5, 9)]
+    assert not breaker.is_open(URL)
@@ -0,0 +1,104 @@
+import json
+import socket
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+import cats.serve
+from cats.cli import main
+from cats.serve import query
+
+unix_only = pytest.mark.skipif(
+    not hasattr(socket, "AF_UNIX"), reason="Unix domain sockets not available"
+)
+
+ROOT = Path(__file__).parent.parent
+
+ARGS = [
+    "-d",
+    "60",
+    "--loc",
+    "OX1",
+    "--format",
+    "json",
+    "--api",
+    "file:tests/carbon_intensity_24h.csv",
+    "--replay-from",
+    "2023-05-04T12:30Z",
+]
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    socket_path = str(tmp_path / "cats.sock")
+    server = cats.serve.PlanningServer(socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield socket_path
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@unix_only
+def test_query(server, capsys):
+    assert main(ARGS) == 0
+    expected = json.loads(capsys.readouterr().out)
+    for _ in range(2):
+        status, stdout, stderr = query(ARGS, server)
+        assert status == 0
+        output = json.loads(stdout)
+        assert output["carbonIntensityOptimal"]["value"] == pytest.approx(
+            expected["carbonIntensityOptimal"]["value"]
+        )
+    status, stdout, stderr = query(["-d", "60", "--format", "xml"], server)
+    assert status == 2 and "invalid choice" in stderr
+
+
+@unix_only
+def test_main_sends_query(server, monkeypatch, capsys):
+    monkeypatch.setenv("CATS_SOCKET", server)
+    with patch("cats.serve.query", wraps=query) as send:
+        assert main(ARGS) == 0
+        send.assert_called_once_with(ARGS)
+        output = json.loads(capsys.readouterr().out)
+        assert output["carbonIntensityOptimal"]["start"]
+        # Commands are run by the client
+        assert main([*ARGS, "--command", "true"]) == 1
+        send.assert_called_once()
+    assert "specify the scheduler" in capsys.readouterr().out
+
+
+def test_main_without_server(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setenv("CATS_SOCKET", str(tmp_path / "missing.sock"))
+    assert main(ARGS) == 0
+    assert json.loads(capsys.readouterr().out)["carbonIntensityOptimal"]["start"]
+
+
+@unix_only
+def test_server_already_running(server):
+    with pytest.raises(OSError, match="already listening"):
+        cats.serve.PlanningServer(server)
+    assert main(["serve", "--socket", server]) == 1
+
+
+@unix_only
+def test_invalid_query(server):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(server)
+        sock.sendall(b"not json\n")
+        response = json.loads(sock.makefile("rb").readline())
+    assert response["status"] == 2 and "Invalid query" in response["stderr"]
+
+
+def test_serve_unavailable(monkeypatch, capsys):
+    # On Windows, cats serve fails with a message and cats answers queries
+    monkeypatch.setattr("cats.serve._UNIX_SOCKETS", False)
+    assert main(["serve"]) == 1
+    assert "not available" in capsys.readouterr().out
+    with pytest.raises(OSError):
+        query(ARGS)
@@ -0,0 +1,56 @@
+# Startup time of the cats command, which runs in every job submission
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+CSV = Path(__file__).parent / "carbon_intensity_24h.csv"
+
+# Time to import cats.cli and run cats --help, in seconds, excluding
+# the interpreter startup
+HELP_BUDGET = 0.1
+
+HEAVY_MODULES = ["matplotlib", "numpy", "requests", "requests_cache", "yaml"]
+
+
+def run_cats(*args) -> dict:
+    "Run cats in a new interpreter, returning run time and imported modules"
+    code = f"""
+import json, sys, time
+start = time.perf_counter()
+try:
+    from cats.cli import main
+    main({list(args)!r})
+except SystemExit:
+    pass
+finally:
+    elapsed = time.perf_counter() - start
+    heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]
+    print(json.dumps({{"elapsed": elapsed, "imported": heavy}}), file=sys.stderr)
+"""
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stderr.strip().splitlines()[-1])
+
+
+def test_help_startup():
+    run = run_cats("--help")
+    assert run["imported"] == []
+    assert run["elapsed"] < HELP_BUDGET
+
+
+def test_cached_forecast_startup():
+    # Forecasts read from disk need neither requests nor matplotlib
+    run = run_cats(
+        "-d",
+        "60",
+        "--loc",
+        "OX1",
+        "--api",
+        f"file:{CSV}",
+        "--replay-from",
+        "2023-05-04T12:30Z",
+    )
+    assert "numpy" in run["imported"]
+    assert not {"matplotlib", "requests", "requests_cache"} & set(run["imported"])
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from cats.forecast import CarbonIntensitySeries, WindowedForecast
+from cats.window_cache import WindowCache
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+VALUES = [50, 40, 10, 12, 60, 70, 8, 9, 30, 5, 80, 90, 20]
+
+
+def series(values=VALUES):
+    return CarbonIntensitySeries(
+        times=[START.timestamp() + i * 1800 for i in range(len(values))],
+        values=values,
+        tzinfo=timezone.utc,
+    )
+
+
+def test_digest():
+    assert series().digest() == series().digest()
+    assert series().digest() != series(VALUES[::-1]).digest()
+    assert series().digest() != series()[1:].digest()
+
+
+def test_cache_hit():
+    cache = WindowCache()
+    data = series()
+    expected = WindowedForecast(data, 60, START).best(3)
+    assert cache.best(data, 60, START, k=3) == expected
+    assert cache.best(series(), 60, START, k=3) == expected
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Any change in query parameters is a miss
+    cache.best(data, 60, START, k=3, min_gap=timedelta(hours=1))
+    cache.best(data, 60, START, power_curve=[(0, 1.0), (30, 0.5)])
+    cache.best(data, 60, START, end_constraint=START + timedelta(hours=3))
+    assert (cache.hits, cache.misses) == (1, 4)
+    assert len(cache) == 4
+
+
+def test_cache_start_rounded_to_minute():
+    cache = WindowCache()
+    data = series()
+    start = START + timedelta(seconds=5, microseconds=120)
+    now, ranked = cache.windows(data, 60, start, k=2)
+    assert now.start == start
+    assert (now, ranked) == (WindowedForecast(data, 60, start)[0], ranked)
+
+    # Queries in the same minute are hits, shifted to their start
+    later = start + timedelta(seconds=40)
+    now, shifted = cache.windows(data, 60, later, k=2)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert now.start == later
+    assert [w.start - later for w in shifted] == [w.start - start for w in ranked]
+    assert [w.value for w in shifted] == [w.value for w in ranked]
+
+    cache.windows(data, 60, START + timedelta(minutes=1), k=2)
+    assert cache.misses == 2
+    with pytest.raises(ValueError, match="No valid window"):
+        cache.windows(data, 60, START, end_constraint=START)
+
+
+def test_cache_invalidated_by_new_forecast():
+    cache = WindowCache()
+    cache.best(series(), 60, START)
+    new = series(VALUES[::-1])
+    assert cache.best(new, 60, START) == WindowedForecast(new, 60, START).best()
+    assert len(cache) == 1
+    assert cache.misses == 2
+
+
+def test_cache_lru_eviction():
+    cache = WindowCache(maxsize=2)
+    data = series()
+    cache.best(data, 30, START)
+    cache.best(data, 60, START)
+    cache.best(data, 30, START)  # 60 minutes is now least recently used
+    cache.best(data, 90, START)
+    assert len(cache) == 2
+    cache.best(data, 30, START)
+    cache.best(data, 60, START)
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_cache_errors_not_cached():
+    cache = WindowCache()
+    with pytest.raises(ValueError):
+        cache.best(series(), 6000, START)
+    assert len(cache) == 0
+
+
+def test_cache_persisted(tmp_path):
+    path = tmp_path / "windows.json"
+    data = series()
+    expected = WindowCache(path=path).best(data, 60, START, k=2)
+    cache = WindowCache(path=path)
+    assert cache.best(data, 60, START, k=2) == expected
+    assert (cache.hits, cache.misses) == (1, 0)
+
+    path.write_text("not json")
+    cache = WindowCache(path=path)
+    assert len(cache) == 0
+    assert cache.best(data, 60, START, k=2) == expected
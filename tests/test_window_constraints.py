@@ -339,6 +339,7 @@ class TestMainIntegration:
             60,  # duration
             None,  # jobinfo
             None,  # PUE
+            None,  # power_curve
         )
 
         # Mock forecast data
@@ -370,6 +371,7 @@ class TestMainIntegration:
             60,  # duration
             None,  # jobinfo
             None,  # PUE
+            None,  # power_curve
         )
 
         # Mock forecast data
@@ -415,6 +417,7 @@ class TestMainIntegration:
             60,  # duration
             None,  # jobinfo
             None,  # PUE
+            None,  # power_curve
         )
 
         # Test with invalid window size
@@ -436,6 +439,7 @@ class TestMainIntegration:
             480,  # 8 hour duration
             None,  # jobinfo
             None,  # PUE
+            None,  # power_curve
         )
 
         # Test with window smaller than duration
@@ -457,6 +461,7 @@ class TestMainIntegration:
             60,
             None,
             None,
+            None,
         )
 
         # Test with start after end
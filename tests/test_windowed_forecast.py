@@ -10,7 +10,11 @@ from numpy.testing import assert_allclose
 from cats.forecast import (
     CarbonIntensityAverageEstimate,
     CarbonIntensityPointEstimate,
+    CarbonIntensitySeries,
     WindowedForecast,
+    as_series,
+    best_windows_by_duration,
+    epoch_seconds,
 )
 
 d = datetime(year=2023, month=1, day=1)
@@ -290,3 +294,208 @@ def test_across_all_durations_at_half_hour(duration, sample_data):
     start = datetime(2023, 5, 4, 12, 30, tzinfo=utc)
     ws = WindowedForecast(sample_data, duration, start)
     assert min(ws)
+
+
+@pytest.mark.parametrize("duration", [7, 30, 45, 194, 600, 1439])
+def test_matches_windowwise_integration(duration, sample_data):
+    "Averages computed for all windows at once match window by window integration"
+    job_start = datetime.fromisoformat("2023-05-04T12:41+00:00")
+    wf = WindowedForecast(sample_data, duration, start=job_start)
+
+    expected = []
+    for w in wf:
+        points = [CarbonIntensityPointEstimate(w.start_value, w.start)]
+        points += [p for p in sample_data if w.start < p.datetime < w.end]
+        points += [CarbonIntensityPointEstimate(w.end_value, w.end)]
+        integral = sum(
+            0.5 * (a.value + b.value) * (b.datetime - a.datetime).total_seconds()
+            for a, b in zip(points[:-1], points[1:])
+        )
+        expected.append(integral / (duration * 60))
+
+    assert_allclose(actual=[w.value for w in wf], desired=expected, rtol=1e-12)
+
+
+def test_epoch_seconds():
+    utc = ZoneInfo("UTC")
+    assert epoch_seconds(datetime(1970, 1, 2, tzinfo=utc)) == 86400
+    assert epoch_seconds(datetime(1970, 1, 2)) == 86400
+    assert epoch_seconds(
+        datetime.fromisoformat("2023-05-04T13:30+01:00")
+    ) == epoch_seconds(datetime(2023, 5, 4, 12, 30, tzinfo=utc))
+
+
+def test_end_constraint_between_data_points(sample_data):
+    "Windows starting before an end constraint off the data grid are kept"
+    job_start = datetime.fromisoformat("2023-05-04T12:30+00:00")
+    end_constraint = datetime.fromisoformat("2023-05-04T14:01+00:00")
+    wf = WindowedForecast(
+        sample_data, 30, start=job_start, end_constraint=end_constraint
+    )
+    # Windows starting at 12:30, 13:00, 13:30 and 14:00
+    assert len(wf) == 4
+    assert wf[3].start == datetime.fromisoformat("2023-05-04T14:00+00:00")
+
+
+def test_series_point_access(sample_data):
+    series = as_series(sample_data)
+    assert isinstance(series, CarbonIntensitySeries)
+    assert len(series) == len(sample_data)
+    assert list(series) == sample_data
+    assert series[-1] == sample_data[-1]
+    assert series[10:20] == as_series(sample_data[10:20])
+    assert series.datetimes() == [p.datetime for p in sample_data]
+    assert series.times.dtype == "int64" and series.values.dtype == "float64"
+
+
+def test_series_same_as_list(sample_data):
+    job_start = datetime.fromisoformat("2023-05-04T13:48+01:00")
+    from_list = WindowedForecast(sample_data, 194, start=job_start)
+    from_series = WindowedForecast(as_series(sample_data), 194, start=job_start)
+    assert list(from_list) == list(from_series)
+
+
+@pytest.mark.parametrize("k", [1, 3, 10, 100])
+def test_best_windows(k, sample_data):
+    wf = WindowedForecast(sample_data, 90, start=sample_data[0].datetime)
+    expected = sorted(wf)[:k]
+    assert wf.best(k) == expected
+    assert list(wf.ranked())[:k] == expected
+    assert wf.best(k)[0] == min(wf)
+
+
+def test_best_windows_min_gap(sample_data):
+    wf = WindowedForecast(sample_data, 90, start=sample_data[0].datetime)
+    min_gap = timedelta(hours=3)
+    best = wf.best(5, min_gap=min_gap)
+    assert len(best) == 5
+    assert best[0] == min(wf)
+    assert [w.value for w in best] == sorted(w.value for w in best)
+    starts = sorted(w.start for w in best)
+    assert all(b - a >= min_gap for a, b in zip(starts[:-1], starts[1:]))
+    # Every skipped window better than the last one starts too close
+    # to a selected window
+    for w in wf:
+        if w.value < best[-1].value and w not in best:
+            assert any(abs(w.start - b.start) < min_gap for b in best)
+
+
+def test_best_windows_by_duration(sample_data):
+    job_start = datetime.fromisoformat("2023-05-04T12:41+00:00")
+    durations = [1, 30, 45, 194, 600, 2820, 2900]
+    best = best_windows_by_duration(sample_data, durations, start=job_start)
+    assert list(best) == durations
+    for duration in durations[:-1]:
+        assert best[duration] == min(
+            WindowedForecast(sample_data, duration, start=job_start)
+        )
+    # Forecast too short
+    assert best[2900] is None
+
+
+def test_power_curve(sample_data):
+    job_start = datetime.fromisoformat("2023-05-04T12:41+00:00")
+    duration = 194
+    power_curve = [(0, 0.2), (20, 1.0), (150, 0.5)]
+    wf = WindowedForecast(sample_data, duration, job_start, power_curve=power_curve)
+    plain = WindowedForecast(sample_data, duration, job_start)
+
+    # Weighted average of the averages over each step of the power curve
+    for window, unweighted in zip(wf, plain):
+        expected = 0
+        for (a, fraction), b in zip(power_curve, [20, 150, duration]):
+            step = WindowedForecast(
+                sample_data, b - a, window.start + timedelta(minutes=a)
+            )[0]
+            expected += fraction * step.value * (b - a)
+        expected /= 0.2 * 20 + 1.0 * 130 + 0.5 * 44
+        assert window.value == pytest.approx(expected, rel=1e-12)
+        assert window.start == unweighted.start
+        assert window.start_value == unweighted.start_value
+
+    # Constant power curve gives the same averages
+    constant = WindowedForecast(sample_data, duration, job_start, power_curve=[(0, 2)])
+    assert_allclose([w.value for w in constant], [w.value for w in plain], rtol=1e-12)
+
+
+def test_irregular_timesteps():
+    "Data points need not be evenly spaced"
+    utc = ZoneInfo("UTC")
+    # Mixed 5 and 30 minutes resolution, with a 2 hour gap
+    minutes = [0, 5, 10, 15, 20, 50, 80, 110, 230, 235, 240, 270, 300, 330, 360]
+    values = [30, 32, 35, 31, 28, 20, 25, 40, 12, 10, 11, 15, 22, 30, 28]
+    d = datetime(2023, 1, 1, tzinfo=utc)
+    data = [
+        CarbonIntensityPointEstimate(value, d + timedelta(minutes=m))
+        for m, value in zip(minutes, values)
+    ]
+    duration = 45
+    job_start = d + timedelta(minutes=2)
+    wf = WindowedForecast(data, duration, start=job_start)
+
+    # Windows start at the job start shifted by the time between first
+    # and each data point, and must end before the last data point
+    shifts = [m for m in minutes if 2 + m + duration <= 360]
+    assert [w.start for w in wf] == [job_start + timedelta(minutes=m) for m in shifts]
+
+    for w in wf:
+        points = [CarbonIntensityPointEstimate(w.start_value, w.start)]
+        points += [p for p in data if w.start < p.datetime < w.end]
+        points += [CarbonIntensityPointEstimate(w.end_value, w.end)]
+        integral = sum(
+            0.5 * (a.value + b.value) * (b.datetime - a.datetime).total_seconds()
+            for a, b in zip(points[:-1], points[1:])
+        )
+        assert w.value == pytest.approx(integral / (duration * 60), rel=1e-12)
+        for p in (w.start, w.end):
+            assert WindowedForecast.interp(
+                max((q for q in data if q.datetime <= p), key=lambda q: q.datetime),
+                min((q for q in data if q.datetime > p), key=lambda q: q.datetime),
+                when=p,
+            ).value == pytest.approx(w.start_value if p == w.start else w.end_value)
+
+    # Window within the gap, between two data points
+    gap_window = next(w for w in wf if w.start == job_start + timedelta(minutes=110))
+    assert gap_window.start_value == pytest.approx(40 - 28 * 2 / 120)
+    assert gap_window.value == pytest.approx(
+        0.5 * (gap_window.start_value + gap_window.end_value)
+    )
+
+
+@pytest.mark.parametrize("duration", [7, 45, 194])
+def test_optimal_start(duration, sample_data):
+    job_start = datetime.fromisoformat("2023-05-04T12:41+00:00")
+    wf = WindowedForecast(sample_data, duration, start=job_start)
+    optimal = wf.optimal()
+    assert optimal.value <= min(wf).value
+    assert optimal.start.second == 0 and optimal.start >= job_start
+    assert optimal.end - optimal.start == timedelta(minutes=duration)
+
+    # Same as the best of all windows starting on each minute
+    minutes = int((sample_data[-1].datetime - job_start).total_seconds() // 60)
+    best_by_minute = min(
+        WindowedForecast(sample_data, duration, job_start + timedelta(minutes=m))[0]
+        for m in range(minutes - duration + 1)
+    )
+    assert optimal.start == best_by_minute.start
+    assert optimal.value == pytest.approx(best_by_minute.value, rel=1e-12)
+    assert optimal.start_value == pytest.approx(best_by_minute.start_value)
+    assert optimal.end_value == pytest.approx(best_by_minute.end_value)
+
+    # Finer resolution can only improve
+    assert wf.optimal(timedelta(seconds=1)).value <= optimal.value
+
+
+def test_optimal_start_constraints(sample_data):
+    job_start = datetime.fromisoformat("2023-05-04T12:41+00:00")
+    end_constraint = datetime.fromisoformat("2023-05-04T18:00+00:00")
+    wf = WindowedForecast(
+        sample_data,
+        45,
+        job_start,
+        max_window_minutes=120,
+        end_constraint=end_constraint,
+    )
+    assert wf.optimal().start <= job_start + timedelta(minutes=120)
+    wf = WindowedForecast(sample_data, 45, job_start, end_constraint=end_constraint)
+    assert wf.optimal().start < end_constraint